@@ -2,15 +2,25 @@ import socket
 import qrcode
 import uvicorn
 import os
-from fastapi import FastAPI, HTTPException, Depends, Header
+import re
+from collections import Counter
+from contextlib import asynccontextmanager
+from datetime import datetime
+from functools import lru_cache
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Response
 from fastapi.responses import FileResponse
 from starlette import status
 
 from core import CRM 
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, ValidationError, TypeAdapter, create_model
 from typing import List, Optional
 from models.contact import Contato, Lead
 from models.campanha import EmailCampanha
+from models.base import SALES_STAGES, LEAD_SOURCES
+from core.indexes import encode_cursor, decode_cursor
+from core.dedup import DuplicatePolicy, DuplicateEmailError
+from core.search import hit_label
+from core.crm import SEARCH_ENTITIES, FUZZY_INDEXES
 
 #----------------- Modelo para Contato -------------------
 class ContatoSchema(BaseModel): #criar contato
@@ -27,6 +37,10 @@ class ContatoResponse(ContatoSchema): #enviar a estrutura de dados de volta
     class Config:
         from_attributes = True
         
+class ContatoPage(BaseModel): #uma página da listagem; next_cursor vai no ?cursor= da próxima chamada
+    items: List[ContatoResponse]
+    next_cursor: Optional[str] = None
+
 #----------------- Modelo para Lead -------------------
 class LeadSchema(BaseModel):
     name: str
@@ -41,6 +55,10 @@ class LeadResponse(LeadSchema):
     class Config:
         from_attributes = True
         
+class LeadPage(BaseModel):
+    items: List[LeadResponse]
+    next_cursor: Optional[str] = None
+
 #----------------- Modelo para Campanha -------------------       
 class CampanhaSchema(BaseModel):
     title: str
@@ -54,7 +72,20 @@ class CampanhaResponse(CampanhaSchema):
 
     class Config:
         from_attributes = True
+
+class AgendamentoSchema(BaseModel): #enviar_em: ISO 8601 (ex: 2025-06-01T09:00:00); sem fuso = horário local
+    enviar_em: datetime
+    repetir_min: Optional[int] = None #envio recorrente a cada N minutos (novos contatos do estágio recebem)
         
+#----------------- Modelos para operações em massa -------------------
+class BulkItem(BaseModel):
+    op: str #"create", "update" ou "delete"
+    id: Optional[int] = None #obrigatório em update e delete
+    data: Optional[dict] = None #mesmos campos do POST/PUT individual (validados item a item)
+
+class BulkRequest(BaseModel):
+    items: List[BulkItem]
+
 #----------------- Modelos para Atividade -------------------
 class AtividadeSchema(BaseModel):
     type: str
@@ -77,6 +108,26 @@ class TaskResponse(TaskSchema):
     class Config:
         from_attributes = True
         
+#----------------- Modelos para Busca -------------------
+class SearchHit(BaseModel):
+    tipo: str #"contato", "lead" ou "campanha"
+    id: int
+    score: float
+    titulo: str
+    detalhe: str
+
+class SearchResults(BaseModel):
+    query: str
+    items: List[SearchHit]
+
+class AutocompleteItem(BaseModel):
+    tipo: str #"contato" ou "lead"
+    id: int
+    score: float #semelhança de 0 a 1
+    name: str
+    email: str
+    empresa: Optional[str] = None
+
 #-------------------- Segurança minima ------------------        
 API_KEY_SECRETA = "secreto123"
 
@@ -88,13 +139,152 @@ async def verificar_api_key(api_key_header: str = Header(..., alias="x-api-key")
         )
 
 #-------------------- Inicializar a API ------------------------        
+crm = CRM() 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    crm.close() #flush das mudanças pendentes (write-behind) quando o servidor desliga
+
 app = FastAPI(
     title="CRM API",
     description="API para gerenciar contatos, leads e outras funcionalidades do CRM.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
-crm = CRM() 
+#---------------- Paginação -------------------
+LIMITE_PADRAO = 50
+LIMITE_MAXIMO = 500
+
+def _pagina(colecao, sort, ordenacoes, cursor, limit, equals=None, ranges=None):
+    #sort: "campo" ou "-campo" (decrescente); os filtros e a ordenação usam os índices da coleção
+    descending = sort.startswith("-")
+    campo = sort.lstrip("-")
+    if campo not in ordenacoes:
+        raise HTTPException(status_code=400, detail=f"Ordenação inválida :( Use: {ordenacoes} (com '-' na frente para decrescente)")
+    try:
+        after = decode_cursor(cursor, sort, colecao.key_type(campo)) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    itens, proximo = colecao.query(campo, equals=equals, ranges=ranges, after=after,
+                                   limit=limit, descending=descending)
+    return {"items": itens, "next_cursor": encode_cursor(sort, proximo) if proximo else None}
+
+def _registrar(entity, obj, on_duplicate, response): #criação com checagem de email duplicado
+    try:
+        registro, criado = crm.register(entity, obj, policy=on_duplicate)
+    except DuplicateEmailError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if not criado:
+        response.status_code = 200 #nada foi criado: devolve o registro que já existia (combinado)
+    return registro
+
+def _checar_email_livre(dono, registro): #no PUT, o email novo não pode ser de outro registro
+    if dono is not None and dono is not registro:
+        raise HTTPException(status_code=409, detail=f"Email já usado pelo registro com ID {dono.id}")
+
+def _erro_schema(e: ValidationError):
+    return "; ".join(f"{'.'.join(str(parte) for parte in erro['loc'])}: {erro['msg']}" for erro in e.errors())
+
+#Email no lote: o EmailStr passa o domínio pelo IDNA a cada email (~0,4ms, a maior parte da importação).
+#Emails comuns (ASCII, sem aspas nem "Nome <email>") são conferidos pela expressão abaixo e o domínio
+#pelo validador completo uma vez só por domínio; o resto vai pelo schema normal (mesmas mensagens de erro)
+_EMAIL_SIMPLES = re.compile(r"[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+(?:\.[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+)*@([A-Za-z0-9.-]+)")
+_EMAIL = TypeAdapter(EmailStr)
+
+@lru_cache(maxsize=4096)
+def _dominio_valido(dominio): #domínio normalizado (minúsculo) ou None se for inválido
+    try:
+        return _EMAIL.validate_python(f"a@{dominio}").rpartition("@")[2]
+    except ValidationError:
+        return None
+
+def _email_rapido(email): #email normalizado como o EmailStr devolveria, ou None (vai pelo caminho normal)
+    if not isinstance(email, str) or len(email) > 254:
+        return None
+    m = _EMAIL_SIMPLES.fullmatch(email)
+    if m is None or m.start(1) - 1 > 64: #parte local tem no máximo 64 caracteres
+        return None
+    dominio = _dominio_valido(m.group(1))
+    return None if dominio is None else email[:m.start(1)] + dominio
+
+_SEM_EMAILSTR = {} #schema -> mesmo schema com email: str (o email já foi conferido)
+
+def _validar_item(schema, dados):
+    email = _email_rapido(dados.get("email")) if "email" in schema.model_fields else None
+    if email is None:
+        return schema.model_validate(dados)
+    if schema not in _SEM_EMAILSTR:
+        _SEM_EMAILSTR[schema] = create_model(f"{schema.__name__}Lote", __base__=schema, email=(str, ...))
+    return _SEM_EMAILSTR[schema].model_validate({**dados, "email": email})
+
+def _bulk(entity, pedido, schema, campos, on_duplicate=None):
+    #valida todos os itens numa passada (schema aqui, ids e emails no CRM); com algum erro nada é aplicado
+    #e a resposta (422) lista os erros por item. Sem erros tudo é aplicado e gravado de uma vez só
+    operacoes, erros = [], {}
+    for i, item in enumerate(pedido.items):
+        try:
+            if item.op not in ("create", "update", "delete"):
+                raise ValueError(f"op '{item.op}' inválida: use create, update ou delete")
+            if item.op != "create" and item.id is None:
+                raise ValueError("id é obrigatório em update e delete")
+            if item.op == "delete":
+                operacoes.append(("delete", item.id))
+                continue
+            dados = campos(_validar_item(schema, item.data or {}))
+            #roda as regras do modelo (ex: nome em branco) antes de aplicar; no update o objeto é
+            #descartado, então recebe o id do item em vez de gastar um do gerar_id
+            novo = _CLASSES_BULK[entity](**dados, id=item.id if item.op == "update" else None)
+            if item.op == "create":
+                operacoes.append(("create", novo))
+            else:
+                operacoes.append(("update", item.id, dados))
+        except ValidationError as e:
+            erros[i] = _erro_schema(e)
+            operacoes.append(None)
+        except ValueError as e:
+            erros[i] = str(e)
+            operacoes.append(None)
+
+    resultados, erros_crm = crm.bulk(entity, operacoes, policy=on_duplicate)
+    erros.update(erros_crm)
+    if erros:
+        raise HTTPException(status_code=422, detail={
+            "message": f"{len(erros)} item(ns) com erro: nada foi aplicado",
+            "total": len(operacoes),
+            "erros": [{"index": i, "op": pedido.items[i].op, "erro": erros[i]} for i in sorted(erros)]
+        })
+    status_por_item = Counter(r["status"] for r in resultados)
+    return {
+        "total": len(resultados),
+        "criados": status_por_item["criado"],
+        "combinados": status_por_item["combinado"], #create com email existente (on_duplicate merge/upsert)
+        "atualizados": status_por_item["atualizado"],
+        "removidos": status_por_item["removido"],
+        "resultados": [{"index": i, **r} for i, r in enumerate(resultados)]
+    }
+
+def _contato_saida(contato): #o to_dict grava timestamps; na resposta as datas vão formatadas
+    return {
+        **contato.to_dict(),
+        "created_at": contato.created_at,
+        "activities": [{**a.to_dict(), "date": a.date} for a in contato.activities],
+        "documents": [{**d.to_dict(), "created_at": d.created_at} for d in contato.documents]
+    }
+
+def _campos_contato(dados):
+    return {"name": dados.name, "email": dados.email, "telefone": dados.telefone,
+            "empresa": dados.empresa or "", "notas": dados.notas or ""}
+
+def _campos_lead(dados):
+    return {"name": dados.name, "email": dados.email, "source": dados.source}
+
+def _campos_campanha(dados):
+    return {"title": dados.title, "description": dados.description, "target_stage": dados.target_stage}
+
+_CLASSES_BULK = {"contatos": Contato, "leads": Lead, "campanhas": EmailCampanha}
 
 #---------------- Rota principal -------------------
 @app.get("/", response_class=FileResponse)
@@ -102,16 +292,23 @@ def pegar_html_interface(): #rota para o front-end em HTML
     return "C:\\Users\\laris\\Desktop\\Faculdade\\4° periodo\Projeto de software\\crm-tool-PS-OO-main\\crm-tool-PS-OO-main\\index.html"
 
 #-------------------------- Rotas para Contato ------------------------
-@app.get("/contatos", response_model=List[ContatoResponse], dependencies=[Depends(verificar_api_key)])
-def listar_contatos(): #Retorna uma lista com todos os contatos cadastrados.
+@app.get("/contatos", response_model=ContatoPage, dependencies=[Depends(verificar_api_key)])
+def listar_contatos(limit: int = Query(LIMITE_PADRAO, ge=1, le=LIMITE_MAXIMO), cursor: Optional[str] = None,
+                    sort: str = "id", stage: Optional[str] = None, empresa: Optional[str] = None):
+    #Retorna uma página de contatos (filtros opcionais por estágio e empresa).
     #o FastAPI converte a lista de objetos Python para JSON automaticamente.
-    return crm.contatos
+    equals = {}
+    if stage is not None:
+        equals["stage"] = SALES_STAGES.find(stage) #estágio desconhecido: página vazia
+    if empresa is not None:
+        equals["empresa"] = empresa.strip().casefold()
+    return _pagina(crm.contatos, sort, ["id", "name", "created_at"], cursor, limit, equals=equals)
 
 @app.get("/contatos/{contato_id}", response_model=ContatoResponse, dependencies=[Depends(verificar_api_key)])
 def buscar_contato_por_id(contato_id: int): #busca UM contato por id, caso não seja encontrado, retorna erro 404
-    for contato in crm.contatos:
-        if contato.id == contato_id:
-            return contato #se econtrar retorna o codigo 200 (padrão)
+    contato = crm.get_contato(contato_id)
+    if contato:
+        return contato #se econtrar retorna o codigo 200 (padrão)
 
     raise HTTPException(
         status_code=404,
@@ -120,7 +317,8 @@ def buscar_contato_por_id(contato_id: int): #busca UM contato por id, caso não
 
 #----------------- Pegar dados de Contato -----------------------
 @app.post("/contatos", response_model=ContatoResponse, status_code=201, dependencies=[Depends(verificar_api_key)]) #usa 2xx pq é codigo de sucesso, assim como 4xx é de erro do cliente, por exemplo.
-def criar_contato(contato_data: ContatoSchema): #cria um novo contato no sistema
+def criar_contato(contato_data: ContatoSchema, response: Response, on_duplicate: Optional[DuplicatePolicy] = None):
+    #cria um novo contato no sistema; email repetido segue o on_duplicate (padrão: CRM_DUPLICATE_POLICY)
     novo_contato = Contato(
         name=contato_data.name,
         email=contato_data.email,
@@ -129,39 +327,30 @@ def criar_contato(contato_data: ContatoSchema): #cria um novo contato no sistema
         notas=contato_data.notas or ""
     )
 
-    crm.contatos.append(novo_contato)
-    crm.save_data()
-    
-    return novo_contato
+    return _registrar("contatos", novo_contato, on_duplicate, response)
+
+@app.post("/contatos/bulk", dependencies=[Depends(verificar_api_key)])
+def contatos_em_massa(pedido: BulkRequest, on_duplicate: Optional[DuplicatePolicy] = None):
+    #cria, atualiza e remove muitos contatos numa chamada (tudo ou nada)
+    return _bulk("contatos", pedido, ContatoSchema, _campos_contato, on_duplicate)
 
 #-------------------- Interagir com Contato --------------------------
 @app.delete("/contatos/{contato_id}", status_code=204, dependencies=[Depends(verificar_api_key)])
 def deletar_contato(contato_id: int): #deleta contato por ID
-    contato_encontrado = None
-    for contato in crm.contatos:
-        if contato.id == contato_id:
-            contato_encontrado = contato
-            break
+    #remove pelo índice de id e já salva a alteração
+    contato_removido = crm.remove_contato(contato_id)
 
-    if not contato_encontrado: #Se o contato não foi encontrado, da erro 404
+    if not contato_removido: #Se o contato não foi encontrado, da erro 404
         raise HTTPException(
             status_code=404,
             detail=f"Contato com ID {contato_id} não encontrado"
         )
 
-    #Se foi encontrado, remove-o da lista e salva a alteração
-    crm.contatos.remove(contato_encontrado)
-    crm.save_data()
-
     return
 
 @app.put("/contatos/{contato_id}", response_model=ContatoResponse, dependencies=[Depends(verificar_api_key)])
 def atualizar_contato(contato_id: int, contato_data: ContatoSchema): #pode atualizar informações
-    contato_encontrado = None
-    for contato in crm.contatos:
-        if contato.id == contato_id:
-            contato_encontrado = contato
-            break
+    contato_encontrado = crm.get_contato(contato_id)
     
     if not contato_encontrado: #Se não encontrar o contato, retorna erro 404
         raise HTTPException(
@@ -169,6 +358,8 @@ def atualizar_contato(contato_id: int, contato_data: ContatoSchema): #pode atual
             detail=f"Contato com ID {contato_id} não encontrado"
         )
 
+    _checar_email_livre(crm.find_contato_by_email(contato_data.email), contato_encontrado)
+
     #atualiza todos os campos do objeto que encontramos, com os dados que vieram no corpo da requisição
     contato_encontrado.name = contato_data.name
     contato_encontrado.email = contato_data.email
@@ -176,22 +367,30 @@ def atualizar_contato(contato_id: int, contato_data: ContatoSchema): #pode atual
     contato_encontrado.empresa = contato_data.empresa
     contato_encontrado.notas = contato_data.notas
     
-    crm.save_data() #salva os dados atualizados no arquivo JSON
+    crm.save_change("contatos", contato_encontrado) #salva só o contato atualizado
     
     return contato_encontrado #retorna o contato com as novas informações
 
 #----------------------- Rotas para Lead ------------------------------
-@app.get("/leads", response_model=List[LeadResponse], dependencies=[Depends(verificar_api_key)])
-def listar_leads():
-    #mostra apenas leads que ainda não foram convertidos em contatos
-    leads_ativos = [lead for lead in crm.leads if not lead.converted]
-    return leads_ativos
+@app.get("/leads", response_model=LeadPage, dependencies=[Depends(verificar_api_key)])
+def listar_leads(limit: int = Query(LIMITE_PADRAO, ge=1, le=LIMITE_MAXIMO), cursor: Optional[str] = None,
+                 sort: str = "id", source: Optional[str] = None, converted: bool = False,
+                 score_min: Optional[int] = None, score_max: Optional[int] = None):
+    #por padrão mostra apenas leads que ainda não foram convertidos em contatos
+    equals = {"converted": converted}
+    if source is not None:
+        equals["source"] = LEAD_SOURCES.find(source)
+    ranges = {}
+    if score_min is not None or score_max is not None:
+        ranges["score"] = (score_min, score_max)
+    return _pagina(crm.leads, sort, ["id", "name", "created_at", "score"], cursor, limit,
+                   equals=equals, ranges=ranges)
 
 @app.get("/leads/{lead_id}", response_model=LeadResponse, dependencies=[Depends(verificar_api_key)])
 def buscar_lead_por_id(lead_id: int): #Busca e retorna um único lead pelo seu ID.
-    for lead in crm.leads:
-        if lead.id == lead_id:
-            return lead
+    lead = crm.get_lead(lead_id)
+    if lead:
+        return lead
     
     raise HTTPException(
         status_code=404,
@@ -200,24 +399,23 @@ def buscar_lead_por_id(lead_id: int): #Busca e retorna um único lead pelo seu I
 
 #---------------------- Pegar dados de Lead -------------------------
 @app.post("/leads", response_model=LeadResponse, status_code=201, dependencies=[Depends(verificar_api_key)])
-def criar_lead(lead_data: LeadSchema): #Cria um novo lead no sistema.
+def criar_lead(lead_data: LeadSchema, response: Response, on_duplicate: Optional[DuplicatePolicy] = None):
+    #Cria um novo lead no sistema.
     novo_lead = Lead(
         name=lead_data.name,
         email=lead_data.email,
         source=lead_data.source
     )
-    crm.leads.append(novo_lead)
-    crm.save_data()
-    return novo_lead
+    return _registrar("leads", novo_lead, on_duplicate, response)
+
+@app.post("/leads/bulk", dependencies=[Depends(verificar_api_key)])
+def leads_em_massa(pedido: BulkRequest, on_duplicate: Optional[DuplicatePolicy] = None):
+    return _bulk("leads", pedido, LeadSchema, _campos_lead, on_duplicate)
 
 #-------------------- Interagir com Lead --------------------------
 @app.put("/leads/{lead_id}", response_model=LeadResponse, dependencies=[Depends(verificar_api_key)])
 def atualizar_lead(lead_id: int, lead_data: LeadSchema):
-    lead_encontrado = None
-    for lead in crm.leads:
-        if lead.id == lead_id:
-            lead_encontrado = lead
-            break
+    lead_encontrado = crm.get_lead(lead_id)
 
     if not lead_encontrado:
         raise HTTPException(
@@ -225,42 +423,38 @@ def atualizar_lead(lead_id: int, lead_data: LeadSchema):
             detail=f"Lead com ID {lead_id} não encontrado"
         )
 
+    _checar_email_livre(crm.find_lead_by_email(lead_data.email), lead_encontrado)
+
     #Atualiza os campos do objeto encontrado
     lead_encontrado.name = lead_data.name
     lead_encontrado.email = lead_data.email
     lead_encontrado.source = lead_data.source
     
-    crm.save_data()
+    crm.save_change("leads", lead_encontrado)
     return lead_encontrado
 
 @app.delete("/leads/{lead_id}", status_code=204, dependencies=[Depends(verificar_api_key)])
 def deletar_lead(lead_id: int): #Deleta um lead do sistema pelo seu ID.
-    lead_encontrado = None
-    for lead in crm.leads:
-        if lead.id == lead_id:
-            lead_encontrado = lead
-            break
+    lead_removido = crm.remove_lead(lead_id)
 
-    if not lead_encontrado:
+    if not lead_removido:
         raise HTTPException(
             status_code=404,
             detail=f"Lead com ID {lead_id} não encontrado"
         )
 
-    crm.leads.remove(lead_encontrado)
-    crm.save_data()
     return
 
 #----------------------- Rotas para Campanha ------------------------------
 @app.get("/campanhas", response_model=List[CampanhaResponse], dependencies=[Depends(verificar_api_key)])
 def listar_campanhas(): #Retorna uma lista de todas as campanhas
-    return crm.campanhas
+    return list(crm.campanhas)
 
 @app.get("/campanhas/{campanha_id}", response_model=CampanhaResponse, dependencies=[Depends(verificar_api_key)])
 def buscar_campanha_por_id(campanha_id: int): #Busca uma campanha específica pelo seu ID
-    for campanha in crm.campanhas:
-        if campanha.id == campanha_id:
-            return campanha
+    campanha = crm.get_campanha(campanha_id)
+    if campanha:
+        return campanha
     raise HTTPException(status_code=404, detail="Campanha não encontrada")
 
 #---------------------- Pegar dados de Campanha -------------------------
@@ -271,50 +465,80 @@ def criar_campanha(campanha_data: CampanhaSchema): #Cria uma nova campanha de em
         description=campanha_data.description,
         target_stage=campanha_data.target_stage
     )
-    crm.campanhas.append(nova_campanha)
-    crm.save_data()
+    crm.add_campanha(nova_campanha)
     return nova_campanha
 
+@app.post("/campanhas/bulk", dependencies=[Depends(verificar_api_key)])
+def campanhas_em_massa(pedido: BulkRequest):
+    return _bulk("campanhas", pedido, CampanhaSchema, _campos_campanha)
+
 #-------------------- Interagir com Campanha --------------------------
 @app.put("/campanhas/{campanha_id}", response_model=CampanhaResponse, dependencies=[Depends(verificar_api_key)])
 def atualizar_campanha(campanha_id: int, campanha_data: CampanhaSchema): #Atualiza as informações de uma campanha
-    campanha_encontrada = None
-    for campanha in crm.campanhas:
-        if campanha.id == campanha_id:
-            campanha_encontrada = campanha
-            break
+    campanha_encontrada = crm.get_campanha(campanha_id)
     if not campanha_encontrada:
         raise HTTPException(status_code=404, detail="Campanha não encontrada")
     
     campanha_encontrada.title = campanha_data.title
     campanha_encontrada.description = campanha_data.description
     campanha_encontrada.target_stage = campanha_data.target_stage
-    crm.save_data()
+    crm.save_change("campanhas", campanha_encontrada)
     return campanha_encontrada
 
 @app.delete("/campanhas/{campanha_id}", status_code=204, dependencies=[Depends(verificar_api_key)])
 def deletar_campanha(campanha_id: int): #Deleta uma campanha do sistema
-    campanha_encontrada = None
-    for campanha in crm.campanhas:
-        if campanha.id == campanha_id:
-            campanha_encontrada = campanha
-            break
-    if not campanha_encontrada:
+    campanha_removida = crm.remove_campanha(campanha_id)
+    if not campanha_removida:
         raise HTTPException(status_code=404, detail="Campanha não encontrada")
     
-    crm.campanhas.remove(campanha_encontrada)
-    crm.save_data()
     return
-    
+
+@app.post("/campanhas/{campanha_id}/enviar", dependencies=[Depends(verificar_api_key)])
+def enviar_campanha(campanha_id: int): #envia para quem ainda não recebeu; relatório com vazão e falhas por lote
+    campanha = crm.get_campanha(campanha_id)
+    if not campanha:
+        raise HTTPException(status_code=404, detail="Campanha não encontrada")
+    return crm.send_campaign(campanha)
+
+@app.get("/campanhas/{campanha_id}/audience", dependencies=[Depends(verificar_api_key)])
+def estimar_publico(campanha_id: int, amostra: int = Query(5, ge=0, le=100)): #prévia do envio, sem enviar nada
+    campanha = crm.get_campanha(campanha_id)
+    if not campanha:
+        raise HTTPException(status_code=404, detail="Campanha não encontrada")
+    return crm.campaign_audience_estimate(campanha, amostra)
+
+@app.get("/campanhas/{campanha_id}/schedule", dependencies=[Depends(verificar_api_key)])
+def status_agendamento(campanha_id: int): #status, próximo envio e resultado do último envio agendado
+    campanha = crm.get_campanha(campanha_id)
+    if not campanha:
+        raise HTTPException(status_code=404, detail="Campanha não encontrada")
+    return crm.campaign_schedule(campanha)
+
+@app.put("/campanhas/{campanha_id}/schedule", dependencies=[Depends(verificar_api_key)])
+def agendar_campanha(campanha_id: int, agendamento: AgendamentoSchema): #agenda (ou reagenda) o envio
+    campanha = crm.get_campanha(campanha_id)
+    if not campanha:
+        raise HTTPException(status_code=404, detail="Campanha não encontrada")
+    if agendamento.repetir_min is not None and agendamento.repetir_min < 1:
+        raise HTTPException(status_code=400, detail="repetir_min deve ser pelo menos 1 minuto")
+    crm.schedule_campaign(campanha, int(agendamento.enviar_em.timestamp()), agendamento.repetir_min)
+    return crm.campaign_schedule(campanha)
+
+@app.delete("/campanhas/{campanha_id}/schedule", dependencies=[Depends(verificar_api_key)])
+def cancelar_agendamento(campanha_id: int): #cancela os próximos envios (um envio já em andamento termina)
+    campanha = crm.get_campanha(campanha_id)
+    if not campanha:
+        raise HTTPException(status_code=404, detail="Campanha não encontrada")
+    if campanha.agendada_ts is None:
+        raise HTTPException(status_code=404, detail="Campanha não está agendada")
+    crm.cancel_campaign_schedule(campanha)
+    return crm.campaign_schedule(campanha)
+
 #----------------- Conversão de Lead para Contato -------------------
 @app.post("/leads/{lead_id}/converter", dependencies=[Depends(verificar_api_key)])
 def converter_lead_para_contato(lead_id: int, contato_data: ContatoSchema):
     #Buscar o lead
-    lead_encontrado = None
-    for lead in crm.leads:
-        if lead.id == lead_id:
-            lead_encontrado = lead
-            break
+    lead_encontrado = crm.get_lead(lead_id)
     
     if not lead_encontrado:
         raise HTTPException(status_code=404, detail="Lead não encontrado")
@@ -322,52 +546,41 @@ def converter_lead_para_contato(lead_id: int, contato_data: ContatoSchema):
     if lead_encontrado.converted:
         raise HTTPException(status_code=400, detail="Lead já foi convertido")
     
-    #Criar novo contato baseado no lead
-    novo_contato = Contato(
-        name=lead_encontrado.name,
-        email=lead_encontrado.email,
-        telefone=contato_data.telefone,
-        empresa=contato_data.empresa or "",
-        notas=f"Convertido do lead ID {lead_id}. Fonte: {lead_encontrado.source}"
-    )
-    
-    lead_encontrado.converted = True
-    crm.contatos.append(novo_contato)
-    crm.save_data()
+    #Criar contato baseado no lead (se o email já for de um contato, o lead é ligado a ele)
+    try:
+        contato, criado = crm.convert_lead(
+            lead_encontrado,
+            telefone=contato_data.telefone,
+            empresa=contato_data.empresa or "",
+            notas=f"Convertido do lead ID {lead_id}. Fonte: {lead_encontrado.source}"
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     return {
-        "message": "Lead convertido com sucesso",
-        "contato": novo_contato.to_dict(),
-        "lead_id": lead_id
+        "message": "Lead convertido com sucesso" if criado else "Lead convertido: email já pertencia a um contato existente",
+        "contato": _contato_saida(contato),
+        "lead_id": lead_id,
+        "contato_existente": not criado
     }
 
 #----------------- Atualizar Estágio de Vendas -------------------
 @app.put("/contatos/{contato_id}/stage", dependencies=[Depends(verificar_api_key)])
 def atualizar_estagio_vendas(contato_id: int, novo_estagio: dict):
-    for contato in crm.contatos:
-        if contato.id == contato_id:
-            estagio_anterior = contato.sales_stage
-            contato.sales_stage = novo_estagio["stage"]
-            contato.stage_history.append(novo_estagio["stage"])
-            
-            #Adicionar atividade automaticamente
-            from models.atividade import Atividade
-            atividade = Atividade(
-                "stage_change", 
-                f"Estágio alterado de '{estagio_anterior}' para '{novo_estagio['stage']}'"
-            )
-            contato.activities.append(atividade)
-            
-            crm.save_data()
-            return {"message": "Estágio atualizado com sucesso"}
-    
-    raise HTTPException(status_code=404, detail="Contato não encontrado")
+    contato = crm.get_contato(contato_id)
+    if not contato:
+        raise HTTPException(status_code=404, detail="Contato não encontrado")
+
+    #muda o estágio, registra a atividade automaticamente e avisa os observers (métricas)
+    crm.set_stage(contato, novo_estagio["stage"], registrar_atividade=True)
+    return {"message": "Estágio atualizado com sucesso"}
 
 #----------------- Relatórios -------------------
 @app.get("/relatorios/conversao", dependencies=[Depends(verificar_api_key)])
-def relatorio_conversao():
-    total_leads_criados = len(crm.leads)
-    leads_convertidos = len([l for l in crm.leads if l.converted])
+def relatorio_conversao(): #lido direto das métricas mantidas a cada mudança (core/metrics.py)
+    metricas = crm.metrics.snapshot()
+    total_leads_criados = metricas["total_leads"]
+    leads_convertidos = metricas["leads_convertidos"]
     taxa_conversao = (leads_convertidos / total_leads_criados * 100) if total_leads_criados > 0 else 0
     
     return {
@@ -378,21 +591,67 @@ def relatorio_conversao():
 
 @app.get("/relatorios/info", dependencies=[Depends(verificar_api_key)])
 def relatorio_info():
-    info_detalhada = {}
-    for contato in crm.contatos:
-        stage = contato.sales_stage
-        if stage not in info_detalhada:
-            info_detalhada[stage] = []
-        
-        info_detalhada[stage].append({
+    info_detalhada = {} #os grupos vêm do índice de estágio, sem percorrer todos os contatos
+    for stage in crm.metrics.snapshot()["por_estagio"]:
+        info_detalhada[SALES_STAGES.name(stage)] = [{
             "id": contato.id,
             "nome": contato.name,
             "empresa": contato.empresa,
             "email": contato.email
-        })
+        } for contato in crm.contatos.group("stage", stage)]
     
     return info_detalhada
 
+@app.get("/relatorios/funil", dependencies=[Depends(verificar_api_key)])
+def relatorio_funil(): #funil, desistência por estágio e matriz de transições (core/analytics.py)
+    return crm.funnel()
+
+@app.post("/relatorios/metricas/verificar", dependencies=[Depends(verificar_api_key)])
+def verificar_metricas(): #recalcula as métricas do zero e corrige se algo divergiu
+    def legivel(nome, valor): #estágios aparecem pelo nome, não pelo código interno
+        return {SALES_STAGES.name(c): n for c, n in valor.items()} if nome == "por_estagio" else valor
+    
+    divergencias = crm.metrics.check(crm, fix=True)
+    return {
+        "consistente": not divergencias,
+        "divergencias": {nome: {"mantido": legivel(nome, mantido), "recalculado": legivel(nome, recalculado)}
+                         for nome, (mantido, recalculado) in divergencias.items()},
+        "metricas": {nome: legivel(nome, valor) for nome, valor in crm.metrics.snapshot().items()}
+    }
+
+#----------------- Busca textual -------------------
+@app.get("/search", response_model=SearchResults, dependencies=[Depends(verificar_api_key)])
+def buscar(q: str = Query(..., min_length=1), limit: int = Query(20, ge=1, le=100), tipo: Optional[str] = None):
+    #busca em contatos, leads e campanhas (sem acento/maiúsculas; a última palavra vale como prefixo)
+    #tipo: "contato", "lead", "campanha" ou vários separados por vírgula
+    tipos = None
+    if tipo:
+        tipos = {t.strip().lower() for t in tipo.split(",") if t.strip()}
+        if not tipos <= SEARCH_ENTITIES.keys():
+            raise HTTPException(status_code=400, detail=f"Tipo inválido :( Use: {list(SEARCH_ENTITIES)}")
+    
+    itens = []
+    for score, t, item in crm.search(q, limit=limit, tipos=tipos):
+        titulo, detalhe = hit_label(t, item)
+        itens.append({"tipo": t, "id": item.id, "score": round(score, 3), "titulo": titulo, "detalhe": detalhe})
+    return {"query": q, "items": itens}
+
+@app.get("/autocomplete", response_model=List[AutocompleteItem], dependencies=[Depends(verificar_api_key)])
+def autocompletar(q: str = Query(..., min_length=1), limit: int = Query(10, ge=1, le=50), tipo: str = "contato"):
+    #sugestões por semelhança de nome (e empresa, em contatos): "Joao Silva" acha "João da Silva"
+    entity = SEARCH_ENTITIES.get(tipo.strip().lower())
+    if entity not in FUZZY_INDEXES:
+        raise HTTPException(status_code=400, detail="Tipo inválido :( Use: ['contato', 'lead']")
+    
+    return [{
+        "tipo": tipo.strip().lower(),
+        "id": item.id,
+        "score": round(score, 3),
+        "name": item.name,
+        "email": item.email,
+        "empresa": getattr(item, "empresa", None)
+    } for score, item in crm.fuzzy_find(entity, q, limit=limit)]
+
 
 
 def get_local_ip(): #Função para obter o endereço IP local da máquina
@@ -0,0 +1,106 @@
+#Mede o envio de campanhas pelo SmtpTransport contra um servidor SMTP local de mentira (nada sai da máquina):
+#vazão por lote, falhas (destinatários recusados pelo servidor) e quantas conexões foram abertas.
+#Uso: python benchmarks/bench_envio.py [--contatos 5000] [--lote 500] [--threads 8] [--atraso-ms 0] [--recusar 0.01]
+import argparse
+import random
+import socketserver
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent)) #para rodar direto da raiz do projeto
+
+from core.delivery import CampaignSender, SmtpTransport
+from models.campanha import EmailCampanha
+from models.contact import Contato
+
+class _SessaoSmtp(socketserver.StreamRequestHandler):
+    #o mínimo do protocolo para o smtplib: EHLO, MAIL, RCPT, DATA, RSET, NOOP e QUIT
+    def _responder(self, linha):
+        self.wfile.write(linha.encode("ascii") + b"\r\n")
+
+    def handle(self):
+        servidor = self.server
+        self._responder("220 localhost SMTP de teste")
+        while True:
+            linha = self.rfile.readline()
+            if not linha:
+                return
+            comando = linha.decode("utf-8", "replace").strip()
+            verbo = comando[:4].upper()
+            if verbo in ("EHLO", "HELO"):
+                self._responder("250-localhost")
+                self._responder("250 8BITMIME")
+            elif verbo == "MAIL":
+                self._responder("250 OK")
+            elif verbo == "RCPT":
+                if "recusar" in comando: #destinatário que o servidor rejeita
+                    self._responder("550 Caixa inexistente")
+                else:
+                    self._responder("250 OK")
+            elif verbo == "DATA":
+                self._responder("354 Pode mandar")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                if servidor.atraso:
+                    time.sleep(servidor.atraso)
+                with servidor.lock:
+                    servidor.recebidos += 1
+                self._responder("250 OK")
+            elif verbo in ("RSET", "NOOP"):
+                self._responder("250 OK")
+            elif verbo == "QUIT":
+                self._responder("221 Tchau")
+                return
+            else:
+                self._responder("502 Comando não implementado")
+
+class ServidorSmtpLocal(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, atraso=0.0):
+        super().__init__(("127.0.0.1", 0), _SessaoSmtp)
+        self.atraso = atraso #tempo de resposta simulado por mensagem (servidor real/rede)
+        self.recebidos = 0
+        self.lock = threading.Lock()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def porta(self):
+        return self.server_address[1]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do envio de campanhas por SMTP")
+    parser.add_argument("--contatos", type=int, default=5000)
+    parser.add_argument("--lote", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--atraso-ms", type=float, default=0)
+    parser.add_argument("--recusar", type=float, default=0.01, help="fração de destinatários recusados")
+    args = parser.parse_args()
+
+    random.seed(1)
+    contatos = []
+    for i in range(args.contatos):
+        email = f"recusar{i}@exemplo.com" if random.random() < args.recusar else f"contato{i}@exemplo.com"
+        contatos.append(Contato(f"Contato {i}", email, "11-99999-0000", empresa=f"Empresa {i % 100}", id=i + 1))
+    campanha = EmailCampanha("Novidades", "Olá {nome}, temos novidades para a {empresa}!", "Todos")
+
+    servidor = ServidorSmtpLocal(atraso=args.atraso_ms / 1000)
+    for threads in sorted({1, args.threads}):
+        transporte = SmtpTransport("127.0.0.1", servidor.porta)
+        sender = CampaignSender(transporte, batch_size=args.lote, workers=threads)
+        relatorio = sender.send(campanha, contatos)
+        sender.close()
+        print(f"\n{threads} thread(s): {relatorio['enviados']} enviados, {relatorio['falhas']} falhas "
+              f"em {relatorio['segundos']:.2f}s ({relatorio['por_segundo']:.0f} emails/s), "
+              f"{transporte.conexoes_abertas} conexão(ões) aberta(s)")
+        for lote in relatorio["lotes"][:3]:
+            print(f"   lote {lote['lote']}: {lote['enviados']} enviados, {lote['falhas']} falhas, "
+                  f"{lote['por_segundo']:.0f} emails/s")
+    servidor.shutdown()
+    print(f"\nmensagens recebidas pelo servidor: {servidor.recebidos}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#Memória por contato com N atividades: modelos com __slots__ (atual) x instâncias com __dict__ (como era antes).
+#O "antes" é montado copiando os mesmos atributos para objetos comuns (com __dict__),
+#então os dois lados guardam exatamente os mesmos valores e só muda o layout dos objetos.
+#Uso: python benchmarks/bench_memoria.py [--contatos 2000] [--atividades 100]
+import argparse
+import gc
+import sys
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent)) #para rodar direto da raiz do projeto
+
+from models.base import Serializavel
+from models.contact import Contato
+
+_classes_com_dict = {}
+
+def _slots(cls):
+    for klass in cls.__mro__:
+        yield from klass.__dict__.get("__slots__", ())
+
+def com_dict(obj): #cópia do objeto com __dict__ (uma classe por modelo, como antes)
+    cls = type(obj)
+    plain = _classes_com_dict.get(cls)
+    if plain is None:
+        plain = _classes_com_dict[cls] = type(cls.__name__ + "ComDict", (), {})
+    copia = plain()
+    for attr in _slots(cls):
+        value = getattr(obj, attr)
+        if isinstance(value, list) and value and isinstance(value[0], Serializavel): #atividades, tarefas...
+            value = [com_dict(item) for item in value]
+        setattr(copia, attr, value)
+    return copia
+
+def gerar_dados(n_contatos, n_atividades):
+    return [{
+        "id": i + 1, "name": f"Contato {i}", "email": f"contato{i}@exemplo.com", "telefone": "11-99999-0000",
+        "empresa": "Empresa", "notas": "", "sales_stage": "Prospecto", "stage_history": ["Lead", "Prospecto"],
+        "created_at": "18/09/2025",
+        "activities": [{"type": "email_enviado", "description": f"Campanha {j}", "date": "03/10/2025 23:33"}
+                       for j in range(n_atividades)],
+        "tasks": [], "documents": []
+    } for i in range(n_contatos)]
+
+def medir(fn):
+    gc.collect()
+    tracemalloc.start()
+    antes = tracemalloc.get_traced_memory()[0]
+    objs = fn()
+    depois = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return objs, depois - antes
+
+def main():
+    parser = argparse.ArgumentParser(description="Memória por contato dos modelos do CRM")
+    parser.add_argument("--contatos", type=int, default=2000)
+    parser.add_argument("--atividades", type=int, default=100)
+    args = parser.parse_args()
+
+    dados = gerar_dados(args.contatos, args.atividades)
+
+    def montar():
+        contatos = [Contato.from_dict(d) for d in dados]
+        for c in contatos:
+            c.activities #monta as atividades (o from_dict deixa os dicts crus até o primeiro acesso)
+            c.tasks
+            c.documents
+        return contatos
+
+    contatos, com_slots = medir(montar)
+    _, sem_slots = medir(lambda: [com_dict(c) for c in contatos])
+
+    n = args.contatos
+    print(f"{n} contatos com {args.atividades} atividades cada")
+    print(f"antes  (__dict__):  {sem_slots / n:>10,.0f} bytes por contato")
+    print(f"depois (__slots__): {com_slots / n:>10,.0f} bytes por contato  ({com_slots / sem_slots:.0%})")
+
+if __name__ == "__main__":
+    main()
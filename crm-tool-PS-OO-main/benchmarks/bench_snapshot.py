@@ -0,0 +1,76 @@
+#Compara os formatos de snapshot (JSON indentado, JSON compacto e binário):
+#tempo para gravar, tempo para carregar (streaming, como o CRM faz no load_data) e tamanho do arquivo.
+#Uso: python benchmarks/bench_snapshot.py [--contatos 50000] [--atividades 5] [--repeticoes 3]
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent)) #para rodar direto da raiz do projeto
+
+from core.binary_format import msgpack
+from core.snapshot import iter_snapshot, write_snapshot
+
+ESTAGIOS = ["Lead", "Prospecto", "Qualificado", "Proposta", "Negociação", "Venda fechada"]
+
+def gerar_dados(n_contatos, n_atividades):
+    random.seed(1)
+    contatos = []
+    for i in range(n_contatos):
+        historico = ESTAGIOS[:random.randint(1, len(ESTAGIOS))]
+        contatos.append({
+            "id": i + 1, "name": f"Contato {i}", "email": f"contato{i}@exemplo.com",
+            "telefone": "11-99999-0000", "empresa": f"Empresa {i % 1000}", "notas": "Cliente importante.",
+            "sales_stage": historico[-1], "stage_history": historico, "created_at": "18/09/2025",
+            "activities": [{"type": "chamada", "description": f"Ligação {j}", "date": "03/10/2025 23:33"}
+                           for j in range(n_atividades)],
+            "tasks": [{"title": "Follow up", "date": "10/10/2025", "completed": False}],
+            "documents": []
+        })
+    leads = [{"id": 10_000_000 + i, "name": f"Lead {i}", "email": f"lead{i}@exemplo.com",
+              "source": random.choice(["Website", "Evento", "Indicação"]), "created_at": "20/09/2025",
+              "score": 10, "converted": False} for i in range(n_contatos // 2)]
+    campanhas = [{"id": 20_000_000 + i, "title": f"Campanha {i}", "description": "desc",
+                  "target_stage": "Prospecto", "sent_to": [], "created_at": "20/09/2025"} for i in range(10)]
+    return {"contatos": contatos, "campanhas": campanhas, "leads": leads, "documents": []}
+
+def medir(fn, repeticoes):
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        fn()
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dos formatos de snapshot do CRM")
+    parser.add_argument("--contatos", type=int, default=50_000)
+    parser.add_argument("--atividades", type=int, default=5)
+    parser.add_argument("--repeticoes", type=int, default=3)
+    args = parser.parse_args()
+
+    data = gerar_dados(args.contatos, args.atividades)
+    total = sum(len(v) for v in data.values())
+    print(f"{total} registros ({args.contatos} contatos, {args.atividades} atividades cada)")
+    if msgpack is None:
+        print("AVISO: msgpack não instalado, o formato binário usa a implementação em Python puro.")
+
+    formatos = [("json", "json", False), ("json compacto", "json", True), ("binário", "binary", False)]
+    resultados = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for nome, formato, compact in formatos:
+            path = Path(tmp) / f"snapshot_{formato}_{int(compact)}"
+            save = medir(lambda: write_snapshot(path, data, compact=compact, formato=formato), args.repeticoes)
+            load = medir(lambda: list(iter_snapshot(path)), args.repeticoes) #guarda os registros, como o load_data
+            resultados.append((nome, save, load, path.stat().st_size))
+
+    base_save, base_load, base_size = resultados[0][1:]
+    print(f"\n{'formato':<15}{'gravar (s)':>12}{'carregar (s)':>14}{'tamanho (MB)':>14}")
+    for nome, save, load, size in resultados:
+        print(f"{nome:<15}{save:>12.2f}{load:>14.2f}{size / 2**20:>14.1f}"
+              f"   ({base_save / save:.1f}x, {base_load / load:.1f}x, {size / base_size:.0%})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+from itertools import chain
+
+try: #numpy é opcional: sem ele as mesmas contas são feitas em Python puro (mais lento)
+    import numpy as np
+except ImportError:
+    np = None
+
+from models.base import SALES_STAGES
+
+#------------------------------ funil de vendas ------------------------------
+#Analisa o stage_history de todos os contatos de uma vez: os históricos viram um único vetor de
+#códigos (mais o tamanho de cada histórico) e as contas são feitas em lote:
+#  - transições: quantas vezes cada estágio foi seguido por cada outro (matriz de/para)
+#  - funil: quantos contatos chegaram pelo menos até cada estágio (na ordem do SalesStage)
+#  - desistências: dos que chegaram num estágio, quantos não passaram dele
+
+def _histories_numpy(histories, n_codes):
+    tamanhos = np.fromiter(map(len, histories), dtype=np.int64, count=len(histories))
+    codigos = np.fromiter(chain.from_iterable(histories), dtype=np.int64, count=int(tamanhos.sum()))
+    tamanhos = tamanhos[tamanhos > 0] #contato sem histórico não entra no funil
+    inicios = np.cumsum(tamanhos) - tamanhos
+
+    #transições: pares (código, próximo código) que não cruzam de um contato para o outro
+    mesmo_contato = np.ones(max(len(codigos) - 1, 0), dtype=bool)
+    mesmo_contato[inicios[1:] - 1] = False
+    pares = codigos[:-1][mesmo_contato] * n_codes + codigos[1:][mesmo_contato]
+    matriz = np.bincount(pares, minlength=n_codes * n_codes).reshape(n_codes, n_codes)
+
+    #posição de cada código no funil (-1 para estágios fora do padrão) e a mais longe de cada contato
+    posicao = np.full(n_codes, -1, dtype=np.int64)
+    padrao = np.fromiter(SALES_STAGES.standard_codes(), dtype=np.int64)
+    posicao[padrao] = np.arange(len(padrao))
+    if len(codigos):
+        mais_longe = np.maximum.reduceat(posicao[codigos], inicios)
+    else:
+        mais_longe = np.empty(0, dtype=np.int64)
+    por_posicao = np.bincount(mais_longe[mais_longe >= 0], minlength=len(padrao))
+    alcancaram = np.cumsum(por_posicao[::-1])[::-1] #chegou até a posição p = parou em p ou depois
+    return len(tamanhos), alcancaram.tolist(), matriz.tolist()
+
+def _histories_python(histories, n_codes):
+    posicao = {code: p for p, code in enumerate(SALES_STAGES.standard_codes())}
+    matriz = [[0] * n_codes for _ in range(n_codes)]
+    por_posicao = [0] * len(posicao)
+    total = 0
+    for historico in histories:
+        if not historico:
+            continue
+        total += 1
+        for de, para in zip(historico, historico[1:]):
+            matriz[de][para] += 1
+        mais_longe = max(posicao.get(code, -1) for code in historico)
+        if mais_longe >= 0:
+            por_posicao[mais_longe] += 1
+    alcancaram, acumulado = [], 0
+    for quantidade in reversed(por_posicao):
+        acumulado += quantidade
+        alcancaram.append(acumulado)
+    return total, alcancaram[::-1], matriz
+
+def _pct(parte, todo):
+    return round(parte / todo * 100, 2) if todo else 0
+
+def funnel_report(histories):
+    #histories: sequência com o stage_history de cada contato em códigos (Contato.stage_codes)
+    n_codes = len(SALES_STAGES)
+    calcular = _histories_numpy if np is not None else _histories_python
+    total, alcancaram, matriz = calcular(histories, n_codes)
+
+    estagios = [SALES_STAGES.name(code) for code in SALES_STAGES.standard_codes()]
+    funil = []
+    for p, estagio in enumerate(estagios):
+        seguintes = alcancaram[p + 1] if p + 1 < len(estagios) else alcancaram[p] #o último não tem "depois"
+        desistencias = alcancaram[p] - seguintes
+        funil.append({
+            "estagio": estagio,
+            "alcancaram": alcancaram[p],
+            "conversao_etapa": _pct(alcancaram[p], alcancaram[p - 1] if p else alcancaram[0]),
+            "conversao_total": _pct(alcancaram[p], alcancaram[0]),
+            "desistencias": desistencias,
+            "taxa_desistencia": _pct(desistencias, alcancaram[p])
+        })
+
+    transicoes = sorted(({
+        "de": SALES_STAGES.name(de),
+        "para": SALES_STAGES.name(para),
+        "quantidade": quantidade
+    } for de, linha in enumerate(matriz) for para, quantidade in enumerate(linha) if quantidade),
+        key=lambda t: -t["quantidade"])
+
+    padrao = list(SALES_STAGES.standard_codes())
+    return {
+        "total_contatos": total,
+        "estagios": estagios,
+        "funil": funil,
+        "transicoes": transicoes,
+        "matriz": [[matriz[de][para] for para in padrao] for de in padrao] #só os estágios padrão, na ordem
+    }
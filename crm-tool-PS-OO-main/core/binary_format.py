@@ -0,0 +1,235 @@
+import io
+import struct
+
+try: #msgpack é opcional: sem ele usamos a implementação em Python puro abaixo (mesmo formato)
+    import msgpack
+except ImportError:
+    msgpack = None
+
+#Formato binário do snapshot:
+#  cabeçalho: b"CRMB" + versão (1 byte)
+#  registros: seção (1 byte) + tamanho (uint32 big-endian) + registro em msgpack
+#  fim:       seção 0xFF + tamanho 0
+#Como cada registro tem o tamanho na frente, dá para ler em streaming e pular seções.
+
+MAGIC = b"CRMB"
+VERSAO = 1
+SECOES = ("contatos", "campanhas", "leads", "documents", "outbox", "envios", "meta") #seções novas só no fim (o código é a posição)
+#"meta" é gravada primeiro para quem lê em streaming saber a geração antes dos registros
+_ORDEM = (SECOES.index("meta"),) + tuple(c for c, secao in enumerate(SECOES) if secao != "meta")
+_FIM = 0xFF
+_HEADER = struct.Struct(">BI")
+
+def is_binary(prefix: bytes):
+    return prefix[:len(MAGIC)] == MAGIC
+
+#------------------------ msgpack em Python puro (subconjunto) ------------------------
+def _pack(obj, out):
+    if obj is None:
+        out.append(b"\xc0")
+    elif obj is True:
+        out.append(b"\xc3")
+    elif obj is False:
+        out.append(b"\xc2")
+    elif isinstance(obj, int):
+        if 0 <= obj < 0x80:
+            out.append(struct.pack("B", obj))
+        elif -32 <= obj < 0:
+            out.append(struct.pack("b", obj))
+        elif 0 <= obj <= 0xFFFFFFFF:
+            out.append(struct.pack(">BI", 0xce, obj))
+        elif obj > 0:
+            out.append(struct.pack(">BQ", 0xcf, obj))
+        elif obj >= -0x80000000:
+            out.append(struct.pack(">Bi", 0xd2, obj))
+        else:
+            out.append(struct.pack(">Bq", 0xd3, obj))
+    elif isinstance(obj, float):
+        out.append(struct.pack(">Bd", 0xcb, obj))
+    elif isinstance(obj, str):
+        data = obj.encode("utf-8")
+        n = len(data)
+        if n < 32:
+            out.append(struct.pack("B", 0xa0 | n))
+        elif n <= 0xFF:
+            out.append(struct.pack(">BB", 0xd9, n))
+        elif n <= 0xFFFF:
+            out.append(struct.pack(">BH", 0xda, n))
+        else:
+            out.append(struct.pack(">BI", 0xdb, n))
+        out.append(data)
+    elif isinstance(obj, (list, tuple)):
+        n = len(obj)
+        if n < 16:
+            out.append(struct.pack("B", 0x90 | n))
+        elif n <= 0xFFFF:
+            out.append(struct.pack(">BH", 0xdc, n))
+        else:
+            out.append(struct.pack(">BI", 0xdd, n))
+        for item in obj:
+            _pack(item, out)
+    elif isinstance(obj, dict):
+        n = len(obj)
+        if n < 16:
+            out.append(struct.pack("B", 0x80 | n))
+        elif n <= 0xFFFF:
+            out.append(struct.pack(">BH", 0xde, n))
+        else:
+            out.append(struct.pack(">BI", 0xdf, n))
+        for key, value in obj.items():
+            _pack(key, out)
+            _pack(value, out)
+    else:
+        raise TypeError(f"Tipo não suportado no formato binário: {type(obj).__name__}")
+
+#formato -> (struct para ler o tamanho/valor, tamanho em bytes)
+_FIXOS = {
+    0xcc: struct.Struct(">B"), 0xcd: struct.Struct(">H"), 0xce: struct.Struct(">I"), 0xcf: struct.Struct(">Q"),
+    0xd0: struct.Struct(">b"), 0xd1: struct.Struct(">h"), 0xd2: struct.Struct(">i"), 0xd3: struct.Struct(">q"),
+    0xca: struct.Struct(">f"), 0xcb: struct.Struct(">d"),
+}
+_TAMANHOS = {0xd9: struct.Struct(">B"), 0xda: struct.Struct(">H"), 0xdb: struct.Struct(">I"),
+             0xdc: struct.Struct(">H"), 0xdd: struct.Struct(">I"),
+             0xde: struct.Struct(">H"), 0xdf: struct.Struct(">I")}
+
+def _unpack(data, pos):
+    b = data[pos]
+    pos += 1
+    if b < 0x80:
+        return b, pos
+    if b >= 0xe0:
+        return b - 0x100, pos
+    if 0xa0 <= b <= 0xbf:
+        n = b & 0x1f
+        return data[pos:pos + n].decode("utf-8"), pos + n
+    if 0x90 <= b <= 0x9f:
+        return _unpack_array(data, pos, b & 0x0f)
+    if 0x80 <= b <= 0x8f:
+        return _unpack_map(data, pos, b & 0x0f)
+    if b == 0xc0:
+        return None, pos
+    if b == 0xc2:
+        return False, pos
+    if b == 0xc3:
+        return True, pos
+    if b in _FIXOS:
+        fmt = _FIXOS[b]
+        return fmt.unpack_from(data, pos)[0], pos + fmt.size
+    if b in _TAMANHOS:
+        fmt = _TAMANHOS[b]
+        n = fmt.unpack_from(data, pos)[0]
+        pos += fmt.size
+        if b in (0xd9, 0xda, 0xdb):
+            return bytes(data[pos:pos + n]).decode("utf-8"), pos + n
+        if b in (0xdc, 0xdd):
+            return _unpack_array(data, pos, n)
+        return _unpack_map(data, pos, n)
+    raise ValueError(f"Byte de formato inválido no snapshot binário: 0x{b:02x}")
+
+def _unpack_array(data, pos, n):
+    items = []
+    for _ in range(n):
+        item, pos = _unpack(data, pos)
+        items.append(item)
+    return items, pos
+
+def _unpack_map(data, pos, n):
+    result = {}
+    for _ in range(n):
+        key, pos = _unpack(data, pos)
+        value, pos = _unpack(data, pos)
+        result[key] = value
+    return result, pos
+
+def packb(obj):
+    if msgpack is not None:
+        return msgpack.packb(obj, use_bin_type=True)
+    out = []
+    _pack(obj, out)
+    return b"".join(out)
+
+def unpackb(data):
+    if msgpack is not None:
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+    obj, _ = _unpack(bytes(data), 0)
+    return obj
+
+#------------------------------ snapshot ------------------------------
+def encode_binary(data):
+    partes = [MAGIC, struct.pack("B", VERSAO)]
+    header = _HEADER.pack
+    for codigo in _ORDEM:
+        for record in data.get(SECOES[codigo], []):
+            payload = packb(record)
+            partes.append(header(codigo, len(payload)))
+            partes.append(payload)
+    partes.append(header(_FIM, 0))
+    return b"".join(partes)
+
+def iter_binary_sections(f, chunk_size=1 << 20, on_chunk=None):
+    #mesmo contrato do iter_json_sections: devolve (secao, registro) um por vez
+    buf = bytearray()
+    pos = 0
+    eof = False
+
+    def ler(n): #garante n bytes disponíveis a partir de pos
+        nonlocal buf, pos, eof
+        while len(buf) - pos < n and not eof:
+            chunk = f.read(max(chunk_size, n))
+            if on_chunk is not None:
+                on_chunk(chunk)
+            if not chunk:
+                eof = True
+                break
+            del buf[:pos]
+            pos = 0
+            buf += chunk
+        if len(buf) - pos < n:
+            raise ValueError("Snapshot binário terminou no meio de um registro")
+
+    ler(len(MAGIC) + 1)
+    if not is_binary(bytes(buf[pos:pos + len(MAGIC)])):
+        raise ValueError("Arquivo não é um snapshot binário do CRM")
+    versao = buf[pos + len(MAGIC)]
+    if versao != VERSAO:
+        raise ValueError(f"Versão {versao} do snapshot binário não suportada")
+    pos += len(MAGIC) + 1
+
+    unpack_header = _HEADER.unpack_from
+    header_size = _HEADER.size
+    while True:
+        if len(buf) - pos < header_size:
+            ler(header_size)
+        codigo, tamanho = unpack_header(buf, pos)
+        pos += header_size
+        if codigo == _FIM:
+            break
+        if len(buf) - pos < tamanho: #só chama ler() quando o registro passa do fim do pedaço
+            ler(tamanho)
+        payload = memoryview(buf)[pos:pos + tamanho]
+        try:
+            record = unpackb(payload)
+        except ValueError:
+            raise
+        except Exception as e: #struct.error, IndexError... viram o mesmo erro de arquivo inválido
+            raise ValueError(f"Registro inválido no snapshot binário: {e}") from e
+        finally:
+            payload.release() #libera o buffer para poder ser redimensionado
+        pos += tamanho
+        if codigo < len(SECOES):
+            yield SECOES[codigo], record
+
+    while not eof: #lê até o fim para o checksum ver o arquivo inteiro
+        chunk = f.read(chunk_size)
+        if on_chunk is not None:
+            on_chunk(chunk)
+        if not chunk:
+            eof = True
+        elif chunk.strip(b"\x00"):
+            raise ValueError("Conteúdo extra depois do fim do snapshot binário")
+
+def decode_binary(payload: bytes): #snapshot inteiro de uma vez (read_snapshot)
+    data = {secao: [] for secao in SECOES}
+    for secao, record in iter_binary_sections(io.BytesIO(payload)):
+        data[secao].append(record)
+    return data
@@ -21,6 +21,10 @@ class ListContactsCommand(Command):
     def execute(self) -> None:
         self._crm.listar_contatos()
         
+class SearchCommand(Command):
+    def execute(self) -> None:
+        self._crm.buscar()
+
 class AddLeadCommand(Command):
     def execute(self):
         self._crm.add_lead()
@@ -80,6 +84,7 @@ class ExitCommand(Command):
         
     def execute(self):
         self._crm.save_data()
+        self._crm.close() #no modo write-behind garante que nada fica pendente
         print("Saindo... dados salvos.")
         self.should_exit = True
    
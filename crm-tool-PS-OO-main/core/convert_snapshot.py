@@ -0,0 +1,41 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+from .binary_format import SECOES, msgpack
+from .snapshot import read_snapshot, write_snapshot
+
+#Conversor entre os formatos de snapshot:
+#  python -m core.convert_snapshot json2bin crm_data.json crm_data.bin
+#  python -m core.convert_snapshot bin2json crm_data.bin crm_data.json
+
+def convert_file(origem, destino, formato):
+    data = read_snapshot(origem) #detecta o formato pelo cabeçalho e confere o checksum
+    write_snapshot(destino, data, formato=formato)
+    return data
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m core.convert_snapshot",
+        description="Converte snapshots do CRM entre JSON e o formato binário."
+    )
+    parser.add_argument("comando", choices=["json2bin", "bin2json"])
+    parser.add_argument("origem")
+    parser.add_argument("destino")
+    args = parser.parse_args(argv)
+
+    inicio = time.perf_counter()
+    data = convert_file(args.origem, args.destino, "binary" if args.comando == "json2bin" else "json")
+    duracao = time.perf_counter() - inicio
+
+    total = sum(len(data.get(secao, [])) for secao in SECOES if secao != "meta")
+    origem_kb = Path(args.origem).stat().st_size / 1024
+    destino_kb = Path(args.destino).stat().st_size / 1024
+    print(f"✅ {total} registros convertidos em {duracao:.2f}s ({origem_kb:.0f} KB -> {destino_kb:.0f} KB)")
+    if msgpack is None:
+        print("⚠️  msgpack não está instalado: usando a implementação em Python puro (mais lenta).")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,18 @@
+import atexit
+from collections import Counter
+from contextlib import contextmanager
+import gc
+import heapq
+import itertools
 import json
+import os
 from pathlib import Path
+import shutil
+import threading
+import time
 import unicodedata
 
-from models.base import UserRole, LeadSource
+from models.base import UserRole, LeadSource, SALES_STAGES, format_timestamp, reservar_id, DATETIME_FORMAT
 from models.contact import Contato, Lead, SalesStage
 from models.campanha import EmailCampanha
 from models.document import Document
@@ -15,10 +25,66 @@ from models.builder import create_contact, create_lead, create_campaign, get_dir
 from .strategy import * #sei que nao é uma boa maneira, mas tava com preguiça
 from .observer import Subject, Observer
 from .adapters import LeadAdapter
+from .storage import create_storage
+from .snapshot import SnapshotCorrompidoError
+from .indexes import IndexedCollection, GroupIndex, SortedIndex
+from .search import TextIndex, contato_fields, lead_fields, campanha_fields, hit_label
+from .fuzzy import TrigramIndex
+from .metrics import MetricsObserver
+from .event_bus import EventBus
+from .outbox import Outbox, desserializar
+from .delivery import CampaignSender, create_transport
+from .scheduler import CampaignScheduler
+from .analytics import funnel_report
+from .dedup import DuplicatePolicy, DuplicateEmailError, normalize_email, combine, CAMPOS
 
 from .validators import SafeInput, Validators, ValidationError
 
 DATA_FILE = Path(__file__).resolve().parent.parent / "crm_data.json"
+JOURNAL_FILE = DATA_FILE.with_name("crm_data.journal")
+SQLITE_FILE = DATA_FILE.with_name("crm_data.db")
+BINARY_FILE = DATA_FILE.with_name("crm_data.bin")
+COMPACT_EVERY = 500 #depois de quantas mudanças no journal o snapshot é regravado
+STORAGE_BACKEND = os.environ.get("CRM_STORAGE", "json") #"json" ou "sqlite"
+#sem valor: grava cada mudança na hora (padrão). "strict": na hora e com fsync;
+#"batch"/"relaxed": write-behind (em lote, com ou sem fsync) - ver core/write_behind.py
+DURABILITY = os.environ.get("CRM_DURABILITY")
+FLUSH_INTERVAL_MS = int(os.environ.get("CRM_FLUSH_INTERVAL_MS", "200"))
+FLUSH_MAX_PENDING = int(os.environ.get("CRM_FLUSH_MAX_PENDING", "1000"))
+COMPACT_JSON = os.environ.get("CRM_COMPACT_JSON") == "1" #snapshot JSON sem indentação (menor e mais rápido)
+SNAPSHOT_FORMAT = os.environ.get("CRM_SNAPSHOT_FORMAT", "json").lower() #"json" ou "binary" (ver core/binary_format.py)
+SNAPSHOT_FILE = BINARY_FILE if SNAPSHOT_FORMAT == "binary" else DATA_FILE
+#o que fazer ao criar contato/lead com email que já existe: "reject", "merge" ou "upsert" (ver core/dedup.py)
+DUPLICATE_POLICY = DuplicatePolicy(os.environ.get("CRM_DUPLICATE_POLICY", "reject").lower())
+SEARCH_ENTITIES = {"contato": "contatos", "lead": "leads", "campanha": "campanhas"} #tipo -> coleção
+FUZZY_INDEXES = {"contatos": ("name_trgm", "empresa_trgm"), "leads": ("name_trgm",)} #busca aproximada
+#"sync": observers chamados na hora, dentro do notify (como antes); "async": pelo barramento (core/event_bus.py)
+EVENT_BUS = os.environ.get("CRM_EVENT_BUS", "async").lower()
+EVENT_QUEUE_SIZE = int(os.environ.get("CRM_EVENT_QUEUE_SIZE", "1000")) #eventos pendentes por observer
+EVENT_BACKPRESSURE = os.environ.get("CRM_EVENT_BACKPRESSURE", "block").lower() #fila cheia: "block" ou "drop"
+#eventos para observers assíncronos gravados junto com a mudança e entregues por uma thread (core/outbox.py)
+OUTBOX = os.environ.get("CRM_OUTBOX", "1") != "0"
+OUTBOX_BATCH_SIZE = int(os.environ.get("CRM_OUTBOX_BATCH_SIZE", "100"))
+#envio das campanhas (core/delivery.py): "simulado" (só registra, padrão) ou "smtp"
+EMAIL_TRANSPORT = os.environ.get("CRM_EMAIL_TRANSPORT", "simulado")
+SMTP_CONFIG = {
+    "host": os.environ.get("CRM_SMTP_HOST", "localhost"),
+    "port": int(os.environ.get("CRM_SMTP_PORT", "25")),
+    "username": os.environ.get("CRM_SMTP_USER"),
+    "password": os.environ.get("CRM_SMTP_PASSWORD"),
+    "starttls": os.environ.get("CRM_SMTP_STARTTLS") == "1",
+    "use_ssl": os.environ.get("CRM_SMTP_SSL") == "1",
+    "remetente": os.environ.get("CRM_EMAIL_FROM", "crm@localhost")
+}
+SEND_BATCH_SIZE = int(os.environ.get("CRM_SEND_BATCH_SIZE", "500")) #destinatários por lote
+SEND_WORKERS = int(os.environ.get("CRM_SEND_WORKERS", "8")) #threads (e conexões) enviando ao mesmo tempo
+SEND_RATE_LIMIT = float(os.environ.get("CRM_SEND_RATE_LIMIT", "0")) #emails por segundo no transporte (0 = sem limite)
+SCHEDULER = os.environ.get("CRM_SCHEDULER", "1") != "0" #"0": campanhas agendadas não saem neste processo
+_TIPOS = {entity: tipo for tipo, entity in SEARCH_ENTITIES.items()} #"contatos" -> "contato" (nome dos eventos)
+_ORDEM_BULK = {"delete": 0, "update": 1, "create": 2}
+
+_TIPOS_OUTBOX = {Contato: "contato", Lead: "lead", EmailCampanha: "campanha", Atividade: "atividade", Task: "task", Document: "document"}
+_CLASSES_OUTBOX = {nome: cls for cls, nome in _TIPOS_OUTBOX.items()}
 
 class CRM(Subject):
     _instance = None
@@ -32,10 +98,7 @@ class CRM(Subject):
         if not CRM._initialized:
             CRM._initialized = True
         #print("\n--- DEBUG: 1. Iniciando a criação do objeto CRM... ---")
-            self.contatos = []
-            self.campanhas = []
-            self.leads = []
-            self.documents = []
+            self._reset_data()
             self.current_user_role = None  #user inicial
             
             self._menu_strategies = {
@@ -46,53 +109,597 @@ class CRM(Subject):
             }
             
             self._observers: list[Observer] = []
+            self._rotas = {} #evento -> observers interessados (montada na primeira vez que o evento aparece)
+            self._bus = EventBus(EVENT_QUEUE_SIZE, EVENT_BACKPRESSURE) if EVENT_BUS == "async" else None
+            self.metrics = MetricsObserver() #totais dos relatórios, mantidos pelos eventos (core/metrics.py)
+            self.attach(self.metrics)
+            self._storage = create_storage(
+                STORAGE_BACKEND, DATA_FILE, JOURNAL_FILE, SQLITE_FILE, compact_every=COMPACT_EVERY,
+                durability=DURABILITY, flush_interval_ms=FLUSH_INTERVAL_MS, flush_max_pending=FLUSH_MAX_PENDING,
+                compact_json=COMPACT_JSON, snapshot_format=SNAPSHOT_FORMAT, binary_file=BINARY_FILE
+            )
+            self._tx = threading.local() #mudanças da transação em andamento (por thread)
+            self._outbox = Outbox(self._gravar, self._entregar_outbox, OUTBOX_BATCH_SIZE)
+            self._sender = None #criado no primeiro envio de campanha
+            self._envio_lock = threading.RLock() #envio manual e agendado da mesma campanha não se cruzam
+            self._scheduler = CampaignScheduler(self._run_scheduled, ativo=SCHEDULER) #thread só no primeiro agendamento
+            self._adiar_compactacao = 0 #> 0 durante operações em massa (compactacao_adiada)
+            self._closed = False
+            atexit.register(self.close) #o que ainda estiver pendente é gravado antes do processo sair
             
             self.load_data()
+            self._restore_schedules()
 
        #print("--- DEBUG: 4. Finalizando a criação do objeto CRM. ---\n")
         
-    def save_data(self): 
-        data = {
+    def save_data(self): #snapshot completo (no JSON também compacta o journal)
+        self._storage.compact(self._snapshot)
+
+    def _snapshot(self):
+        return {
             "contatos": [c.to_dict() for c in self.contatos],
             "campanhas": [c.to_dict() for c in self.campanhas],
             "leads": [l.to_dict() for l in self.leads],
-            "documents": [d.to_dict() for d in self.documents]
+            "documents": [d.to_dict() for d in self.documents],
+            "outbox": self._outbox.records() #eventos ainda não entregues
         }
-        with open(DATA_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+
+    def close(self): #grava o que estiver pendente e fecha o storage
+        if self._closed:
+            return
+        self._closed = True
+        if self._sender is not None:
+            self._sender.stop() #envio em andamento para no fim do lote; a fila gravada continua no próximo início
+        self._scheduler.close()
+        self._outbox.close() #entrega o que já foi gravado no outbox
+        if self._sender is not None:
+            self._sender.close()
+        if self._bus is not None: #entrega os eventos que ainda estão nas filas
+            bus, self._bus = self._bus, None
+            bus.close()
+        self._storage.close()
+
+    def save_change(self, entity, obj): #persiste só o registro alterado
+        if entity == "documents": #documentos soltos não têm id, só são adicionados
+            self._escrever(("append", entity, obj.to_dict(), None))
+        else:
+            self._escrever(("upsert", entity, obj.to_dict(), obj.id))
+            getattr(self, entity).refresh(obj) #índices secundários (estágio, nome, score...)
+
+    def save_delete(self, entity, obj_id):
+        self._escrever(("delete", entity, None, obj_id))
+
+    @contextmanager
+    def transacao(self, atomica=False):
+        #tudo que for salvo (e os eventos do outbox) dentro do bloco vai num write_batch só:
+        #a mudança e o evento que ela gera chegam juntos ao disco. Um bloco dentro de outro faz parte do de fora
+        #atomica: com erro no bloco nada é gravado (quem chamou desfaz o que mudou na memória)
+        if getattr(self._tx, "mudancas", None) is not None:
+            yield
+            return
+        self._tx.mudancas = []
+        try:
+            yield
+        except BaseException:
+            if atomica:
+                mudancas, self._tx.mudancas = self._tx.mudancas, None
+                self._outbox.descartar([change[3] for change in mudancas if change[1] == "outbox" and change[0] == "upsert"])
+            raise
+        finally: #mesmo com erro no meio, o que já mudou em memória é gravado (como era antes, uma a uma)
+            mudancas, self._tx.mudancas = self._tx.mudancas, None
+            if mudancas:
+                self._gravar(mudancas)
+
+    def _escrever(self, change):
+        mudancas = getattr(self._tx, "mudancas", None)
+        if mudancas is not None:
+            mudancas.append(change)
+        else:
+            self._gravar([change])
+
+    def _gravar(self, changes):
+        eventos = [change[3] for change in changes if change[1] == "outbox" and change[0] == "upsert"]
+        try:
+            self._storage.write_batch(changes)
+        except Exception:
+            self._outbox.descartar(eventos)
+            raise
+        if eventos:
+            self._outbox.liberar(eventos)
+        self._compact_if_needed()
+
+    def _compact_if_needed(self):
+        if not self._adiar_compactacao and self._storage.needs_compaction():
+            self.save_data()
+
+    @contextmanager
+    def compactacao_adiada(self):
+        #operações em massa (envio de campanha, importação): sem isso o snapshot inteiro seria regravado
+        #a cada COMPACT_EVERY mudanças no meio da operação; o journal cresce e a compactação acontece no fim
+        self._adiar_compactacao += 1
+        try:
+            yield
+        finally:
+            self._adiar_compactacao -= 1
+            self._compact_if_needed()
 
     def load_data(self): 
         #print("--- DEBUG: 2. Entrando na função load_data... ---")
-        
-        if not DATA_FILE.exists(): #garante que nao vai ter erro se o arquivo nao existir na primeira vez
-            print("--- DEBUG: Erro! O arquivo DATA_FILE não foi encontrado. ---")
-            return
         try:
-            with open(DATA_FILE, "r", encoding="utf-8") as f:
-                #print("--- DEBUG: 3. Arquivo JSON aberto com sucesso. Lendo dados... ---")
-                
-                data = json.load(f)
-                self.contatos = [Contato.from_dict(c) for c in data.get("contatos", [])]
-                self.campanhas = [EmailCampanha.from_dict(c) for c in data.get("campanhas", [])]
-                self.leads = [Lead.from_dict(l) for l in data.get("leads", [])]
-                self.documents = [Document.from_dict(d) for d in data.get("documents", [])]
-                
-                #print("\n--- DEBUG: IDs dos Contatos Carregados na Memória ---")
-                #for contato in self.contatos:
-                #   print(f"Nome: {contato.name}, ID na memória: {contato.id}, Tipo do ID: {type(contato.id)}")
-                #print("---------------------------------------------------\n")
+            try:
+                self._load_records(self._storage.iter_records()) #streaming: um registro por vez
+            except SnapshotCorrompidoError as e:
+                print(f"AVISO: {e}. Carregando o último snapshot bom.")
+                self._load_records(self._storage.iter_records(fallback=True))
+            
+            #print("\n--- DEBUG: IDs dos Contatos Carregados na Memória ---")
+            #for contato in self.contatos:
+            #   print(f"Nome: {contato.name}, ID na memória: {contato.id}, Tipo do ID: {type(contato.id)}")
+            #print("---------------------------------------------------\n")
         except FileNotFoundError:
-            print(f"ERRO CRÍTICO: Arquivos de dados '{DATA_FILE.name}' não foi encontrado, mas existia antes.")
-            self.contatos, self.campanhas, self.leads, self.documents = [], [], [], []
+            print(f"ERRO CRÍTICO: Arquivos de dados '{SNAPSHOT_FILE.name}' não foi encontrado, mas existia antes.")
+            self._reset_data()
             
-        except json.JSONDecodeError:
-            print(f"ERRO CRÍTICO: O arquivo de dados '{DATA_FILE.name}' está corrompido (JSON inválido).")
-            print("Carregando o sistema com dados vazios para evitar perda de dados.")
-            self.contatos, self.campanhas, self.leads, self.documents = [], [], [], []
-             
+        except (json.JSONDecodeError, SnapshotCorrompidoError) as e:
+            #nenhuma cópia válida: iniciar vazio faria a primeira compactação apagar os dados de vez
+            copia = self._guardar_corrompido()
+            print(f"ERRO CRÍTICO: O arquivo de dados '{SNAPSHOT_FILE.name}' está corrompido e não há cópia válida.")
+            if copia is not None:
+                print(f"Uma cópia foi guardada em '{copia.name}'. Restaure um snapshot bom antes de iniciar o CRM.")
+            CRM._initialized = False
+            raise SnapshotCorrompidoError(f"Dados corrompidos em '{SNAPSHOT_FILE.name}': {e}") from e
+        
+        self.metrics.rebuild(self) #a carga não passa pelos eventos: recalcula uma vez do zero
+
+    def _guardar_corrompido(self): #cópia do snapshot inválido ao lado (*.corrupt) para recuperar à mão
+        if not SNAPSHOT_FILE.exists():
+            return None
+        copia = SNAPSHOT_FILE.with_name(SNAPSHOT_FILE.name + ".corrupt")
+        shutil.copy2(SNAPSHOT_FILE, copia)
+        return copia
+
+    def _load_records(self, records):
+        self._reset_data()
+        colecoes = {
+            "contatos": (self.contatos, Contato),
+            "campanhas": (self.campanhas, EmailCampanha),
+            "leads": (self.leads, Lead)
+        }
+        #a carga cria milhões de objetos que vão viver até o fim do processo: o coletor de lixo
+        #rodando no meio só gasta tempo percorrendo esses objetos (era ~40% da carga de uma base grande)
+        gc_ativo = gc.isenabled()
+        gc.disable()
+        self._outbox.clear()
+        try:
+            for entity, record in records:
+                if entity == "documents":
+                    self.documents.append(Document.from_dict(record))
+                elif entity == "outbox": #eventos gravados e ainda não entregues (o processo caiu antes)
+                    self._outbox.restore(record)
+                elif entity == "envios": #checkpoint de um envio de campanha gravado depois do snapshot
+                    campanha = self.campanhas.get(record.get("campanha_id"))
+                    if campanha is not None:
+                        campanha.apply_checkpoint(record)
+                elif entity in colecoes:
+                    colecao, cls = colecoes[entity]
+                    colecao.put(cls.from_dict(record))
+        finally:
+            if gc_ativo:
+                gc.enable()
+        gc.freeze() #o que foi carregado fica fora das próximas coletas
+        reservar_id(max((obj.id for colecao in (self.contatos, self.leads, self.campanhas) for obj in colecao),
+                        default=0))
+        reservar_id(max((e["id"] for e in self._outbox.records()), default=0))
+
+    def _reset_data(self):
+        #índices usados pela listagem paginada da API (filtros e ordenação), montados na primeira consulta
+        self.contatos = IndexedCollection(indexes={
+            "id": SortedIndex(lambda c: c.id),
+            "name": SortedIndex(lambda c: c.name.casefold()),
+            "created_at": SortedIndex(lambda c: c.created_ts or 0),
+            "stage": GroupIndex(lambda c: c.stage_code),
+            "empresa": GroupIndex(lambda c: (c.empresa or "").strip().casefold()),
+            "email": GroupIndex(lambda c: normalize_email(c.email)),
+            "texto": TextIndex(contato_fields), #busca textual (core/search.py)
+            "name_trgm": TrigramIndex(lambda c: c.name), #busca aproximada (core/fuzzy.py)
+            "empresa_trgm": TrigramIndex(lambda c: c.empresa)
+        })
+        self.campanhas = IndexedCollection(indexes={
+            "texto": TextIndex(campanha_fields)
+        })
+        self.leads = IndexedCollection(indexes={
+            "id": SortedIndex(lambda l: l.id),
+            "name": SortedIndex(lambda l: l.name.casefold()),
+            "created_at": SortedIndex(lambda l: l.created_ts or 0),
+            "score": SortedIndex(lambda l: l.score),
+            "source": GroupIndex(lambda l: l.source_code),
+            "converted": GroupIndex(lambda l: bool(l.converted)),
+            "email": GroupIndex(lambda l: normalize_email(l.email)),
+            "texto": TextIndex(lead_fields),
+            "name_trgm": TrigramIndex(lambda l: l.name)
+        })
+        self.documents = []
+
+    #--- acesso por id (O(1), usado pelas rotas da API) ---
+    def get_contato(self, contato_id):
+        return self.contatos.get(contato_id)
+
+    def get_lead(self, lead_id):
+        return self.leads.get(lead_id)
+
+    def get_campanha(self, campanha_id):
+        return self.campanhas.get(campanha_id)
+
+    #--- índice de estágio (código do estágio -> ids), mantido por append/pop e pelo save_change ---
+    def get_contatos_by_stage(self, stage):
+        return self.contatos.group("stage", SALES_STAGES.find(stage))
+
+    def count_by_stage(self): #{código do estágio: quantidade de contatos}
+        return self.contatos.group_counts("stage")
+
+    def funnel(self): #funil e transições de estágio de todos os contatos (core/analytics.py)
+        #contato sem histórico (registro antigo) conta no estágio atual, como nas métricas
+        return funnel_report([c.stage_codes or (c.stage_code,) for c in self.contatos])
+
+    #--- envio de campanhas (core/delivery.py) ---
+    def campaign_sender(self):
+        if self._sender is None:
+            config = SMTP_CONFIG if EMAIL_TRANSPORT.lower() == "smtp" else {}
+            transport = create_transport(EMAIL_TRANSPORT, rate_limit=SEND_RATE_LIMIT, **config)
+            self._sender = CampaignSender(transport, SEND_BATCH_SIZE, SEND_WORKERS)
+        return self._sender
+
+    def send_campaign(self, campanha, progresso=None):
+        #envia para o público que ainda não recebeu (ou continua o envio que foi interrompido: a fila
+        #gravada no início). Cada lote grava só o seu checkpoint (ids enviados e falhas) junto com os
+        #contatos; a campanha inteira só é regravada no começo e no fim. Se o processo cair no meio de
+        #um lote, esse lote pode ser enviado de novo (no máximo CRM_SEND_BATCH_SIZE emails repetidos)
+        with self._envio_lock:
+            return self._send_campaign(campanha, progresso)
+
+    def _send_campaign(self, campanha, progresso):
+        retomado = campanha.em_andamento
+        if not retomado:
+            campanha.start_send(c.id for c in self.campaign_audience(campanha) if c.id not in campanha.enviados)
+            self.save_change("campanhas", campanha)
+        destinatarios = []
+        for contato_id in sorted(campanha.fila):
+            contato = self.contatos.get(contato_id)
+            if contato is not None and contato_id not in campanha.enviados:
+                destinatarios.append(contato)
+            else: #removido ou já recebeu depois que a fila foi montada
+                campanha.fila.discard(contato_id)
+
+        def registrar(enviados, falhas, resumo):
+            with self.transacao():
+                checkpoint = campanha.record_batch([c.id for c in enviados], {c.id: erro for c, erro in falhas})
+                for contato in enviados:
+                    contato.activities.append(Atividade("Email", f"Enviado: {campanha.title}"))
+                    self.save_change("contatos", contato)
+                self._escrever(("append", "envios", checkpoint, None))
+            if progresso is not None:
+                progresso(resumo)
+
+        with self.compactacao_adiada():
+            relatorio = self.campaign_sender().send(campanha, destinatarios, registrar)
+            if not relatorio["interrompido"]:
+                campanha.finish_send()
+            self.save_change("campanhas", campanha)
+        relatorio["retomado"] = retomado
+        return relatorio
+
+    #--- agendamento de campanhas (core/scheduler.py) ---
+    def schedule_campaign(self, campanha, quando_ts, repetir_min=None):
+        #horário no passado: sai assim que o agendador acordar
+        campanha.schedule(quando_ts, repetir_min)
+        self.save_change("campanhas", campanha)
+        self._scheduler.schedule(campanha.id, quando_ts)
+
+    def cancel_campaign_schedule(self, campanha):
+        campanha.cancel_schedule()
+        self.save_change("campanhas", campanha)
+        self._scheduler.cancel(campanha.id)
+
+    def campaign_schedule(self, campanha): #estado do agendamento para a API
+        ultimo = dict(campanha.ultimo_envio) if campanha.ultimo_envio else None
+        if ultimo is not None:
+            ultimo["em"] = format_timestamp(ultimo.get("ts"), DATETIME_FORMAT)
+        return {
+            "campanha_id": campanha.id,
+            "status": campanha.status_agendamento or "nao_agendada",
+            "proximo_envio": format_timestamp(campanha.agendada_ts, DATETIME_FORMAT) or None,
+            "proximo_ts": campanha.agendada_ts,
+            "repetir_min": campanha.repetir_min,
+            "enviando_agora": self._scheduler.executando == campanha.id,
+            "ultimo_envio": ultimo,
+            "entregas": campanha.delivery_status(),
+            "limite_por_segundo": SEND_RATE_LIMIT or None
+        }
+
+    def _restore_schedules(self):
+        #agendamentos gravados voltam para o agendador; os que venceram com o processo parado
+        #(ou que caíram no meio do envio) saem logo, e o envio interrompido continua da fila
+        for campanha in self.campanhas:
+            if campanha.agendada_ts is not None and campanha.status_agendamento in ("agendada", "enviando"):
+                self._scheduler.schedule(campanha.id, campanha.agendada_ts)
+
+    def _run_scheduled(self, campanha_id): #roda na thread do agendador
+        campanha = self.campanhas.get(campanha_id)
+        if campanha is None or campanha.agendada_ts is None: #removida ou cancelada
+            return
+        quando = campanha.agendada_ts
+        campanha.status_agendamento = "enviando"
+        self.save_change("campanhas", campanha)
+        try:
+            relatorio = self.send_campaign(campanha) #o público é calculado agora, com o estágio atual dos contatos
         except Exception as e:
-            print(f"--- DEBUG: Erro inesperado ao carregar dados: {e} ---")
-            self.contatos, self.campanhas, self.leads, self.documents = [], [], [], []
+            campanha.status_agendamento = "erro"
+            campanha.ultimo_envio = {"ts": int(time.time()), "erro": str(e)}
+            self.save_change("campanhas", campanha)
+            raise
+        if relatorio["interrompido"]: #CRM fechando: fica "enviando" e continua no próximo início
+            return
+        agora = int(time.time())
+        campanha.ultimo_envio = {"ts": agora, "destinatarios": relatorio["destinatarios"],
+                                 "enviados": relatorio["enviados"], "falhas": relatorio["falhas"],
+                                 "segundos": relatorio["segundos"]}
+        if campanha.agendada_ts == quando: #não foi reagendada nem cancelada durante o envio
+            proximo = campanha.next_schedule(agora)
+            campanha.status_agendamento = "agendada" if proximo is not None else "concluida"
+            if proximo is not None:
+                self._scheduler.schedule(campanha.id, proximo)
+        self.save_change("campanhas", campanha)
+
+    def campaign_audience_estimate(self, campanha, amostra=5):
+        #prévia do envio sem enviar: tamanho do público pelo índice de estágio e quantos já receberam
+        #pela interseção com o conjunto de enviados (percorre o menor dos dois, nunca todos os contatos)
+        if self._normalize_text(campanha.target_stage, case="title") == "Todos":
+            filtro = {}
+            publico = len(self.contatos)
+        else:
+            filtro = {"name": "stage", "key": SALES_STAGES.find(campanha.target_stage)}
+            publico = self.contatos.group_size(**filtro)
+        ja_enviados = self.contatos.count_in(campanha.enviados, **filtro)
+        if campanha.em_andamento: #o próximo envio continua a fila gravada, não recalcula o público
+            a_enviar = len(campanha.fila)
+            exemplos = [c for c in (self.contatos.get(i) for i in itertools.islice(campanha.fila, amostra)) if c]
+        else:
+            a_enviar = publico - ja_enviados
+            exemplos = self.contatos.sample(amostra, campanha.enviados, **filtro)
+        return {
+            "campanha_id": campanha.id,
+            "target_stage": campanha.target_stage,
+            "publico": publico,
+            "ja_enviados": ja_enviados,
+            "a_enviar": a_enviar,
+            "falhas_anteriores": len(campanha.falhas),
+            "em_andamento": campanha.em_andamento,
+            "amostra": [{"id": c.id, "name": c.name, "email": c.email, "sales_stage": c.sales_stage} for c in exemplos]
+        }
+
+    def campaign_audience(self, campanha): #custa O(público), não O(todos os contatos)
+        if self._normalize_text(campanha.target_stage, case="title") == "Todos":
+            return list(self.contatos)
+        return self.get_contatos_by_stage(campanha.target_stage)
+
+    #--- índice de email (email normalizado -> ids): duplicados em O(1) ---
+    def find_contato_by_email(self, email):
+        return self._find_by_email(self.contatos, email)
+
+    def find_lead_by_email(self, email):
+        return self._find_by_email(self.leads, email)
+
+    def _find_by_email(self, colecao, email):
+        encontrados = colecao.group("email", normalize_email(email))
+        return encontrados[0] if encontrados else None
+
+    def register(self, entity, obj, policy=None):
+        #adiciona um contato/lead novo respeitando a política de email duplicado (padrão: DUPLICATE_POLICY)
+        #retorna (registro, criado): com merge/upsert o registro é o que já existia, atualizado
+        policy = DuplicatePolicy(policy) if policy is not None else DUPLICATE_POLICY
+        existente = getattr(self, entity).append_unique("email", obj)
+        if existente is None:
+            with self.transacao():
+                self.save_change(entity, obj)
+                self.notify(f"{_TIPOS[entity]}_created", obj)
+            return obj, True
+        if policy is DuplicatePolicy.REJECT:
+            raise DuplicateEmailError(entity, existente)
+        if combine(existente, obj, CAMPOS[entity], policy):
+            self.save_change(entity, existente)
+        return existente, False
+
+    #--- operações em massa (POST /contatos/bulk, /leads/bulk, /campanhas/bulk) ---
+    def bulk(self, entity, operacoes, policy=None):
+        #operacoes: ("create", objeto novo), ("update", id, {campo: valor}) ou ("delete", id); None é um item
+        #que já chegou inválido. Tudo é validado antes de mudar qualquer coisa: se algum item tiver erro nada
+        #é aplicado. Sem erros aplica remoções, atualizações e criações (nessa ordem: um email liberado no
+        #lote pode ser usado por outro item) numa transação só, gravada num write_batch.
+        #retorna (resultados por item, {}) ou (None, {índice do item: erro})
+        policy = DuplicatePolicy(policy) if policy is not None else DUPLICATE_POLICY
+        colecao = getattr(self, entity)
+        erros = {}
+        tocados = {} #id -> item que altera/remove aquele registro
+        for i, op in enumerate(operacoes):
+            if op is None or op[0] == "create":
+                continue
+            obj_id = op[1]
+            if obj_id not in colecao.ids():
+                erros[i] = f"ID {obj_id} não encontrado"
+            elif obj_id in tocados:
+                erros[i] = f"ID {obj_id} já aparece no item {tocados[obj_id]}"
+            else:
+                tocados[obj_id] = i
+        if entity != "campanhas":
+            self._bulk_checar_emails(entity, operacoes, policy, tocados, erros)
+        if erros or None in operacoes:
+            return None, erros
+
+        remover = {"contatos": self.remove_contato, "leads": self.remove_lead, "campanhas": self.remove_campanha}[entity]
+        resultados = [None] * len(operacoes)
+        ordem = sorted(range(len(operacoes)), key=lambda i: _ORDEM_BULK[operacoes[i][0]])
+        desfazer = [] #(registro, valores antigos ou None se ele foi criado, removido?) na ordem aplicada
+        i = None
+        try:
+            with self.compactacao_adiada(), self.transacao(atomica=True):
+                for i in ordem:
+                    op = operacoes[i]
+                    if op[0] == "delete":
+                        desfazer.append((remover(op[1]), None, True))
+                        resultados[i] = {"op": "delete", "id": op[1], "status": "removido"}
+                    elif op[0] == "update":
+                        obj = colecao.get(op[1])
+                        desfazer.append((obj, {campo: getattr(obj, campo) for campo in op[2]}, False))
+                        for campo, valor in op[2].items():
+                            setattr(obj, campo, valor)
+                        self.save_change(entity, obj)
+                        resultados[i] = {"op": "update", "id": obj.id, "status": "atualizado"}
+                    elif entity == "campanhas":
+                        self.add_campanha(op[1])
+                        desfazer.append((op[1], None, False))
+                        resultados[i] = {"op": "create", "id": op[1].id, "status": "criado"}
+                    else:
+                        dono = self._find_by_email(colecao, op[1].email)
+                        if dono is not None: #merge/upsert altera o registro que já existe
+                            desfazer.append((dono, {campo: getattr(dono, campo) for campo in CAMPOS[entity]}, False))
+                        registro, criado = self.register(entity, op[1], policy)
+                        if criado:
+                            desfazer.append((registro, None, False))
+                        resultados[i] = {"op": "create", "id": registro.id, "status": "criado" if criado else "combinado"}
+        except Exception as e: #nada foi gravado (transação atômica): desfaz na memória também
+            self._bulk_desfazer(entity, desfazer)
+            if isinstance(e, ValueError):
+                return None, {i: str(e)}
+            raise
+        return resultados, {}
+
+    def _bulk_desfazer(self, entity, desfazer):
+        colecao = getattr(self, entity)
+        for obj, antigos, removido in reversed(desfazer):
+            if removido:
+                colecao.put(obj)
+                if entity == "campanhas" and obj.agendada_ts is not None and obj.status_agendamento in ("agendada", "enviando"):
+                    self._scheduler.schedule(obj.id, obj.agendada_ts)
+            elif antigos is None: #criado no lote
+                colecao.pop(obj.id)
+            else:
+                for campo, valor in antigos.items():
+                    setattr(obj, campo, valor)
+                colecao.refresh(obj)
+        self.metrics.rebuild(self) #os observers síncronos já tinham contado os eventos do lote
+
+    def _bulk_checar_emails(self, entity, operacoes, policy, tocados, erros):
+        #email é único: no máximo um item do lote por email, e quem já tem o email precisa estar saindo dele
+        #(removido ou atualizado para outro email no mesmo lote) ou ser o próprio registro atualizado
+        colecao = getattr(self, entity)
+        novos = {op[1]: normalize_email(op[2]["email"]) for op in operacoes if op is not None and op[0] == "update"}
+        donos = {} #email normalizado -> item do lote que fica com ele
+        for i, op in enumerate(operacoes):
+            if op is None or op[0] == "delete" or i in erros:
+                continue
+            email = op[1].email if op[0] == "create" else op[2]["email"]
+            chave = normalize_email(email)
+            if chave in donos:
+                erros[i] = f"Email '{email}' repetido no item {donos[chave]}"
+                continue
+            donos[chave] = i
+            dono = self._find_by_email(colecao, email)
+            if dono is None or (op[0] == "update" and dono.id == op[1]):
+                continue
+            if dono.id in tocados and (dono.id not in novos or novos[dono.id] != chave): #removido ou mudando de email
+                continue
+            if op[0] == "update":
+                erros[i] = f"Email já usado pelo registro com ID {dono.id}"
+            elif policy is DuplicatePolicy.REJECT:
+                erros[i] = str(DuplicateEmailError(entity, dono))
+            elif dono.id in tocados:
+                erros[i] = f"O registro com este email (ID {dono.id}) também é alterado no item {tocados[dono.id]}"
+
+    #--- busca textual (nome, email, empresa, notas, atividades, campanhas) ---
+    def search(self, query, limit=20, tipos=None):
+        #[(pontuação, tipo, objeto)] dos melhores resultados entre contatos, leads e campanhas
+        resultados = []
+        for tipo, entity in SEARCH_ENTITIES.items():
+            if tipos and tipo not in tipos:
+                continue
+            resultados.extend((score, tipo, item) for score, item in getattr(self, entity).search("texto", query, limit))
+        return heapq.nlargest(limit, resultados, key=lambda r: r[0])
+
+    #--- busca aproximada por nome/empresa (trigramas): tolera erro de digitação e falta de acento ---
+    def fuzzy_find(self, entity, query, limit=10, filtro=None):
+        #[(semelhança, objeto)]; com vários índices (nome e empresa) vale a maior semelhança do item
+        colecao = getattr(self, entity)
+        melhores = {}
+        busca = limit if filtro is None else max(limit * 5, 50) #folga para o que o filtro descartar
+        for name in FUZZY_INDEXES[entity]:
+            for score, item in colecao.search(name, query, busca):
+                if score > melhores.get(item.id, (0,))[0]:
+                    melhores[item.id] = (score, item)
+        resultados = [r for r in melhores.values() if filtro is None or filtro(r[1])]
+        return heapq.nlargest(limit, resultados, key=lambda r: r[0])
+
+    def _escolher(self, entity, itens, formatar, prompt, filtro=None):
+        #seleção na CLI: com um termo mostra só os mais parecidos em vez da lista inteira
+        termo = input("Buscar por nome (enter para listar todos): ").strip()
+        if termo:
+            itens = [item for _, item in self.fuzzy_find(entity, termo, limit=10, filtro=filtro)]
+            if not itens:
+                print(f"Nada parecido com '{termo}'.")
+                return None
+        for i, item in enumerate(itens, 1):
+            print(f"{i}. {formatar(item)}")
+        
+        idx = SafeInput.get_number(prompt, min_val=1, max_val=len(itens))
+        return None if idx is None else itens[idx - 1]
+
+    def _escolher_contato(self, prompt="Escolha o contato (número): "):
+        return self._escolher(
+            "contatos", self.contatos,
+            lambda c: f"{c.name} - {c.email} - {c.sales_stage}" + (f" ({c.empresa})" if c.empresa else ""),
+            prompt
+        )
+
+    def remove_contato(self, contato_id): #remove e persiste, retorna None se não existir
+        return self._remove("contatos", contato_id)
+
+    def remove_lead(self, lead_id):
+        return self._remove("leads", lead_id)
+
+    def remove_campanha(self, campanha_id):
+        self._scheduler.cancel(campanha_id)
+        return self._remove("campanhas", campanha_id)
+
+    def _remove(self, entity, obj_id):
+        obj = getattr(self, entity).pop(obj_id)
+        if obj is not None:
+            with self.transacao():
+                self.save_delete(entity, obj_id)
+                self.notify(f"{_TIPOS[entity]}_deleted", obj)
+        return obj
+
+    def add_campanha(self, campanha):
+        self.campanhas.append(campanha)
+        with self.transacao():
+            self.save_change("campanhas", campanha)
+            self.notify("campanha_created", campanha)
+
+    def set_stage(self, contato, stage, registrar_atividade=False):
+        #muda o estágio, persiste e avisa os observers (métricas, notificações)
+        old_stage = contato.sales_stage
+        contato.change_stage(stage)
+        if registrar_atividade:
+            contato.activities.append(Atividade(
+                "stage_change",
+                f"Estágio alterado de '{old_stage}' para '{contato.sales_stage}'"
+            ))
+        with self.transacao():
+            self.save_change("contatos", contato)
+            self.notify("stage_changed", {
+                "contato": contato,
+                "old_stage": old_stage,
+                "new_stage": contato.sales_stage
+            })
+        return old_stage
 
     def add_contato(self):
         print("\n=== Novo contato ===")
@@ -106,6 +713,9 @@ class CRM(Subject):
         if email is None:
             print("Operação cancelada.")
             return
+        if DUPLICATE_POLICY is DuplicatePolicy.REJECT and self.find_contato_by_email(email):
+            print(f"❌ Já existe um contato com o email '{email}'.")
+            return
         
         telefone = SafeInput.get_phone("Telefone: ")
         if telefone is None:
@@ -199,10 +809,11 @@ class CRM(Subject):
             else:
                 builder.with_activity("cadastro", "Contato cadastrado no sistema")
             
-            contato = builder.build()
-            self.contatos.append(contato)
-            self.save_data()
-            print("✅ Contato criado com sucesso!")
+            contato, criado = self.register("contatos", builder.build())
+            if criado:
+                print("✅ Contato criado com sucesso!")
+            else:
+                print(f"✅ Email já cadastrado: dados combinados com o contato existente ({contato.name}).")
             
         except ValidationError as e:
             print(f"❌ Erro de validação: {e}")
@@ -220,6 +831,23 @@ class CRM(Subject):
         for i, c in enumerate(self.contatos):
             print(f"{i+1}. {c.name} - {c.email} - {c.sales_stage}")
 
+    def buscar(self):
+        print("\n=== Buscar ===")
+        query = input("Buscar (nome, email, empresa, notas, atividades, campanhas): ").strip()
+        if not query:
+            print("Operação cancelada.")
+            return
+        
+        resultados = self.search(query, limit=20)
+        if not resultados:
+            print(f"Nada encontrado para '{query}'.")
+            return
+        
+        print(f"\n=== Resultados para '{query}' ===")
+        for i, (score, tipo, item) in enumerate(resultados, 1):
+            titulo, detalhe = hit_label(tipo, item)
+            print(f"{i}. [{tipo}] {titulo} - {detalhe}")
+
     def change_user_role(self):
         print("\nPerfis disponíveis:")
         print("1. Gerente")
@@ -280,21 +908,15 @@ class CRM(Subject):
             associado = False
             
             if response == 's':
-                self.listar_contatos()
-                
-                idx = SafeInput.get_number(
-                    "Escolha o contato (número): ",
-                    min_val=1,
-                    max_val=len(self.contatos)
-                )
+                contato_selecionado = self._escolher_contato()
                 
-                if idx:
-                    contato_selecionado = self.contatos[idx - 1]
+                if contato_selecionado:
                     contato_selecionado.documents.append(doc)
                     print(f"✅ Documento associado ao contato {contato_selecionado.name}.")
                     associado = True
+                    self.save_change("contatos", contato_selecionado)
             
-            self.save_data()
+            self.save_change("documents", doc)
             
             if not associado:
                 print("✅ Documento adicionado ao sistema, mas sem associação.")
@@ -324,6 +946,9 @@ class CRM(Subject):
         if email is None:
             print("Operação cancelada.")
             return
+        if DUPLICATE_POLICY is DuplicatePolicy.REJECT and self.find_lead_by_email(email):
+            print(f"❌ Já existe um lead com o email '{email}'.")
+            return
         
         fontes_disponiveis = [source.value for source in LeadSource]
         print(f"\nFontes disponíveis:")
@@ -362,9 +987,11 @@ class CRM(Subject):
                 email=email,
                 source=source
             )
-            self.leads.append(new_lead)
-            self.save_data()
-            print(f"✅ Lead adicionado com sucesso! Pontuação inicial: {new_lead.score}")
+            lead, criado = self.register("leads", new_lead)
+            if criado:
+                print(f"✅ Lead adicionado com sucesso! Pontuação inicial: {lead.score}")
+            else:
+                print(f"✅ Email já cadastrado: dados combinados com o lead existente ({lead.name}).")
             
         except ValidationError as e:
             print(f"❌ Erro de validação: {e}")
@@ -382,49 +1009,112 @@ class CRM(Subject):
                 **compatible_data
             )
             
-            self.leads.append(new_lead)
-            self.save_data()
-            print(f"✅ Lead importado e adaptado com sucesso! ({new_lead.name})")
+            lead, criado = self.register("leads", new_lead)
+            if criado:
+                print(f"✅ Lead importado e adaptado com sucesso! ({lead.name})")
+            else:
+                print(f"✅ Lead já existia com esse email: dados combinados ({lead.name}).")
 
+        except DuplicateEmailError as e:
+            print(f"❌ Lead não importado: {e}")
         except Exception as e: 
             print(f"Erro inesperado durante adaptação: {e}")
         
     def attach(self, observer):
+        if not observer.synchronous:
+            if self._bus is not None:
+                self._bus.subscribe(observer)
+            self._outbox.start() #com alguém para receber, os eventos pendentes (até os recuperados) são entregues
         self._observers.append(observer)
+        self._rotas = {} #a tabela é refeita aos poucos, conforme os eventos forem chegando
         
     def detach(self, observer):
         self._observers.remove(observer)
+        self._rotas = {}
+        if self._bus is not None:
+            self._bus.unsubscribe(observer)
+
+    def _interessados(self, event):
+        #quem assina o evento (Observer.events) ou aceita tudo pelo can_handle; o resultado fica na
+        #tabela, então cada notificação só passa pelos observers daquele evento
+        rotas = self._rotas
+        observers = rotas.get(event)
+        if observers is None:
+            interessados = []
+            for observer in self._observers:
+                try:
+                    if observer.can_handle(event):
+                        interessados.append(observer)
+                except Exception as e:
+                    print(f"Erro ao notificar {observer.__class__.__name__}: {e}")
+            observers = rotas[event] = tuple(interessados)
+        return observers
     
     def notify(self, event, data):
-        for observer in self._observers:
+        assincronos = False
+        for observer in self._interessados(event):
+            if self._bus is not None and not observer.synchronous:
+                assincronos = True
+                continue
             try:
-                if observer.can_handle(event):
-                    observer.update(self, event, data)
+                observer.update(self, event, data)
             except Exception as e:
                 print(f"Erro ao notificar {observer.__class__.__name__}: {e}")
+        if not assincronos:
+            return
+        if OUTBOX: #grava o evento (na transação da mudança, se houver) e a thread do outbox entrega
+            record = self._outbox.novo(event, data, _TIPOS_OUTBOX)
+            self._escrever(("upsert", "outbox", record, record["id"]))
+        else:
+            for observer in self._interessados(event):
+                if not observer.synchronous:
+                    self._bus.publish(observer, self, event, data) #só enfileira: a entrega é na thread do observer
+
+    def _entregar_outbox(self, lote): #chamado pela thread do outbox, um lote por vez
+        for record, data in lote:
+            event = record["event"]
+            if data is None: #recuperado do disco: volta a ser objeto (o do CRM, se ainda existir)
+                data = desserializar(record["data"], _CLASSES_OUTBOX, self._objeto_vivo)
+            for observer in self._interessados(event):
+                if observer.synchronous: #esses já receberam na hora (e as métricas são recalculadas na carga)
+                    continue
+                if self._bus is not None:
+                    self._bus.publish(observer, self, event, data)
+                else:
+                    try:
+                        observer.update(self, event, data)
+                    except Exception as e:
+                        print(f"Erro ao notificar {observer.__class__.__name__}: {e}")
+        if self._bus is not None:
+            self._bus.drain() #a baixa no outbox só acontece depois que os observers processaram o lote
+
+    def _objeto_vivo(self, tipo, obj_id):
+        entity = SEARCH_ENTITIES.get(tipo)
+        return getattr(self, entity).get(obj_id) if entity else None
+
+    def drain_events(self, timeout=None): #espera os observers terminarem os eventos já publicados
+        return self._bus.drain(timeout) if self._bus is not None else True
+
+    def event_stats(self):
+        return self._bus.stats() if self._bus is not None else {}
         
     def converter_lead(self):
-        ativos = [l for l in self.leads if not l.converted]
+        ativos = self.leads.group("converted", False)
         if not ativos:
             print("Nenhum lead disponível para conversão.")
             return
 
         print("\n=== Leads para converter ===")
-        for i, l in enumerate(ativos):
-            print(f"{i+1}. {l.name} - {l.email} - Fonte: {l.source}")
-        
-        idx = SafeInput.get_number(
+        lead = self._escolher(
+            "leads", ativos,
+            lambda l: f"{l.name} - {l.email} - Fonte: {l.source}",
             "Escolha um lead (número): ",
-            min_val=1,
-            max_val=len(ativos)
+            filtro=lambda l: not l.converted
         )
-        
-        if idx is None:
+        if lead is None:
             print("Operação cancelada.")
             return
         
-        lead = ativos[idx - 1]
-        
         telefone = SafeInput.get_phone("Telefone: ")
         if telefone is None:
             print("Operação cancelada.")
@@ -434,19 +1124,11 @@ class CRM(Subject):
         notes = f"Convertido de lead (Fonte: {lead.source})"
         
         try:
-            contato = PessoaFactoryManager.create_person(
-                'contato',
-                name=lead.name,
-                email=lead.email,
-                telefone=telefone,
-                empresa=empresa,
-                notas=notes
-            )
-            self.contatos.append(contato)
-            lead.converted = True
-            self.save_data()
-            print("✅ Lead convertido em contato!")
-            self.notify(event="lead_converted", data=contato)
+            contato, criado = self.convert_lead(lead, telefone=telefone, empresa=empresa, notas=notes)
+            if criado:
+                print("✅ Lead convertido em contato!")
+            else:
+                print(f"✅ Lead convertido: o email já era do contato {contato.name}, que foi completado com os dados do lead.")
             
         except ValidationError as e:
             print(f"❌ Erro de validação: {e}")
@@ -455,25 +1137,34 @@ class CRM(Subject):
         except Exception as e:
             print(f"❌ Erro inesperado: {e}")
 
+    def convert_lead(self, lead, telefone, empresa="", notas=""):
+        #se já existe contato com o email do lead (busca pelo índice de email), o lead é ligado a ele
+        #(merge: só preenche o que estiver vazio) em vez de criar um contato duplicado
+        contato = PessoaFactoryManager.create_person(
+            'contato',
+            name=lead.name,
+            email=lead.email,
+            telefone=telefone,
+            empresa=empresa,
+            notas=notas
+        )
+        with self.transacao(): #contato, lead convertido e os eventos num write_batch só
+            contato, criado = self.register("contatos", contato, policy=DuplicatePolicy.MERGE)
+            lead.converted = True
+            self.save_change("leads", lead)
+            self.notify(event="lead_converted", data=contato)
+        return contato, criado
+
     def add_atividade(self):
         if not self.contatos:
             print("Nenhum contato cadastrado.")
             return
         
-        self.listar_contatos()
-        
-        idx = SafeInput.get_number(
-            "Escolha o contato (número): ",
-            min_val=1,
-            max_val=len(self.contatos)
-        )
-        
-        if idx is None:
+        contato_selecionado = self._escolher_contato()
+        if contato_selecionado is None:
             print("Operação cancelada.")
             return
         
-        contato_selecionado = self.contatos[idx - 1]
-        
         valid_activities = ['chamada', 'email', 'reunião', 'cadastro', 'outro']
         print(f"\nTipos de atividade:")
         for i, activity in enumerate(valid_activities, 1):
@@ -508,12 +1199,12 @@ class CRM(Subject):
         try:
             new_activity = Atividade(tipo, desc)
             contato_selecionado.activities.append(new_activity)
-            self.save_data()
-            
-            self.notify("activity_added", {
-                "contato": contato_selecionado,
-                "activity": new_activity
-            })
+            with self.transacao():
+                self.save_change("contatos", contato_selecionado)
+                self.notify("activity_added", {
+                    "contato": contato_selecionado,
+                    "activity": new_activity
+                })
             
             print("✅ Atividade registrada!")
             
@@ -525,20 +1216,11 @@ class CRM(Subject):
             print("Nenhum contato cadastrado.")
             return
         
-        self.listar_contatos()
-        
-        idx = SafeInput.get_number(
-            "Escolha o contato (número): ",
-            min_val=1,
-            max_val=len(self.contatos)
-        )
-        
-        if idx is None:
+        contato = self._escolher_contato()
+        if contato is None:
             print("Operação cancelada.")
             return
         
-        contato = self.contatos[idx - 1]
-        
         titulo = input("Título da tarefa: ").strip()
         if not titulo:
             print("❌ Título não pode estar vazio.")
@@ -551,7 +1233,7 @@ class CRM(Subject):
         
         try:
             contato.tasks.append(Task(titulo, data))
-            self.save_data()
+            self.save_change("contatos", contato)
             print("✅ Tarefa adicionada!")
             
         except Exception as e:
@@ -563,20 +1245,11 @@ class CRM(Subject):
             print("Nenhum contato cadastrado.")
             return
         
-        self.listar_contatos()
-        
-        idx = SafeInput.get_number(
-            "Escolha o contato para ver as tarefas (número): ",
-            min_val=1,
-            max_val=len(self.contatos)
-        )
-        
-        if idx is None:
+        contato = self._escolher_contato("Escolha o contato para ver as tarefas (número): ")
+        if contato is None:
             print("Operação cancelada.")
             return
         
-        contato = self.contatos[idx - 1]
-        
         tarefas_pendentes = [task for task in contato.tasks if not task.completed]
         
         if not tarefas_pendentes:
@@ -605,12 +1278,12 @@ class CRM(Subject):
                 Atividade("tarefa_concluida", f"Tarefa concluída: {tarefa_concluida.title}")
             )
             
-            self.save_data()
-            
-            self.notify("task_completed", {
-                "contato": contato,
-                "task": tarefa_concluida
-            })
+            with self.transacao():
+                self.save_change("contatos", contato)
+                self.notify("task_completed", {
+                    "contato": contato,
+                    "task": tarefa_concluida
+                })
             
             print(f"✅ Tarefa '{tarefa_concluida.title}' marcada como concluída!")
             print("📝 Atividade de conclusão registrada automaticamente.")
@@ -623,19 +1296,10 @@ class CRM(Subject):
             print("Nenhum contato cadastrado.")
             return
         
-        self.listar_contatos()
-        
-        idx = SafeInput.get_number(
-            "Escolha o contato (número): ",
-            min_val=1,
-            max_val=len(self.contatos)
-        )
-        
-        if idx is None:
+        contato = self._escolher_contato()
+        if contato is None:
             print("Operação cancelada.")
             return
-        
-        contato = self.contatos[idx - 1]
         old_stage = contato.sales_stage
         
         print(f"\nEstágio atual: {old_stage}")
@@ -667,17 +1331,8 @@ class CRM(Subject):
                 return
         
         try:
-            contato.sales_stage = novo
-            contato.stage_history.append(novo)
-            self.save_data()
-            
-            self.notify("stage_changed", {
-                "contato": contato,
-                "old_stage": old_stage,
-                "new_stage": novo
-            })
-            
-            print(f"✅ Estágio atualizado: {old_stage} → {novo}")
+            self.set_stage(contato, novo)
+            print(f"✅ Estágio atualizado: {old_stage} → {contato.sales_stage}")
             
         except Exception as e:
             print(f"❌ Erro ao atualizar estágio: {e}")
@@ -767,8 +1422,7 @@ class CRM(Subject):
                         builder.with_recipients(recipient_ids)
             
             campanha = builder.build()
-            self.campanhas.append(campanha)
-            self.save_data()
+            self.add_campanha(campanha)
             
             print("✅ Campanha criada com sucesso!")
             if hasattr(campanha, 'sent_to') and campanha.sent_to:
@@ -803,54 +1457,70 @@ class CRM(Subject):
         
         try:
             campanha = self.campanhas[idx - 1]
-            enviados = 0
-            
-            for contato in self.contatos:
-                contato_stage_norm = self._normalize_text(contato.sales_stage, case="title")
-                target_stage_norm = self._normalize_text(campanha.target_stage, case="title")
-                
-                stage_match = (contato_stage_norm == target_stage_norm or target_stage_norm == "Todos")
-                not_sent = contato.id not in campanha.sent_to
-                
-                if stage_match and not_sent:
-                    campanha.sent_to.append(contato.id)
-                    contato.activities.append(Atividade("Email", f"Enviado: {campanha.title}"))
-                    enviados += 1
-            
-            if enviados > 0:
-                self.save_data()
-                print(f"✅ Campanha enviada com sucesso para {enviados} contato(s).")
+            def mostrar_lote(lote):
+                print(f"Lote {lote['lote']}: {lote['enviados']} enviado(s), {lote['falhas']} falha(s) "
+                      f"({lote['por_segundo']} emails/s)")
+                for erro in lote["erros"][:5]:
+                    print(f"   ❌ {erro['email']}: {erro['erro']}")
+
+            previa = self.campaign_audience_estimate(campanha)
+            print(f"\n--- Prévia: {campanha.title} (alvo: {campanha.target_stage}) ---")
+            print(f"Público: {previa['publico']} contato(s), {previa['ja_enviados']} já receberam")
+            if campanha.em_andamento:
+                print(f"↻ Retomando envio interrompido: {previa['a_enviar']} destinatário(s) ainda na fila.")
             else:
+                print(f"Receberão agora: {previa['a_enviar']} contato(s)")
+            for exemplo in previa["amostra"]:
+                print(f"   • {exemplo['name']} <{exemplo['email']}> ({exemplo['sales_stage']})")
+            if not previa["a_enviar"]:
                 print("⚠️  Nenhum contato encontrado para esta campanha.")
+                return
+            print("Confirmar envio? (s/n)")
+            if SafeInput.get_choice("", ['s', 'n'], case_sensitive=False) != 's':
+                print("Envio cancelado.")
+                return
+            relatorio = self.send_campaign(campanha, progresso=mostrar_lote)
+            if relatorio["enviados"] > 0:
+                print(f"✅ Campanha enviada com sucesso para {relatorio['enviados']} contato(s) "
+                      f"em {relatorio['segundos']}s ({relatorio['por_segundo']} emails/s).")
+            elif not relatorio["destinatarios"]:
+                print("⚠️  Nenhum contato encontrado para esta campanha.")
+            if relatorio["falhas"]:
+                print(f"⚠️  {relatorio['falhas']} envio(s) falharam; eles serão tentados de novo no próximo envio.")
         
         except Exception as e:
             print(f"❌ Erro ao enviar campanha: {e}")
 
     def report_summary(self):
         print("\n=== Relatório geral ===")
-        print(f"Total de contatos: {len(self.contatos)}")
-        print(f"Total de leads: {len([l for l in self.leads if not l.converted])}")
-        print(f"Total de campanhas: {len(self.campanhas)}")
+        #os totais vêm prontos das métricas (core/metrics.py), sem percorrer contatos e leads
+        print(f"Total de contatos: {self.metrics.total_contatos}")
+        print(f"Total de leads: {self.metrics.leads_ativos}")
+        print(f"Total de campanhas: {self.metrics.total_campanhas}")
         print(f"Total de documentos: {len(self.documents)}")
         
-        #Relatório por estágio - normaliza os estágios para agrupamento consistente
-        estagios_padrao = ["Lead", "Prospecto", "Proposta", "Negociação", "Venda Fechada"]
-        por_estagio = {estagio: 0 for estagio in estagios_padrao}
-        
-        for c in self.contatos:
-            stage_normalizado = self._normalize_text(c.sales_stage, case="title")
-            if stage_normalizado in por_estagio:
-                por_estagio[stage_normalizado] += 1
-            else:
-                #Se o estágio não está nos padrões, adiciona como "Outros"
-                if "Outros" not in por_estagio:
-                    por_estagio["Outros"] = 0
-                por_estagio["Outros"] += 1
+        #Relatório por estágio
+        por_codigo = Counter(self.metrics.por_estagio)
+        por_estagio = {SALES_STAGES.name(code): por_codigo.pop(code, 0) for code in SALES_STAGES.standard_codes()}
+        if por_codigo: #Se o estágio não está nos padrões, conta como "Outros"
+            por_estagio["Outros"] = sum(por_codigo.values())
         
         print("\n--- Distribuição por estágio ---")
         for estagio, qtd in por_estagio.items():
             if qtd > 0:  #Só mostra estágios que têm contatos
                 print(f"{estagio}: {qtd} contato(s)")
+        
+        funil = self.funnel()
+        if not funil["total_contatos"]:
+            return
+        print("\n--- Funil de vendas (pelo histórico de estágios) ---")
+        for etapa in funil["funil"]:
+            print(f"{etapa['estagio']}: {etapa['alcancaram']} chegaram ({etapa['conversao_total']}% do total, "
+                  f"{etapa['conversao_etapa']}% da etapa anterior) - {etapa['taxa_desistencia']}% pararam aqui")
+        
+        print("\n--- Transições mais comuns ---")
+        for t in funil["transicoes"][:5]:
+            print(f"{t['de']} → {t['para']}: {t['quantidade']}")
 
     def get_menu_by_role(self):
         strategy = self._menu_strategies.get(self.current_user_role, ClienteMenuStrategy())
@@ -0,0 +1,39 @@
+from enum import Enum
+
+#Detecção de email duplicado ao criar contatos e leads. A busca usa o índice "email"
+#das coleções (email normalizado -> ids), então custa O(1) em vez de percorrer tudo.
+
+class DuplicatePolicy(Enum):
+    REJECT = "reject" #não cria: erro de email duplicado
+    MERGE = "merge"   #mantém o registro existente e só preenche os campos que estão vazios nele
+    UPSERT = "upsert" #atualiza o registro existente com os dados novos
+
+class DuplicateEmailError(ValueError):
+    def __init__(self, entity, existente):
+        self.entity = entity
+        self.existente = existente
+        super().__init__(f"Já existe um registro em {entity} com o email '{existente.email}' (ID {existente.id})")
+
+#campos que o merge/upsert copiam do registro novo para o que já existia (o email é o mesmo)
+CAMPOS = {
+    "contatos": ("name", "telefone", "empresa", "notas"),
+    "leads": ("name", "source")
+}
+
+def normalize_email(email):
+    return (email or "").strip().casefold()
+
+def _vazio(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+def combine(existente, novo, campos, policy): #aplica a política de merge/upsert no registro existente
+    alterou = False
+    for campo in campos:
+        valor = getattr(novo, campo)
+        if _vazio(valor):
+            continue #dado novo vazio nunca apaga o que já existe
+        if policy is DuplicatePolicy.UPSERT or _vazio(getattr(existente, campo)):
+            if getattr(existente, campo) != valor:
+                setattr(existente, campo, valor)
+                alterou = True
+    return alterou
@@ -0,0 +1,272 @@
+import base64
+import smtplib
+import ssl
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from email.header import Header
+from email.message import EmailMessage
+from email.policy import SMTP
+from email.utils import formatdate, make_msgid
+from functools import lru_cache
+
+#------------------------------ envio de campanhas ------------------------------
+#Os destinatários vão em lotes: cada lote é montado (uma mensagem por contato) e dividido entre as
+#threads, e cada thread envia a sua parte pela própria conexão do transporte, reaproveitada de um
+#lote para o outro. Depois de cada lote quem chamou recebe os enviados e as falhas (o CRM grava ali).
+
+class Mensagem:
+    __slots__ = ("contato", "para", "assunto", "corpo")
+
+    def __init__(self, contato, para, assunto, corpo):
+        self.contato = contato
+        self.para = para
+        self.assunto = assunto
+        self.corpo = corpo
+
+def render_batch(campanha, contatos):
+    #{nome}, {empresa} e {email} na descrição viram os dados de cada contato
+    #(replace em vez de format: chaves soltas no texto da campanha não quebram o envio)
+    modelo = campanha.description or ""
+    personalizado = "{" in modelo
+    mensagens = []
+    for contato in contatos:
+        corpo = modelo
+        if personalizado:
+            corpo = (corpo.replace("{nome}", contato.name)
+                     .replace("{empresa}", contato.empresa or "")
+                     .replace("{email}", contato.email))
+        mensagens.append(Mensagem(contato, contato.email, campanha.title, corpo))
+    return mensagens
+
+#------------------------------ transportes ------------------------------
+@lru_cache(maxsize=256)
+def _assunto(texto): #o assunto é o mesmo na campanha inteira: codifica uma vez só
+    return texto if texto.isascii() else Header(texto, "utf-8").encode()
+
+class EmailTransport(ABC): #interface que o envio usa, sem saber como o email sai
+    @abstractmethod
+    def send(self, mensagem: Mensagem) -> None: #levanta exceção se aquele destinatário falhar
+        pass
+
+    def close(self) -> None:
+        pass
+
+class SimulatedTransport(EmailTransport): #não entrega nada: só conta (o comportamento antigo do CRM)
+    def __init__(self):
+        self.enviados = 0
+        self._lock = threading.Lock()
+
+    def send(self, mensagem):
+        with self._lock:
+            self.enviados += 1
+
+class SmtpTransport(EmailTransport):
+    #uma conexão SMTP por thread, aberta no primeiro envio e reaproveitada até o close
+    def __init__(self, host, port=25, username=None, password=None, starttls=False, use_ssl=False,
+                 remetente="crm@localhost", timeout=30):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.use_ssl = use_ssl
+        self.remetente = remetente
+        self.timeout = timeout
+        self._dominio = remetente.rpartition("@")[2] or "localhost" #make_msgid sem domínio consulta o DNS a cada email
+        self._local = threading.local()
+        self._conexoes = []
+        self._lock = threading.Lock()
+        self.conexoes_abertas = 0
+
+    def _conectar(self):
+        if self.use_ssl:
+            conn = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout, context=ssl.create_default_context())
+        else:
+            conn = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            if self.starttls:
+                conn.starttls(context=ssl.create_default_context())
+        if self.username:
+            conn.login(self.username, self.password or "")
+        with self._lock:
+            self._conexoes.append(conn)
+            self.conexoes_abertas += 1
+        self._local.conn = conn
+        return conn
+
+    def _descartar(self, conn):
+        self._local.conn = None
+        with self._lock:
+            if conn in self._conexoes:
+                self._conexoes.remove(conn)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _bytes(self, mensagem):
+        #a mensagem montada à mão (texto em base64): o EmailMessage + flatten custava ~1ms por email,
+        #mais que o próprio envio. Endereço fora do ASCII fica com o pacote email, que sabe codificar
+        try:
+            cabecalho = (
+                f"From: {self.remetente}\r\nTo: {mensagem.para}\r\nSubject: {_assunto(mensagem.assunto)}\r\n"
+                f"Date: {formatdate(localtime=True)}\r\nMessage-ID: {make_msgid(domain=self._dominio)}\r\n"
+                "MIME-Version: 1.0\r\nContent-Type: text/plain; charset=utf-8\r\n"
+                "Content-Transfer-Encoding: base64\r\n\r\n"
+            ).encode("ascii")
+        except UnicodeEncodeError:
+            email = EmailMessage()
+            email["From"] = self.remetente
+            email["To"] = mensagem.para
+            email["Subject"] = mensagem.assunto
+            email.set_content(mensagem.corpo)
+            return email.as_bytes(policy=SMTP)
+        return cabecalho + base64.encodebytes(mensagem.corpo.encode("utf-8")).replace(b"\n", b"\r\n")
+
+    def send(self, mensagem):
+        raw = self._bytes(mensagem)
+        conn = getattr(self._local, "conn", None) or self._conectar()
+        try:
+            conn.sendmail(self.remetente, [mensagem.para], raw)
+        except smtplib.SMTPServerDisconnected: #o servidor fechou a conexão parada: reconecta uma vez
+            self._descartar(conn)
+            self._conectar().sendmail(self.remetente, [mensagem.para], raw)
+        except smtplib.SMTPRecipientsRefused:
+            raise #só este destinatário: a conexão continua boa
+        except (smtplib.SMTPException, OSError):
+            self._descartar(conn) #estado da conexão desconhecido: a próxima mensagem abre outra
+            raise
+
+    def close(self):
+        with self._lock:
+            conexoes, self._conexoes = self._conexoes, []
+        for conn in conexoes:
+            try:
+                conn.quit()
+            except Exception:
+                conn.close()
+
+class RateLimiter: #token bucket: no máximo `por_segundo` em média, com rajadas de até `rajada`
+    def __init__(self, por_segundo, rajada=None):
+        self.por_segundo = por_segundo
+        self.rajada = rajada or max(1, int(por_segundo))
+        self._tokens = float(self.rajada)
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                agora = time.monotonic()
+                self._tokens = min(self.rajada, self._tokens + (agora - self._ultimo) * self.por_segundo)
+                self._ultimo = agora
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                espera = (1 - self._tokens) / self.por_segundo
+            time.sleep(espera) #fora do lock: as outras threads também esperam a vez delas
+
+#DECORATOR de EmailTransport: o limite é do transporte, então vale para todas as threads e campanhas
+#que usam o mesmo transporte (ex: o limite de envios por segundo do provedor SMTP)
+class RateLimitedTransport(EmailTransport):
+    def __init__(self, inner: EmailTransport, por_segundo, rajada=None):
+        self._inner = inner
+        self.limiter = RateLimiter(por_segundo, rajada)
+
+    def send(self, mensagem):
+        self.limiter.acquire()
+        self._inner.send(mensagem)
+
+    def close(self):
+        self._inner.close()
+
+def create_transport(kind, rate_limit=0, **config):
+    kind = (kind or "simulado").lower()
+    if kind == "simulado":
+        transport = SimulatedTransport()
+    elif kind == "smtp":
+        transport = SmtpTransport(**config)
+    else:
+        raise ValueError(f"Transporte '{kind}' não suportado :( Transportes disponíveis: ['simulado', 'smtp']")
+    if rate_limit and rate_limit > 0:
+        return RateLimitedTransport(transport, rate_limit)
+    return transport
+
+#------------------------------ envio em lotes ------------------------------
+class CampaignSender:
+    #as threads (e com elas as conexões do transporte) ficam vivas entre um envio e outro, até o close
+    def __init__(self, transport: EmailTransport, batch_size=500, workers=8):
+        self.transport = transport
+        self.batch_size = batch_size
+        self.workers = workers
+        self._pool = None
+        self._lock = threading.Lock() #um envio por vez: os lotes de duas campanhas não se misturam no pool
+        self._parar = threading.Event()
+
+    def _enviar_parte(self, mensagens): #roda numa thread do pool: (contatos enviados, [(contato, erro)])
+        enviados, falhas = [], []
+        for mensagem in mensagens:
+            try:
+                self.transport.send(mensagem)
+                enviados.append(mensagem.contato)
+            except Exception as e:
+                falhas.append((mensagem.contato, str(e) or e.__class__.__name__))
+        return enviados, falhas
+
+    def send(self, campanha, destinatarios, on_batch=None):
+        #on_batch(enviados, falhas, resumo do lote) é chamado na thread de quem chamou, depois de cada lote
+        inicio = time.perf_counter()
+        lotes = []
+        total_enviados = total_falhas = 0
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="crm-envio")
+            pool = self._pool
+            for n, pos in enumerate(range(0, len(destinatarios), self.batch_size), 1):
+                if self._parar.is_set(): #desligando: o resto fica para depois (o CRM guarda a fila)
+                    break
+                inicio_lote = time.perf_counter()
+                mensagens = render_batch(campanha, destinatarios[pos:pos + self.batch_size])
+                tamanho = -(-len(mensagens) // self.workers) #divide o lote entre as threads
+                enviados, falhas = [], []
+                for parte_enviados, parte_falhas in pool.map(
+                        self._enviar_parte, [mensagens[i:i + tamanho] for i in range(0, len(mensagens), tamanho)]):
+                    enviados.extend(parte_enviados)
+                    falhas.extend(parte_falhas)
+                segundos = time.perf_counter() - inicio_lote
+                resumo = {
+                    "lote": n,
+                    "enviados": len(enviados),
+                    "falhas": len(falhas),
+                    "segundos": round(segundos, 3),
+                    "por_segundo": round(len(mensagens) / segundos, 1) if segundos else None,
+                    "erros": [{"contato_id": c.id, "email": c.email, "erro": erro} for c, erro in falhas]
+                }
+                lotes.append(resumo)
+                total_enviados += len(enviados)
+                total_falhas += len(falhas)
+                if on_batch is not None:
+                    on_batch(enviados, falhas, resumo)
+
+        segundos = time.perf_counter() - inicio
+        return {
+            "campanha_id": campanha.id,
+            "destinatarios": len(destinatarios),
+            "enviados": total_enviados,
+            "falhas": total_falhas,
+            "segundos": round(segundos, 3),
+            "por_segundo": round(len(destinatarios) / segundos, 1) if segundos and destinatarios else None,
+            "interrompido": total_enviados + total_falhas < len(destinatarios),
+            "lotes": lotes
+        }
+
+    def stop(self): #o envio em andamento termina o lote atual e para
+        self._parar.set()
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+            self.transport.close()
@@ -0,0 +1,122 @@
+import queue
+import threading
+import time
+from enum import Enum
+
+#------------------------------ barramento de eventos ------------------------------
+#O notify do CRM chamava cada observer na hora, dentro da operação do usuário: um notificador
+#lento (email, integração externa) segurava a conversão ou a mudança de estágio. Com o barramento,
+#cada observer tem a sua fila (limitada) e a sua thread: o notify só enfileira e volta, e um
+#observer lento ou com erro não atrasa nem derruba os outros. O Observer.update não muda.
+
+class Backpressure(Enum):
+    BLOCK = "block" #fila cheia: quem notifica espera (até put_timeout) a fila andar; depois descarta
+    DROP = "drop"   #fila cheia: o evento é descartado na hora (quem notifica nunca espera)
+
+_PARAR = object() #marca de fim na fila: tudo o que veio antes é entregue antes da thread parar
+
+class _Assinatura: #fila, thread e contadores de um observer
+    def __init__(self, bus, observer, queue_size):
+        self.observer = observer
+        self.fila = queue.Queue(maxsize=queue_size)
+        self.entregues = 0
+        self.descartados = 0
+        self.erros = 0
+        nome = f"crm-eventos-{observer.__class__.__name__}"
+        self.thread = threading.Thread(target=bus._run, args=(self,), name=nome, daemon=True)
+        self.thread.start()
+
+    def stats(self):
+        return {
+            "pendentes": self.fila.qsize(),
+            "entregues": self.entregues,
+            "descartados": self.descartados,
+            "erros": self.erros
+        }
+
+class EventBus:
+    def __init__(self, queue_size=1000, backpressure=Backpressure.BLOCK, put_timeout=0.5):
+        self.queue_size = queue_size
+        self.backpressure = Backpressure(backpressure)
+        self.put_timeout = put_timeout
+        self._assinaturas = {} #id(observer) -> _Assinatura
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def subscribe(self, observer):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Barramento de eventos já foi fechado")
+            if id(observer) not in self._assinaturas:
+                self._assinaturas[id(observer)] = _Assinatura(self, observer, self.queue_size)
+
+    def unsubscribe(self, observer): #entrega o que já estava na fila antes de soltar o observer
+        with self._lock:
+            assinatura = self._assinaturas.pop(id(observer), None)
+        if assinatura is not None:
+            self._parar(assinatura)
+
+    def publish(self, observer, subject, event, data=None):
+        #enfileira para um observer; retorna False se o evento foi descartado (fila cheia)
+        assinatura = self._assinaturas.get(id(observer))
+        if assinatura is None:
+            return False
+        item = (subject, event, data)
+        try:
+            if self.backpressure is Backpressure.BLOCK:
+                assinatura.fila.put(item, timeout=self.put_timeout)
+            else:
+                assinatura.fila.put_nowait(item)
+            return True
+        except queue.Full:
+            assinatura.descartados += 1
+            if assinatura.descartados == 1 or assinatura.descartados % 1000 == 0:
+                print(f"AVISO: fila de eventos de {observer.__class__.__name__} cheia "
+                      f"({assinatura.descartados} evento(s) descartado(s))")
+            return False
+
+    def _run(self, assinatura):
+        observer = assinatura.observer
+        while True:
+            item = assinatura.fila.get()
+            try:
+                if item is _PARAR:
+                    return
+                subject, event, data = item
+                try:
+                    observer.update(subject, event, data)
+                    assinatura.entregues += 1
+                except Exception as e: #o erro fica neste observer: a thread continua com o próximo evento
+                    assinatura.erros += 1
+                    print(f"Erro ao notificar {observer.__class__.__name__}: {e}")
+            finally:
+                assinatura.fila.task_done()
+
+    def _parar(self, assinatura):
+        assinatura.fila.put(_PARAR) #espera lugar na fila: nada do que já foi publicado se perde
+        assinatura.thread.join()
+
+    def drain(self, timeout=None): #espera as filas esvaziarem; False se o timeout acabar antes
+        limite = None if timeout is None else time.monotonic() + timeout
+        for assinatura in list(self._assinaturas.values()):
+            fila = assinatura.fila
+            with fila.all_tasks_done:
+                while fila.unfinished_tasks:
+                    restante = None if limite is None else limite - time.monotonic()
+                    if restante is not None and restante <= 0:
+                        return False
+                    fila.all_tasks_done.wait(restante)
+        return True
+
+    def stats(self): #{nome do observer: pendentes, entregues, descartados, erros}
+        return {a.observer.__class__.__name__: a.stats() for a in list(self._assinaturas.values())}
+
+    def close(self): #para de aceitar observers e entrega tudo o que estiver nas filas
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            assinaturas = list(self._assinaturas.values())
+            self._assinaturas = {}
+        for assinatura in assinaturas:
+            self._parar(assinatura)
@@ -12,12 +12,18 @@ class CRMFacade:
     def load_data(self):
         self._crm.load_data()
         
+    def close(self):
+        self._crm.close()
+        
     def add_contato(self):
         self._crm.add_contato()
         
     def listar_contatos(self):
         self._crm.listar_contatos()
         
+    def buscar(self):
+        self._crm.buscar()
+        
     def change_user_role(self):
         self._crm.change_user_role()
         self.current_user_role = self._crm.current_user_role
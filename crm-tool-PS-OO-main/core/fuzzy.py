@@ -0,0 +1,185 @@
+import heapq
+import math
+
+from .search import tokenize
+
+#------------------------------ busca aproximada (trigramas) ------------------------------
+#Para achar "João da Silva" digitando "Joao Silva", "Joao Silvva" ou só "joa": cada palavra vira
+#os pedaços de 3 letras ("  j", " jo", "joa", "oao", "ao ") e a semelhança entre duas palavras é a
+#proporção de pedaços em comum. Entra no IndexedCollection como os outros índices (montado na
+#primeira consulta, mantido a cada mudança).
+#
+#Os trigramas são do vocabulário (palavras distintas), não de cada registro: numa base grande os
+#nomes e empresas repetem as mesmas palavras, então achar as palavras parecidas é barato e o
+#trabalho por consulta fica proporcional aos textos da palavra mais rara da busca.
+
+LIMIAR = 0.4 #semelhança mínima do texto para aparecer nos resultados (0 a 1)
+LIMIAR_PALAVRA = 0.5 #semelhança mínima entre uma palavra da busca e uma do texto
+PESO_SOBRA = 0.25 #quanto pesam as palavras do texto que não estão na busca ("Joao" ainda acha "João da Silva")
+
+def trigrams(palavra, prefixo=False): #prefixo: sem o fim da palavra ("joa" casa com o começo de "joao")
+    palavra = f"  {palavra}" if prefixo else f"  {palavra} "
+    return {palavra[i:i + 3] for i in range(len(palavra) - 2)}
+
+def _chave(text): #forma normalizada: "João  da Silva" e "joao da silva" são o mesmo texto
+    return " ".join(tokenize(text))
+
+def _candidatos(postings, grams, threshold):
+    #quem chega no limiar divide pelo menos `minimo` trigramas com a busca, então aparece em pelo
+    #menos uma das (total - minimo + 1) listas mais curtas: as listas dos trigramas comuns nem são lidas
+    minimo = max(1, math.ceil(threshold * len(grams)))
+    listas = sorted((postings.get(gram, ()) for gram in grams), key=len)
+    return set().union(*listas[:len(grams) - minimo + 1])
+
+class TrigramIndex:
+    def __init__(self, text_fn):
+        self.text_fn = text_fn
+        self._postings = None #trigrama -> palavras do vocabulário
+        self._words = {} #palavra -> {quantidade de palavras do texto: textos que têm essa palavra}
+        self._ids = {} #texto -> ids com esse texto
+        self._texts = {} #id -> texto (para tirar do índice quando mudar)
+
+    @property
+    def built(self):
+        return self._postings is not None
+
+    def build(self, items):
+        self._postings = {}
+        self._words = {}
+        self._ids = {}
+        self._texts = {}
+        for item in items:
+            self.add(item)
+
+    def add(self, item):
+        if self._postings is None:
+            return
+        chave = _chave(self.text_fn(item) or "")
+        self._texts[item.id] = chave
+        ids = self._ids.get(chave)
+        if ids is None:
+            ids = self._ids[chave] = set()
+            palavras = chave.split()
+            for palavra in set(palavras):
+                tamanhos = self._words.get(palavra)
+                if tamanhos is None:
+                    tamanhos = self._words[palavra] = {}
+                    for gram in trigrams(palavra):
+                        self._postings.setdefault(gram, set()).add(palavra)
+                tamanhos.setdefault(len(palavras), set()).add(chave)
+        ids.add(item.id)
+
+    def discard(self, item_id):
+        if self._postings is None or item_id not in self._texts:
+            return
+        chave = self._texts.pop(item_id)
+        ids = self._ids[chave]
+        ids.discard(item_id)
+        if ids:
+            return
+        del self._ids[chave]
+        palavras = chave.split()
+        for palavra in set(palavras):
+            tamanhos = self._words[palavra]
+            textos = tamanhos[len(palavras)]
+            textos.discard(chave)
+            if not textos:
+                del tamanhos[len(palavras)]
+            if tamanhos:
+                continue
+            del self._words[palavra]
+            for gram in trigrams(palavra):
+                palavras = self._postings[gram]
+                palavras.discard(palavra)
+                if not palavras:
+                    del self._postings[gram]
+
+    def refresh(self, item):
+        if self._postings is None or self._texts.get(item.id) == _chave(self.text_fn(item) or ""):
+            return
+        self.discard(item.id)
+        self.add(item)
+
+    def _similar_words(self, palavra, prefixo): #{palavra do vocabulário: semelhança}
+        grams = trigrams(palavra)
+        parecidas = {}
+        for candidata in _candidatos(self._postings, grams, LIMIAR_PALAVRA):
+            outros = trigrams(candidata)
+            comuns = len(grams & outros)
+            score = comuns / (len(grams) + len(outros) - comuns)
+            if score >= LIMIAR_PALAVRA:
+                parecidas[candidata] = score
+        if prefixo: #última palavra da busca: quem está digitando ainda não terminou ("joa" -> "joao")
+            grams = trigrams(palavra, prefixo=True)
+            for candidata in _candidatos(self._postings, grams, 1):
+                if candidata.startswith(palavra):
+                    parecidas[candidata] = max(parecidas.get(candidata, 0), 0.9)
+        return parecidas
+
+    def _textos(self, palavra):
+        return set().union(*self._words[palavra].values())
+
+    def search(self, query, limit=10, threshold=LIMIAR): #[(semelhança, id)], mais parecidos primeiro
+        palavras = list(dict.fromkeys(tokenize(query)))
+        if not palavras:
+            return []
+        ultima = len(palavras) - 1
+        #palavras da busca sem nada parecido no vocabulário são ignoradas (só baixam a nota)
+        grupos = [g for g in (self._similar_words(p, i == ultima) for i, p in enumerate(palavras)) if g]
+        if not grupos:
+            return []
+
+        def nota(total, tamanho): #palavras do texto que sobram (além das da busca) baixam a nota
+            return total / (len(palavras) + PESO_SOBRA * max(tamanho - len(palavras), 0))
+
+        if len(grupos) == 1:
+            textos = self._uma_palavra(grupos[0], nota, limit, threshold)
+        else:
+            #o texto precisa ter algo parecido com cada palavra: interseção dos conjuntos (feita em C),
+            #começando pela palavra com menos textos; a nota só é calculada para quem sobrar
+            grupos.sort(key=lambda g: sum(len(t) for palavra in g for t in self._words[palavra].values()))
+            candidatos = set().union(*(self._textos(palavra) for palavra in grupos[0]))
+            for grupo in grupos[1:]:
+                if len(candidatos) < 64: #poucos: mais barato conferir um a um abaixo
+                    break
+                candidatos &= set().union(*(self._textos(palavra) for palavra in grupo))
+            textos = []
+            for chave in candidatos:
+                do_texto = chave.split()
+                total = 0
+                for grupo in grupos:
+                    melhor = max(grupo.get(palavra, 0) for palavra in do_texto)
+                    if not melhor:
+                        break
+                    total += melhor
+                else:
+                    score = nota(total, len(do_texto))
+                    if score >= threshold:
+                        textos.append((score, chave))
+            textos.sort(key=lambda t: (-t[0], t[1]))
+
+        resultados = [] #dos textos mais parecidos para os ids (mais novos primeiro entre iguais)
+        for score, chave in textos:
+            resultados.extend((score, item_id) for item_id in heapq.nlargest(limit - len(resultados), self._ids[chave]))
+            if len(resultados) >= limit:
+                break
+        return resultados
+
+    def _uma_palavra(self, grupo, nota, limit, threshold):
+        #uma palavra só (o caso do autocomplete): a nota depende só da palavra e do tamanho do texto,
+        #então os grupos (palavra, tamanho) são lidos da melhor nota para a pior e a leitura para
+        #quando a página enche, sem passar por todos os textos de uma palavra comum
+        baldes = sorted(((nota(sim, tamanho), palavra, tamanho)
+                         for palavra, sim in grupo.items() for tamanho in self._words[palavra]),
+                        key=lambda b: -b[0])
+        textos, vistos, ids = [], set(), 0
+        for score, palavra, tamanho in baldes:
+            if score < threshold or ids >= limit:
+                break
+            #em ordem alfabética dentro do grupo; um texto já visto veio de uma palavra melhor
+            for chave in heapq.nsmallest(limit + len(vistos), self._words[palavra][tamanho]):
+                if chave not in vistos and ids < limit:
+                    vistos.add(chave)
+                    textos.append((score, chave))
+                    ids += len(self._ids[chave])
+        return textos
@@ -0,0 +1,339 @@
+import base64
+import heapq
+import json
+import threading
+from bisect import bisect_left, bisect_right, insort
+
+#------------------------------ índices secundários ------------------------------
+#Os índices são montados na primeira consulta (e não a cada put do carregamento) e
+#depois mantidos a cada mudança: append/put/remove/pop e refresh (chamado pelo save_change).
+
+class GroupIndex: #valor -> ids com aquele valor (filtros de igualdade: estágio, empresa, fonte...)
+    def __init__(self, key_fn):
+        self.key_fn = key_fn
+        self._groups = None
+        self._keys = {} #id -> valor atual no índice (para tirar do grupo antigo quando mudar)
+
+    @property
+    def built(self):
+        return self._groups is not None
+
+    def build(self, items):
+        self._groups = {}
+        self._keys = {}
+        for item in items:
+            self.add(item)
+
+    def add(self, item):
+        if self._groups is None:
+            return
+        key = self.key_fn(item)
+        self._keys[item.id] = key
+        self._groups.setdefault(key, set()).add(item.id)
+
+    def discard(self, item_id):
+        if self._groups is None or item_id not in self._keys:
+            return
+        key = self._keys.pop(item_id)
+        grupo = self._groups[key]
+        grupo.discard(item_id)
+        if not grupo:
+            del self._groups[key]
+
+    def refresh(self, item):
+        if self._groups is None or self._keys.get(item.id, _AUSENTE) == self.key_fn(item):
+            return
+        self.discard(item.id)
+        self.add(item)
+
+    def ids(self, key):
+        return self._groups.get(key, _VAZIO)
+
+    def counts(self):
+        return {key: len(ids) for key, ids in self._groups.items()}
+
+class SortedIndex: #lista ordenada de (chave, id): ordenação, intervalos e cursor por busca binária
+    def __init__(self, key_fn):
+        self.key_fn = key_fn
+        self._entries = None
+        self._keys = {}
+
+    @property
+    def built(self):
+        return self._entries is not None
+
+    def build(self, items):
+        self._keys = {item.id: self.key_fn(item) for item in items}
+        self._entries = sorted((key, item_id) for item_id, key in self._keys.items())
+
+    def add(self, item):
+        if self._entries is None:
+            return
+        key = self.key_fn(item)
+        self._keys[item.id] = key
+        insort(self._entries, (key, item.id))
+
+    def discard(self, item_id):
+        if self._entries is None or item_id not in self._keys:
+            return
+        entry = (self._keys.pop(item_id), item_id)
+        pos = bisect_left(self._entries, entry)
+        if pos < len(self._entries) and self._entries[pos] == entry:
+            del self._entries[pos]
+
+    def refresh(self, item):
+        if self._entries is None or self._keys.get(item.id, _AUSENTE) == self.key_fn(item):
+            return
+        self.discard(item.id)
+        self.add(item)
+
+    def key_of(self, item_id):
+        return self._keys[item_id]
+
+    def bounds(self, low=None, high=None): #posições [início, fim) das chaves entre low e high
+        start = 0 if low is None else bisect_left(self._entries, (low,))
+        end = len(self._entries) if high is None else bisect_right(self._entries, (high, _MAIOR))
+        return start, end
+
+_AUSENTE = object()
+_VAZIO = frozenset()
+
+class _Maior: #maior que qualquer id (limite superior de um intervalo de chaves)
+    def __lt__(self, other):
+        return False
+
+    def __gt__(self, other):
+        return True
+
+_MAIOR = _Maior()
+
+#------------------------------ coleção ------------------------------
+class IndexedCollection:
+    #funciona como a lista de antes (append, remove, for, len, [i]),
+    #mas guarda os objetos num dict por id: buscar e remover por id é O(1)
+    def __init__(self, items=(), indexes=None):
+        self._by_id = {}
+        self._ordem = None #cache da lista usada no acesso por posição (menus da CLI)
+        self.indexes = indexes or {} #nome -> GroupIndex/SortedIndex (e TextIndex/TrigramIndex)
+        self._lock = threading.RLock() #as rotas da API rodam em threads: consulta e mudança não se cruzam
+        for item in items:
+            self.append(item)
+
+    def append(self, item):
+        with self._lock:
+            existente = self._by_id.get(item.id)
+            if existente is not None and existente is not item:
+                raise ValueError(f"Já existe um registro com ID {item.id}")
+            self._by_id[item.id] = item
+            self._ordem = None
+            self._index_add(item, existente is not None)
+
+    def append_unique(self, name, item):
+        #só adiciona se ninguém tiver o mesmo valor no GroupIndex `name` (ex: email);
+        #retorna o registro que já existia (ou None se adicionou). Checar e adicionar é atômico
+        with self._lock:
+            index = self.index(name)
+            existentes = index.ids(index.key_fn(item))
+            if existentes:
+                return self._by_id[min(existentes)]
+            self.append(item)
+            return None
+
+    def put(self, item): #insere ou substitui quem tiver o mesmo id (carregamento do arquivo)
+        with self._lock:
+            substituiu = item.id in self._by_id
+            self._by_id[item.id] = item
+            self._ordem = None
+            self._index_add(item, substituiu)
+
+    def remove(self, item):
+        with self._lock:
+            if self._by_id.get(item.id) is not item:
+                raise ValueError(f"Registro com ID {item.id} não está na coleção")
+            del self._by_id[item.id]
+            self._ordem = None
+            self._index_discard(item.id)
+
+    def pop(self, obj_id, default=None):
+        with self._lock:
+            item = self._by_id.pop(obj_id, default)
+            self._ordem = None
+            self._index_discard(obj_id)
+            return item
+
+    def refresh(self, item): #o objeto mudou: atualiza os índices (chamado pelo save_change)
+        with self._lock:
+            if self._by_id.get(item.id) is item:
+                for index in self.indexes.values():
+                    index.refresh(item)
+
+    def _index_add(self, item, substituiu):
+        for index in self.indexes.values():
+            if substituiu:
+                index.discard(item.id)
+            index.add(item)
+
+    def _index_discard(self, obj_id):
+        for index in self.indexes.values():
+            index.discard(obj_id)
+
+    def index(self, name): #o índice pronto para consulta (montado na primeira vez)
+        with self._lock:
+            index = self.indexes[name]
+            if not index.built:
+                index.build(self._by_id.values())
+            return index
+
+    def group(self, name, key): #itens com aquele valor num GroupIndex, em ordem de id
+        with self._lock:
+            return [self._by_id[item_id] for item_id in sorted(self.index(name).ids(key))]
+
+    def group_counts(self, name): #{valor: quantidade} de um GroupIndex
+        with self._lock:
+            return self.index(name).counts()
+
+    def key_type(self, name): #tipo das chaves de um SortedIndex (None se estiver vazio)
+        with self._lock:
+            entries = self.index(name)._entries
+            return type(entries[0][0]) if entries else None
+
+    def group_size(self, name, key): #quantidade de itens com aquele valor, sem montar a lista
+        with self._lock:
+            return len(self.index(name).ids(key))
+
+    def count_in(self, ids, name=None, key=None):
+        #quantos de `ids` estão no grupo (ou na coleção, sem name): percorre o menor dos dois conjuntos
+        with self._lock:
+            grupo = self._by_id.keys() if name is None else self.index(name).ids(key)
+            if len(ids) <= len(grupo):
+                return sum(1 for item_id in ids if item_id in grupo)
+            return sum(1 for item_id in grupo if item_id in ids)
+
+    def sample(self, limit, exclude=(), name=None, key=None):
+        #até `limit` itens do grupo (ou da coleção) fora de `exclude`; para assim que achar, sem ordenar
+        amostra = []
+        with self._lock:
+            grupo = self._by_id.keys() if name is None else self.index(name).ids(key)
+            for item_id in grupo:
+                if len(amostra) >= limit:
+                    break
+                if item_id not in exclude:
+                    amostra.append(self._by_id[item_id])
+        return amostra
+
+    def search(self, name, query, limit=20): #[(pontuação, item)] de um TextIndex/TrigramIndex
+        with self._lock:
+            return [(score, self._by_id[item_id]) for score, item_id in self.index(name).search(query, limit)]
+
+    def get(self, obj_id, default=None):
+        return self._by_id.get(obj_id, default)
+
+    def ids(self):
+        return self._by_id.keys()
+
+    def __contains__(self, item):
+        return self._by_id.get(getattr(item, "id", None)) is item
+
+    def __iter__(self):
+        return iter(self._by_id.values())
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __getitem__(self, pos):
+        if self._ordem is None:
+            self._ordem = list(self._by_id.values())
+        return self._ordem[pos]
+
+    def __repr__(self):
+        return f"IndexedCollection({list(self._by_id.values())!r})"
+
+    #--- consulta paginada ---
+    def query(self, sort, equals=None, ranges=None, after=None, limit=50, descending=False):
+        #equals: {índice de grupo: valor}; ranges: {índice ordenado: (mínimo, máximo)} (None = sem limite)
+        #after: (chave, id) do último item da página anterior (cursor)
+        #retorna (itens, cursor da próxima página ou None)
+        with self._lock:
+            return self._query(sort, equals, ranges, after, limit, descending)
+
+    def _query(self, sort, equals, ranges, after, limit, descending):
+        ordenado = self.index(sort)
+        grupos = sorted((self.index(name).ids(value) for name, value in (equals or {}).items()), key=len)
+        filtros = [] #intervalos em outros índices viram filtro por item
+        start, end = 0, len(ordenado._entries)
+        for name, (low, high) in (ranges or {}).items():
+            if name == sort:
+                start, end = ordenado.bounds(low, high)
+            else:
+                filtros.append((self.index(name), low, high))
+
+        if after is not None: #o cursor é (chave, id): busca binária direto até onde a página anterior parou
+            after = tuple(after)
+            if descending:
+                end = min(end, bisect_left(ordenado._entries, after))
+            else:
+                start = max(start, bisect_right(ordenado._entries, after))
+
+        def aceita(item_id):
+            for grupo in grupos[1:]:
+                if item_id not in grupo:
+                    return False
+            for index, low, high in filtros:
+                key = index.key_of(item_id)
+                if (low is not None and key < low) or (high is not None and key > high):
+                    return False
+            return True
+
+        janela = max(end - start, 0)
+        if grupos and len(grupos[0]) * 8 < janela:
+            #grupo pequeno perto da janela: ordena só os candidatos (O(k log limit))
+            candidatos = []
+            for item_id in grupos[0]:
+                entry = (ordenado.key_of(item_id), item_id)
+                pos = bisect_left(ordenado._entries, entry)
+                if start <= pos < end and aceita(item_id):
+                    candidatos.append(entry)
+            escolher = heapq.nlargest if descending else heapq.nsmallest
+            pagina = escolher(limit + 1, candidatos)
+        else:
+            #percorre o índice na ordem pedida e para quando completar a página
+            posicoes = range(end - 1, start - 1, -1) if descending else range(start, end)
+            pagina = []
+            for pos in posicoes:
+                entry = ordenado._entries[pos]
+                if grupos and entry[1] not in grupos[0]:
+                    continue
+                if aceita(entry[1]):
+                    pagina.append(entry)
+                    if len(pagina) > limit:
+                        break
+
+        proximo = pagina[limit - 1] if len(pagina) > limit else None
+        return [self._by_id[item_id] for _, item_id in pagina[:limit]], proximo
+
+#------------------------------ cursor ------------------------------
+#opaco para quem usa a API: base64 de [ordenação, chave, id]
+def encode_cursor(sort, entry):
+    raw = json.dumps([sort, entry[0], entry[1]], ensure_ascii=False, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def _mesmo_tipo(valor, tipo): #números valem entre si; bool não conta como número
+    if isinstance(valor, bool):
+        return False
+    if tipo in (int, float):
+        return isinstance(valor, (int, float))
+    return isinstance(valor, tipo)
+
+def decode_cursor(cursor, sort, key_type=None):
+    #key_type: tipo das chaves do índice de ordenação (IndexedCollection.key_type); chave de outro tipo
+    #quebraria a busca binária (comparar texto com número)
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_sort, key, item_id = json.loads(raw.decode("utf-8"))
+    except (ValueError, TypeError):
+        raise ValueError("Cursor inválido")
+    if cursor_sort != sort:
+        raise ValueError("O cursor foi gerado com outra ordenação")
+    if not _mesmo_tipo(item_id, int) or (key_type is not None and not _mesmo_tipo(key, key_type)):
+        raise ValueError("Cursor inválido")
+    return key, item_id
@@ -0,0 +1,128 @@
+import json
+import os
+import threading
+from pathlib import Path
+
+#entidades que possuem id (as outras, como documents, só recebem append)
+ENTIDADES_COM_ID = ("contatos", "leads", "campanhas", "outbox")
+
+class ChangeJournal:
+    #journal append-only: cada linha é UMA mudança de UMA entidade,
+    #então salvar custa O(registro alterado) e não O(banco inteiro)
+    def __init__(self, path, compact_every=500, fsync=False):
+        self.path = Path(path)
+        self.compact_every = compact_every
+        self.fsync = fsync #se True, cada escrita só retorna depois de ir para o disco
+        self.pending = 0 #quantas mudanças estão no journal desde o último snapshot
+        self.geracao = 0 #geração do snapshot sobre o qual o journal está sendo escrito
+        self._lock = threading.Lock() #as rotas da API rodam em threads diferentes
+        self._file = None
+
+    def append(self, op, entity, record=None, id=None):
+        self.append_many([(op, entity, record, id)])
+
+    def append_many(self, changes): #várias mudanças numa escrita só (e um fsync só)
+        lines = "".join(
+            json.dumps({"op": op, "entity": entity, "id": id, "data": record}, ensure_ascii=False) + "\n"
+            for op, entity, record, id in changes
+        )
+        if not lines:
+            return
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(lines)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self.pending += len(changes)
+
+    def needs_compaction(self):
+        return self.pending >= self.compact_every
+
+    def entries(self):
+        if not self.path.exists():
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    #ultima linha cortada por um crash no meio da escrita, o resto é ignorado
+                    print(f"AVISO: entrada corrompida no journal '{self.path.name}' foi ignorada.")
+                    return
+
+    def pending_changes(self, geracao=0):
+        #estado final de cada registro citado no journal: {entity: {id: dict ou None se removido}}
+        #e os appends (entidades sem id), na ordem em que aconteceram.
+        #geracao: a do snapshot carregado. A primeira linha do journal diz sobre qual geração ele foi
+        #escrito; se for mais antiga, o crash foi entre gravar o snapshot e o reset e tudo já está nele
+        overrides = {entity: {} for entity in ENTIDADES_COM_ID}
+        appends = []
+        replayed = 0
+        base = None
+        for entry in self.entries():
+            entity = entry.get("entity")
+            op = entry.get("op")
+            if base is None: #journal antigo (sem cabeçalho) foi escrito sobre a geração 0
+                base = entry.get("n", 0) if op == "geracao" else 0
+                self.geracao = base
+                if base < geracao:
+                    break
+                if op == "geracao":
+                    continue
+            if entity in overrides:
+                if op == "upsert":
+                    overrides[entity][entry["id"]] = entry["data"]
+                elif op == "delete":
+                    overrides[entity][entry["id"]] = None
+                elif op == "delete_many": #uma linha para vários ids (baixa de um lote do outbox)
+                    for obj_id in entry["id"]:
+                        overrides[entity][obj_id] = None
+            elif op == "append":
+                appends.append((entity, entry["data"]))
+            replayed += 1
+        else:
+            self.pending = replayed
+            return overrides, appends
+        print(f"AVISO: journal '{self.path.name}' já está no snapshot (geração {geracao}) e foi descartado.")
+        self.reset(geracao) #as próximas mudanças não podem ir atrás das entradas velhas
+        return {entity: {} for entity in ENTIDADES_COM_ID}, []
+
+    def apply_to(self, data, geracao=0):
+        #aplica as mudanças do journal por cima do snapshot (dicts crus, antes de virar objeto)
+        overrides, appends = self.pending_changes(geracao)
+        for entity, mudancas in overrides.items():
+            registros = {r.get("id"): r for r in data.get(entity, [])}
+            for obj_id, record in mudancas.items():
+                if record is None:
+                    registros.pop(obj_id, None)
+                else:
+                    registros[obj_id] = record
+            data[entity] = list(registros.values())
+        for entity, record in appends:
+            data.setdefault(entity, []).append(record)
+        return data
+
+    def reset(self, geracao=0):
+        #chamado depois que o snapshot completo foi gravado (compactação); o cabeçalho
+        #guarda a geração desse snapshot, que é a base das mudanças escritas daqui em diante
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            with open(self.path, "w", encoding="utf-8") as f:
+                f.write(json.dumps({"op": "geracao", "n": geracao}) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.pending = 0
+            self.geracao = geracao
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -0,0 +1,123 @@
+from collections import Counter
+import threading
+
+from models.base import SALES_STAGES
+from .observer import Observer, on
+
+#------------------------------ métricas dos relatórios ------------------------------
+#Totais, conversão e distribuição por estágio mantidos a cada mudança (O(1) por evento), em vez
+#de percorrer todos os contatos e leads a cada relatório. O CRM avisa pelos eventos do Observer;
+#depois de carregar os dados (ou se algo sair do lugar) o rebuild recalcula tudo do zero.
+
+class MetricsObserver(Observer):
+    synchronous = True #os relatórios leem os totais logo depois da mudança
+
+    def __init__(self):
+        self._lock = threading.Lock() #as rotas da API mudam dados em threads diferentes
+        self._reset()
+
+    def _reset(self):
+        self.total_contatos = 0
+        self.total_leads = 0
+        self.leads_convertidos = 0
+        self.total_campanhas = 0
+        self.por_estagio = Counter() #código do estágio -> contatos
+
+    @on("contato_created")
+    def _contato_criado(self, subject, contato):
+        with self._lock:
+            self.total_contatos += 1
+            self.por_estagio[contato.stage_code] += 1
+
+    @on("contato_deleted")
+    def _contato_removido(self, subject, contato):
+        with self._lock:
+            self.total_contatos -= 1
+            self._tirar_estagio(contato.stage_code)
+
+    @on("lead_created")
+    def _lead_criado(self, subject, lead):
+        with self._lock:
+            self.total_leads += 1
+            self.leads_convertidos += bool(lead.converted)
+
+    @on("lead_deleted")
+    def _lead_removido(self, subject, lead):
+        with self._lock:
+            self.total_leads -= 1
+            self.leads_convertidos -= bool(lead.converted)
+
+    @on("lead_converted")
+    def _lead_convertido(self, subject, contato):
+        with self._lock:
+            self.leads_convertidos += 1
+
+    @on("stage_changed")
+    def _estagio_alterado(self, subject, data):
+        with self._lock:
+            self._tirar_estagio(SALES_STAGES.code(data["old_stage"]))
+            self.por_estagio[SALES_STAGES.code(data["new_stage"])] += 1
+
+    @on("campanha_created")
+    def _campanha_criada(self, subject, campanha):
+        with self._lock:
+            self.total_campanhas += 1
+
+    @on("campanha_deleted")
+    def _campanha_removida(self, subject, campanha):
+        with self._lock:
+            self.total_campanhas -= 1
+
+    def _tirar_estagio(self, code):
+        self.por_estagio[code] -= 1
+        if self.por_estagio[code] <= 0:
+            del self.por_estagio[code]
+
+    #--- leitura (usada pelos relatórios) ---
+    @property
+    def leads_ativos(self): #leads ainda não convertidos
+        return self.total_leads - self.leads_convertidos
+
+    @property
+    def taxa_conversao(self): #em %
+        return self.leads_convertidos / self.total_leads * 100 if self.total_leads else 0
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "total_contatos": self.total_contatos,
+                "total_leads": self.total_leads,
+                "leads_convertidos": self.leads_convertidos,
+                "total_campanhas": self.total_campanhas,
+                "por_estagio": dict(self.por_estagio)
+            }
+
+    #--- recálculo do zero e checagem ---
+    @staticmethod
+    def compute(crm): #as mesmas métricas, percorrendo tudo (o jeito antigo)
+        return {
+            "total_contatos": len(crm.contatos),
+            "total_leads": len(crm.leads),
+            "leads_convertidos": sum(1 for l in crm.leads if l.converted),
+            "total_campanhas": len(crm.campanhas),
+            "por_estagio": dict(Counter(c.stage_code for c in crm.contatos))
+        }
+
+    def rebuild(self, crm):
+        valores = self.compute(crm)
+        with self._lock:
+            self._reset()
+            self.total_contatos = valores["total_contatos"]
+            self.total_leads = valores["total_leads"]
+            self.leads_convertidos = valores["leads_convertidos"]
+            self.total_campanhas = valores["total_campanhas"]
+            self.por_estagio.update(valores["por_estagio"])
+
+    def check(self, crm, fix=True):
+        #compara com o recálculo do zero: {métrica: (mantido, recalculado)} do que divergir
+        esperado = self.compute(crm)
+        atual = self.snapshot()
+        divergencias = {nome: (atual[nome], valor) for nome, valor in esperado.items() if atual[nome] != valor}
+        if divergencias and fix:
+            self.rebuild(crm)
+        return divergencias
@@ -1,67 +1,96 @@
 from abc import ABC, abstractmethod
 from typing import Any
 
+def on(*events): #marca o método do observer como o tratador desses eventos: @on("lead_converted")
+    def marcar(metodo):
+        metodo._eventos = events
+        return metodo
+    return marcar
+
 class Observer(ABC):
-    @abstractmethod
+    #False: recebe os eventos pelo barramento, fora da operação do usuário (core/event_bus.py);
+    #True: é chamado na hora, dentro do notify (para quem precisa estar em dia logo depois, ex: métricas)
+    synchronous = False
+
+    #eventos que o observer assina: o Subject só entrega esses (tabela evento -> observers).
+    #Com métodos @on a lista é montada sozinha; None = recebe tudo que o can_handle aceitar
+    events = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        tratadores = {}
+        for base in reversed(cls.__mro__):
+            for nome, atributo in vars(base).items():
+                for event in getattr(atributo, "_eventos", ()):
+                    tratadores[event] = nome
+        cls._tratadores = tratadores
+        if tratadores and "events" not in vars(cls):
+            cls.events = frozenset(tratadores)
+
     def update(self, subject: Any, event: str, data: Any = None) -> None:
-        pass
-    
+        #padrão: chama o método @on do evento (quem sobrescrever continua recebendo tudo por aqui)
+        nome = self._tratadores.get(event)
+        if nome is not None:
+            getattr(self, nome)(subject, data)
+
     def can_handle(self, event):
-        return True
-    
+        return self.events is None or event in self.events
+
 class Subject(ABC):
     @abstractmethod
     def attach(self, observer: Observer) -> None:
         pass
-    
+
     @abstractmethod
     def detach(self, observer):
         pass
-    
+
     @abstractmethod
     def notify(self, event: str, data: Any) -> None:
         pass
-    
+
 class EmailNotifier(Observer):
-    def update(self, subject, event, data = None):
-        if event == "lead_converted":
-            contato = data
-            print(f"📧 Enviando email de boas-vindas para {contato.name} - ({contato.email}).")
-        
-        elif event == "task_completed":
-            contato = data["contato"]
-            task = data["task"]
-            print(f"📧 Notificando {contato.name} sobre conclusão da tarefa '{task.title}'.")
-        
-        elif event == "stage_changed":
-            contato = data["contato"]
-            new_stage = data["new_stage"]
-            print(f"📧 Email automático enviado: {contato.name} avançou para '{new_stage}'.")
+    @on("lead_converted")
+    def boas_vindas(self, subject, contato):
+        print(f"📧 Enviando email de boas-vindas para {contato.name} - ({contato.email}).")
+
+    @on("task_completed")
+    def tarefa_concluida(self, subject, data):
+        contato = data["contato"]
+        task = data["task"]
+        print(f"📧 Notificando {contato.name} sobre conclusão da tarefa '{task.title}'.")
+
+    @on("stage_changed")
+    def estagio_alterado(self, subject, data):
+        contato = data["contato"]
+        new_stage = data["new_stage"]
+        print(f"📧 Email automático enviado: {contato.name} avançou para '{new_stage}'.")
 
 class AnalyticsUpdater(Observer):
-    def update(self, subject, event, data = None):
-        if event == "lead_converted":
-            contato = data
-            print(f"📊 Registrando evento de conversão para o contato '{contato.name}'.")
-        
-        elif event == "activity_added":
-            contato = data["contato"]
-            activity = data["activity"]
-            print(f"📊 Nova atividade '{activity.type}' registrada para {contato.name}.")
-        
-        elif event == "stage_changed":
-            old_stage = data["old_stage"]
-            new_stage = data["new_stage"]
-            print(f"📊 Métrica atualizada: Transição {old_stage} → {new_stage}.")
+    @on("lead_converted")
+    def conversao(self, subject, contato):
+        print(f"📊 Registrando evento de conversão para o contato '{contato.name}'.")
+
+    @on("activity_added")
+    def atividade(self, subject, data):
+        contato = data["contato"]
+        activity = data["activity"]
+        print(f"📊 Nova atividade '{activity.type}' registrada para {contato.name}.")
+
+    @on("stage_changed")
+    def transicao(self, subject, data):
+        old_stage = data["old_stage"]
+        new_stage = data["new_stage"]
+        print(f"📊 Métrica atualizada: Transição {old_stage} → {new_stage}.")
 
 class SalesNotifier(Observer):
-    def update(self, subject, event, data = None):
-        if event == "lead_converted":
-            contato = data
-            print(f"🔔 Notificando time de vendas sobre novo contato: {contato.name}.")
-
-        elif event == "stage_changed":
-            contato = data["contato"]
-            new_stage = data["new_stage"]
-            if new_stage in ["Proposta", "Negociação"]:
-                print(f"🔔 ALERTA VENDAS: {contato.name} está em '{new_stage}' - requer atenção!")
\ No newline at end of file
+    @on("lead_converted")
+    def novo_contato(self, subject, contato):
+        print(f"🔔 Notificando time de vendas sobre novo contato: {contato.name}.")
+
+    @on("stage_changed")
+    def alerta(self, subject, data):
+        contato = data["contato"]
+        new_stage = data["new_stage"]
+        if new_stage in ["Proposta", "Negociação"]:
+            print(f"🔔 ALERTA VENDAS: {contato.name} está em '{new_stage}' - requer atenção!")
@@ -0,0 +1,134 @@
+import threading
+import time
+
+from models.base import gerar_id, now_ts
+
+#------------------------------ outbox transacional ------------------------------
+#Os eventos para os observers assíncronos (notificadores, integrações) são gravados como registros
+#"outbox" no MESMO write_batch da mudança que os gerou (CRM.transacao): se o processo morrer logo
+#depois de salvar, o evento está no disco junto com o estado e é reenviado na próxima vez.
+#Uma thread entrega os eventos em lotes e só depois apaga os registros (um write_batch por lote):
+#entrega pelo menos uma vez - um evento pode chegar de novo se o processo cair entre a entrega e a baixa.
+
+def serializar(valor, tipos): #objetos do modelo viram {"$tipo": ..., "dados": to_dict()}
+    if isinstance(valor, dict):
+        return {chave: serializar(v, tipos) for chave, v in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        return [serializar(v, tipos) for v in valor]
+    nome = tipos.get(type(valor))
+    if nome is not None:
+        return {"$tipo": nome, "dados": valor.to_dict()}
+    return valor
+
+def desserializar(valor, classes, resolver=None):
+    #resolver(nome, id): o objeto vivo com esse id (o observer recebe o mesmo objeto que está no CRM)
+    if isinstance(valor, list):
+        return [desserializar(v, classes, resolver) for v in valor]
+    if not isinstance(valor, dict):
+        return valor
+    nome = valor.get("$tipo")
+    if nome is None:
+        return {chave: desserializar(v, classes, resolver) for chave, v in valor.items()}
+    dados = valor["dados"]
+    if resolver is not None and dados.get("id") is not None:
+        vivo = resolver(nome, dados["id"])
+        if vivo is not None:
+            return vivo
+    return classes[nome].from_dict(dados)
+
+class Outbox:
+    def __init__(self, gravar, entregar, batch_size=100):
+        self._gravar = gravar     #write_batch do storage (a baixa dos eventos entregues)
+        self._entregar = entregar #entregar(lote de (registro, data)) -> só retorna depois de entregue
+        self.batch_size = batch_size
+        self._pendentes = {} #id -> (registro, data): o que ainda não foi entregue (entra no snapshot)
+        self._prontos = []   #ids já gravados, na ordem, esperando a thread
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closing = False
+        self.entregues = 0
+
+    def novo(self, event, data, tipos): #registro para gravar junto com a mudança (ainda não vai para a fila)
+        record = {"id": gerar_id(), "event": event, "data": serializar(data, tipos), "created_ts": now_ts()}
+        with self._cond:
+            #já entra nos pendentes: se um snapshot acontecer antes do write_batch, o registro vai junto
+            self._pendentes[record["id"]] = (record, data)
+        return record
+
+    def liberar(self, ids): #os registros foram gravados: a thread pode entregar
+        with self._cond:
+            self._prontos.extend(i for i in ids if i in self._pendentes)
+            self._cond.notify()
+
+    def descartar(self, ids): #o write_batch falhou: o evento não existe
+        with self._cond:
+            for i in ids:
+                self._pendentes.pop(i, None)
+
+    def restore(self, record): #registro que estava no disco (carga): entregue quando a thread começar
+        with self._cond:
+            if record["id"] not in self._pendentes:
+                self._pendentes[record["id"]] = (record, None)
+                self._prontos.append(record["id"])
+
+    def clear(self):
+        with self._cond:
+            self._pendentes = {}
+            self._prontos = []
+
+    def records(self): #para o snapshot
+        with self._cond:
+            return [record for record, _ in self._pendentes.values()]
+
+    def __len__(self):
+        return len(self._pendentes)
+
+    def start(self): #só começa a entregar quando houver observer (senão os eventos recuperados se perderiam)
+        with self._cond:
+            if self._thread is not None or self._closing:
+                return
+            self._prontos.sort() #os recuperados do disco, na ordem em que foram criados (id = tempo)
+            self._thread = threading.Thread(target=self._run, name="crm-outbox", daemon=True)
+            self._thread.start()
+
+    def _proximo_lote(self):
+        with self._cond:
+            while not self._prontos and not self._closing:
+                self._cond.wait()
+            if not self._prontos:
+                return None #fechando e sem nada pronto
+            ids, self._prontos = self._prontos[:self.batch_size], self._prontos[self.batch_size:]
+            return [self._pendentes[i] for i in ids if i in self._pendentes]
+
+    def _run(self):
+        while True:
+            lote = self._proximo_lote()
+            if lote is None:
+                return
+            if not lote:
+                continue
+            try:
+                self._entregar(lote)
+                self._baixar([record["id"] for record, _ in lote])
+            except Exception as e:
+                print(f"ERRO ao entregar eventos do outbox: {e}")
+                if self._closing: #ficam no disco e são entregues na próxima vez
+                    return
+                with self._cond: #volta para a frente da fila e tenta de novo
+                    self._prontos[:0] = [record["id"] for record, _ in lote]
+                time.sleep(1)
+
+    def _baixar(self, ids): #tira da memória primeiro: um snapshot no meio já não inclui o que foi entregue
+        with self._cond:
+            for i in ids:
+                self._pendentes.pop(i, None)
+        self._gravar([("delete_many", "outbox", None, ids)]) #uma linha no journal por lote entregue
+        self.entregues += len(ids)
+
+    def close(self): #entrega o que já estava pronto antes de parar
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
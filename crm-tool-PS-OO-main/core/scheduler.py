@@ -0,0 +1,81 @@
+import heapq
+import itertools
+import threading
+import time
+
+#------------------------------ agendador de campanhas ------------------------------
+#Heap de (horário, ordem, id da campanha) e uma thread que dorme até o primeiro horário vencer.
+#Reagendar ou cancelar não mexe no heap: o horário atual de cada campanha fica em _atual e as
+#entradas antigas são descartadas quando chegam ao topo (remoção preguiçosa, O(log n) por operação).
+#A thread só é criada no primeiro agendamento: processo sem campanha agendada não tem thread parada.
+
+class CampaignScheduler:
+    def __init__(self, executar, ativo=True):
+        self._executar = executar #executar(campanha_id), chamado na thread do agendador
+        self.ativo = ativo #False: guarda os horários mas não dispara (outro processo cuida dos envios)
+        self._heap = []
+        self._atual = {} #id da campanha -> horário (timestamp) que vale
+        self._ordem = itertools.count() #desempate: mesmo horário sai na ordem em que foi agendado
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closing = False
+        self.executando = None #id da campanha sendo enviada agora
+
+    def schedule(self, campanha_id, quando):
+        with self._cond:
+            self._atual[campanha_id] = quando
+            heapq.heappush(self._heap, (quando, next(self._ordem), campanha_id))
+            self._cond.notify() #pode ter virado o primeiro da fila: a thread recalcula quanto dormir
+            if self.ativo and self._thread is None and not self._closing:
+                self._thread = threading.Thread(target=self._run, name="crm-agendador", daemon=True)
+                self._thread.start()
+
+    def cancel(self, campanha_id):
+        with self._cond:
+            self._atual.pop(campanha_id, None)
+            self._cond.notify()
+
+    def next_run(self, campanha_id): #timestamp do próximo envio, ou None
+        with self._cond:
+            return self._atual.get(campanha_id)
+
+    def __len__(self):
+        return len(self._atual)
+
+    def _proximo(self): #espera o primeiro horário vencer; None quando estiver fechando
+        with self._cond:
+            while not self._closing:
+                while self._heap and self._atual.get(self._heap[0][2]) != self._heap[0][0]:
+                    heapq.heappop(self._heap) #reagendada ou cancelada depois de entrar no heap
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                espera = self._heap[0][0] - time.time()
+                if espera > 0:
+                    self._cond.wait(espera)
+                    continue
+                _, _, campanha_id = heapq.heappop(self._heap)
+                del self._atual[campanha_id]
+                self.executando = campanha_id
+                return campanha_id
+            return None
+
+    def _run(self):
+        while True:
+            campanha_id = self._proximo()
+            if campanha_id is None:
+                return
+            try:
+                self._executar(campanha_id)
+            except Exception as e:
+                print(f"ERRO no envio agendado da campanha {campanha_id}: {e}")
+            finally:
+                self.executando = None
+
+    def close(self): #para de disparar; espera o envio em andamento (se houver) terminar
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
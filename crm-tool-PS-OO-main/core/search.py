@@ -0,0 +1,164 @@
+import heapq
+import math
+import re
+import unicodedata
+from bisect import bisect_left, insort
+from operator import itemgetter
+
+#------------------------------ busca textual ------------------------------
+#Índice invertido (palavra -> {id: peso}) usado pela busca da CLI e do GET /search.
+#Entra no IndexedCollection como os outros índices: montado na primeira busca e depois
+#mantido a cada append/put/remove/pop e refresh (save_change).
+
+#email inteiro vira uma palavra só (para achar "ana@x.com" exato); o resto quebra em letras/números
+_PALAVRA = re.compile(r"[a-z0-9][a-z0-9._%+-]*@[a-z0-9.-]*[a-z0-9]|[a-z0-9]+")
+PREFIXO_MINIMO = 2 #a última palavra da busca também casa por prefixo ("silv" acha "silva")
+MAX_EXPANSOES = 50
+
+def normalize(text): #mesma ideia do CRM._normalize_text: sem acento, e sem diferenciar maiúsculas
+    return unicodedata.normalize("NFD", text).encode("ascii", "ignore").decode("ascii").casefold()
+
+def tokenize(text):
+    if not text:
+        return []
+    return _PALAVRA.findall(normalize(text))
+
+#------------------------------ campos indexados (texto, peso) ------------------------------
+def _email_fields(email): #o email inteiro e as partes do nome antes do @
+    return [(email, 2), ((email or "").split("@")[0], 2)]
+
+def contato_fields(c):
+    campos = [(c.name, 3), (c.empresa, 2), (c.notas, 1)] + _email_fields(c.email)
+    #descrições das atividades sem montar os objetos (ver LazyList.values)
+    campos.extend((descricao, 1) for descricao in type(c).activities.values(c, "description"))
+    return campos
+
+def lead_fields(l):
+    return [(l.name, 3), (l.source, 1)] + _email_fields(l.email)
+
+def campanha_fields(c):
+    return [(c.title, 3), (c.description, 1)]
+
+#------------------------------ índice ------------------------------
+class TextIndex:
+    def __init__(self, fields_fn):
+        self.fields_fn = fields_fn
+        self._postings = None #palavra -> {id: peso (soma dos pesos dos campos onde aparece)}
+        self._terms = {} #id -> palavras do item (para tirar do índice quando mudar)
+        self._vocab = [] #palavras em ordem, para a busca por prefixo
+
+    @property
+    def built(self):
+        return self._postings is not None
+
+    def build(self, items):
+        self._postings = {}
+        self._terms = {}
+        for item in items:
+            self._index(item)
+        self._vocab = sorted(self._postings) #uma ordenação só, em vez de insort palavra a palavra
+
+    def _weights(self, item):
+        pesos = {}
+        for text, peso in self.fields_fn(item):
+            for palavra in tokenize(text):
+                pesos[palavra] = pesos.get(palavra, 0) + peso
+        return pesos
+
+    def _index(self, item):
+        pesos = self._weights(item)
+        self._terms[item.id] = tuple(pesos)
+        novas = []
+        for palavra, peso in pesos.items():
+            posting = self._postings.get(palavra)
+            if posting is None:
+                posting = self._postings[palavra] = {}
+                novas.append(palavra)
+            posting[item.id] = peso
+        return novas
+
+    def add(self, item):
+        if self._postings is None:
+            return
+        for palavra in self._index(item):
+            insort(self._vocab, palavra)
+
+    def discard(self, item_id):
+        if self._postings is None or item_id not in self._terms:
+            return
+        for palavra in self._terms.pop(item_id):
+            posting = self._postings[palavra]
+            posting.pop(item_id, None)
+            if not posting:
+                del self._postings[palavra]
+                pos = bisect_left(self._vocab, palavra)
+                if pos < len(self._vocab) and self._vocab[pos] == palavra:
+                    del self._vocab[pos]
+
+    def refresh(self, item): #o texto pode ter mudado em qualquer campo: reindexa o item
+        if self._postings is None:
+            return
+        self.discard(item.id)
+        self.add(item)
+
+    def _idf(self, posting):
+        return math.log(1 + len(self._terms) / len(posting))
+
+    def _sources(self, palavra, prefixo): #[(posting, idf)] que casam com uma palavra da busca
+        if not prefixo or len(palavra) < PREFIXO_MINIMO:
+            posting = self._postings.get(palavra)
+            return [(posting, self._idf(posting))] if posting else []
+        fontes = []
+        pos = bisect_left(self._vocab, palavra)
+        for termo in self._vocab[pos:pos + MAX_EXPANSOES]:
+            if not termo.startswith(palavra):
+                break
+            posting = self._postings[termo]
+            #casar a palavra inteira vale mais que casar só o começo
+            fontes.append((posting, self._idf(posting) * (1 if termo == palavra else 0.8)))
+        return fontes
+
+    def search(self, query, limit=20): #[(pontuação, id)] dos itens com todas as palavras, melhores primeiro
+        palavras = list(dict.fromkeys(tokenize(query)))
+        if not palavras:
+            return []
+        ultima = len(palavras) - 1
+        #a palavra mais rara escolhe os candidatos; as outras só são consultadas para eles (get no dict)
+        grupos = sorted((self._sources(p, i == ultima) for i, p in enumerate(palavras)),
+                        key=lambda fontes: sum(len(posting) for posting, _ in fontes))
+        if not grupos[0]:
+            return []
+        if len(grupos[0]) == 1: #palavra exata: o próprio posting serve (idf é o mesmo para todos)
+            candidatos, fator = grupos[0][0]
+        else:
+            candidatos, fator = {}, 1
+            for posting, idf in grupos[0]:
+                for item_id, peso in posting.items():
+                    score = peso * idf
+                    if score > candidatos.get(item_id, 0):
+                        candidatos[item_id] = score
+        if len(grupos) == 1: #uma palavra só: nada para cruzar, só escolher os melhores
+            return [(score * fator, item_id) for item_id, score in heapq.nlargest(limit, candidatos.items(), key=itemgetter(1))]
+
+        resultados = []
+        for item_id, score in candidatos.items():
+            score *= fator
+            for fontes in grupos[1:]:
+                melhor = 0
+                for posting, idf in fontes:
+                    peso = posting.get(item_id)
+                    if peso is not None and peso * idf > melhor:
+                        melhor = peso * idf
+                if not melhor:
+                    break
+                score += melhor
+            else:
+                resultados.append((score, item_id))
+        return heapq.nlargest(limit, resultados)
+
+def hit_label(tipo, item): #(título, detalhe) de um resultado, para a CLI e a API
+    if tipo == "contato":
+        return item.name, " - ".join(filter(None, [item.email, item.empresa, item.sales_stage]))
+    if tipo == "lead":
+        return item.name, f"{item.email} - Fonte: {item.source}"
+    return item.title, f"Público: {item.target_stage}"
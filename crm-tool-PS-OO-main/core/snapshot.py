@@ -0,0 +1,160 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from .binary_format import MAGIC, decode_binary, encode_binary, is_binary, iter_binary_sections
+from .streaming import iter_json_sections
+
+#gravação atômica do snapshot: escreve num .tmp, faz fsync e só então troca pelo arquivo
+#oficial (os.replace é atômico). O anterior vira .bak e cada arquivo tem um .sha256 ao lado.
+
+class SnapshotCorrompidoError(Exception):
+    pass
+
+def _checksum_path(path):
+    return path.with_name(path.name + ".sha256")
+
+def backup_path(path):
+    return path.with_name(path.name + ".bak")
+
+FORMATOS = ("json", "binary")
+
+#digest de cada snapshot que este processo gravou ou leu conferindo o checksum, com o tamanho e
+#o mtime do arquivo naquela hora: na rotação para .bak não precisa ler e calcular tudo de novo
+_conferidos = {}
+
+def _lembrar(path, digest):
+    st = path.stat()
+    _conferidos[path.resolve()] = (digest, st.st_size, st.st_mtime_ns)
+
+def _digest_conhecido(path):
+    conhecido = _conferidos.get(path.resolve())
+    if conhecido is None:
+        return None
+    st = path.stat()
+    if (st.st_size, st.st_mtime_ns) != conhecido[1:]: #alguém mexeu no arquivo depois
+        return None
+    return conhecido[0]
+
+def _hash_file(path, chunk_size=1 << 20): #em pedaços, sem carregar o arquivo inteiro
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def encode_snapshot(data, compact=False, formato="json"):
+    if formato == "binary": #registros msgpack com tamanho na frente (core/binary_format.py)
+        return encode_binary(data)
+    if compact: #sem indentação nem espaços: arquivo menor e dump mais rápido
+        text = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    else:
+        text = json.dumps(data, ensure_ascii=False, indent=2)
+    return text.encode("utf-8")
+
+def _fsync_dir(path):
+    if not hasattr(os, "O_DIRECTORY"): #windows não deixa abrir diretório
+        return
+    fd = os.open(path.parent, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _write_file(path, payload: bytes):
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    return tmp
+
+def write_atomic(path, payload: bytes):
+    path = Path(path)
+    digest = hashlib.sha256(payload).hexdigest()
+    tmp = _write_file(path, payload)
+    tmp_sum = _write_file(_checksum_path(path), f"{digest}  {path.name}\n".encode("utf-8"))
+
+    if path.exists() and _is_valid(path): #o snapshot atual vira o último bom conhecido
+        os.replace(path, backup_path(path))
+        if _checksum_path(path).exists():
+            os.replace(_checksum_path(path), _checksum_path(backup_path(path)))
+        else:
+            _checksum_path(backup_path(path)).unlink(missing_ok=True)
+
+    #se cair entre as duas trocas, o arquivo novo fica sem .sha256, mas ele já foi
+    #gravado por inteiro (fsync antes da troca), então continua válido
+    os.replace(tmp, path)
+    os.replace(tmp_sum, _checksum_path(path))
+    _fsync_dir(path)
+    _lembrar(path, digest)
+
+def _is_valid(path): #um snapshot corrompido nunca substitui o .bak bom
+    sum_path = _checksum_path(path)
+    if not sum_path.exists(): #arquivos antigos (sem .sha256) são aceitos como estão
+        return True
+    expected = sum_path.read_text(encoding="utf-8").split()[0]
+    if _digest_conhecido(path) == expected: #o mesmo que foi gravado ou carregado: não relê
+        return True
+    return _hash_file(path) == expected
+
+def write_snapshot(path, data, compact=False, formato="json"):
+    write_atomic(path, encode_snapshot(data, compact=compact, formato=formato))
+
+def decode_snapshot(payload: bytes): #o formato é detectado pelo cabeçalho, não pela extensão
+    if is_binary(payload):
+        return decode_binary(payload)
+    return json.loads(payload.decode("utf-8"))
+
+def read_verified(path):
+    path = Path(path)
+    payload = path.read_bytes()
+    sum_path = _checksum_path(path)
+    if sum_path.exists(): #arquivos antigos (sem .sha256) são aceitos como estão
+        expected = sum_path.read_text(encoding="utf-8").split()[0]
+        if hashlib.sha256(payload).hexdigest() != expected:
+            raise SnapshotCorrompidoError(f"Checksum de '{path.name}' não confere")
+        _lembrar(path, expected)
+    return payload
+
+def iter_snapshot(path, chunk_size=1 << 20):
+    #versão em streaming: devolve (secao, registro) um por vez e confere o checksum
+    #calculado durante a própria leitura (se não bater, o erro vem no fim)
+    path = Path(path)
+    if not path.exists():
+        return
+    sum_path = _checksum_path(path)
+    expected = sum_path.read_text(encoding="utf-8").split()[0] if sum_path.exists() else None
+    hasher = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            binario = is_binary(f.read(len(MAGIC)))
+            f.seek(0)
+            iter_sections = iter_binary_sections if binario else iter_json_sections
+            yield from iter_sections(f, chunk_size, on_chunk=hasher.update)
+    except ValueError as e: #JSONDecodeError e UnicodeDecodeError também são ValueError
+        raise SnapshotCorrompidoError(f"'{path.name}' inválido: {e}")
+    if expected is not None:
+        if hasher.hexdigest() != expected:
+            raise SnapshotCorrompidoError(f"Checksum de '{path.name}' não confere")
+        _lembrar(path, expected)
+
+def read_snapshot(path):
+    #lê o snapshot verificando o checksum; se estiver corrompido, usa o último bom (.bak)
+    path = Path(path)
+    candidatos = [p for p in (path, backup_path(path)) if p.exists()]
+    if not candidatos:
+        return {}
+
+    ultimo_erro = None
+    for candidato in candidatos:
+        try:
+            data = decode_snapshot(read_verified(candidato))
+            if candidato != path:
+                motivo = ultimo_erro or "arquivo ausente"
+                print(f"AVISO: '{path.name}' inválido ({motivo}). Usando o último snapshot bom '{candidato.name}'.")
+            return data
+        except (SnapshotCorrompidoError, ValueError) as e:
+            ultimo_erro = e
+    raise SnapshotCorrompidoError(f"Nenhum snapshot válido encontrado para '{path.name}': {ultimo_erro}")
@@ -0,0 +1,512 @@
+import itertools
+import json
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+from .journal import ChangeJournal
+from .snapshot import FORMATOS, SnapshotCorrompidoError, backup_path, iter_snapshot, read_snapshot, write_snapshot
+
+ENTIDADES = ("contatos", "leads", "campanhas", "documents", "outbox", "envios")
+
+class StorageBackend(ABC): #interface que o CRM usa para persistir, sem saber onde os dados ficam
+    @abstractmethod
+    def load(self) -> dict: #retorna {"contatos": [dict, ...], "leads": [...], ...}
+        pass
+
+    @abstractmethod
+    def save_snapshot(self, data: dict) -> None: #regrava tudo
+        pass
+
+    @abstractmethod
+    def upsert(self, entity: str, record: dict) -> None: #insere ou atualiza UM registro
+        pass
+
+    @abstractmethod
+    def delete(self, entity: str, obj_id) -> None:
+        pass
+
+    @abstractmethod
+    def append(self, entity: str, record: dict) -> None: #entidades sem id (documents)
+        pass
+
+    @abstractmethod
+    def get(self, entity: str, obj_id):
+        pass
+
+    def iter_records(self, fallback=False): #(entity, dict) um por vez; fallback: usar a cópia de segurança
+        for entity, records in self.load().items():
+            for record in records:
+                yield entity, record
+
+    def write_batch(self, changes) -> None: #[(op, entity, record, id), ...] gravadas de uma vez
+        #op "delete_many": id é a lista de ids removidos (ex: a baixa de um lote do outbox)
+        for op, entity, record, obj_id in changes:
+            if op == "upsert":
+                self.upsert(entity, record)
+            elif op == "delete":
+                self.delete(entity, obj_id)
+            elif op == "delete_many":
+                for i in obj_id:
+                    self.delete(entity, i)
+            elif op == "append":
+                self.append(entity, record)
+
+    def compact(self, snapshot_fn) -> None: #snapshot_fn só é chamado se o backend precisar do estado completo
+        pass
+
+    def needs_compaction(self) -> bool:
+        return False
+
+    def close(self) -> None:
+        pass
+
+#------------------------------ JSON ------------------------------
+def _separar_geracao(registros):
+    #o snapshot começa pela seção "meta" ({"geracao": n}); os antigos não têm e são a geração 0
+    registros = iter(registros)
+    primeiro = next(registros, None)
+    if primeiro is None:
+        return 0, registros
+    if primeiro[0] == "meta":
+        return primeiro[1].get("geracao", 0), registros
+    return 0, itertools.chain([primeiro], registros)
+
+def _ler_geracao(path):
+    registros = iter_snapshot(path)
+    try:
+        return _separar_geracao(registros)[0]
+    except SnapshotCorrompidoError:
+        return 0
+    finally:
+        registros.close() #só precisava do começo do arquivo
+
+class JsonStorage(StorageBackend): #snapshot crm_data.json (ou crm_data.bin) + journal append-only
+    def __init__(self, data_file, journal_file, compact_every=500, fsync=False, compact_json=False,
+                 snapshot_format="json", other_file=None):
+        if snapshot_format not in FORMATOS:
+            raise ValueError(f"Formato de snapshot '{snapshot_format}' não suportado :( Formatos disponíveis: {list(FORMATOS)}")
+        self.data_file = Path(data_file)
+        self.compact_json = compact_json #snapshot sem indentação
+        self.snapshot_format = snapshot_format
+        self._journal = ChangeJournal(journal_file, compact_every=compact_every, fsync=fsync)
+        self._lock = threading.RLock() #nada entra no journal entre o snapshot e o reset
+        self._geracao = None #geração do snapshot atual (cada compactação grava a seguinte)
+        if other_file is not None:
+            self._convert_from(Path(other_file))
+
+    def _convert_from(self, other):
+        #trocou de formato (json <-> binary): o snapshot do outro formato é convertido uma vez.
+        #Só se ele for mais novo; o journal continua valendo por cima dele
+        if not other.exists():
+            return
+        if self.data_file.exists() and self.data_file.stat().st_mtime_ns >= other.stat().st_mtime_ns:
+            return
+        write_snapshot(self.data_file, read_snapshot(other), compact=self.compact_json, formato=self.snapshot_format)
+        print(f"INFO: snapshot '{other.name}' convertido para '{self.data_file.name}' ({self.snapshot_format}).")
+
+    def load(self):
+        data = read_snapshot(self.data_file) #confere o checksum e cai para o .bak se precisar
+        meta = data.pop("meta", None) or [{}]
+        self._geracao = meta[0].get("geracao", 0)
+        return self._journal.apply_to(data, self._geracao) #mudanças que ainda não foram compactadas
+
+    def iter_records(self, fallback=False):
+        #lê o snapshot em streaming e aplica o journal registro a registro, sem montar o arquivo todo
+        path = self.data_file
+        if fallback or not path.exists(): #sem o arquivo principal (crash entre as trocas), usa o .bak
+            path = backup_path(self.data_file)
+            if fallback and not path.exists(): #principal inválido e nada para cair: não carrega vazio
+                raise SnapshotCorrompidoError(f"'{self.data_file.name}' inválido e não existe '{path.name}'")
+
+        self._geracao, registros = _separar_geracao(iter_snapshot(path))
+        overrides, appends = self._journal.pending_changes(self._geracao)
+        for entity, record in registros:
+            mudancas = overrides.get(entity)
+            if mudancas and record.get("id") in mudancas:
+                record = mudancas.pop(record["id"])
+                if record is None: #removido depois do snapshot
+                    continue
+            yield entity, record
+
+        for entity, mudancas in overrides.items(): #registros criados depois do snapshot
+            for record in mudancas.values():
+                if record is not None:
+                    yield entity, record
+        yield from appends
+
+    def save_snapshot(self, data):
+        with self._lock:
+            if self._geracao is None: #ainda não leu o snapshot
+                self._geracao = _ler_geracao(self.data_file)
+            #depois de cair para o .bak o journal pode ser de uma geração mais nova que a carregada
+            geracao = max(self._geracao, self._journal.geracao) + 1
+            #temp + fsync + rename: um crash no meio nunca deixa o arquivo pela metade
+            write_snapshot(self.data_file, {"meta": [{"geracao": geracao}], **data},
+                           compact=self.compact_json, formato=self.snapshot_format)
+            self._geracao = geracao
+            #tudo que estava no journal agora está no snapshot. Se cair antes do reset,
+            #o journal ainda é da geração anterior e é descartado na leitura
+            self._journal.reset(geracao)
+
+    def upsert(self, entity, record):
+        self.write_batch([("upsert", entity, record, record.get("id"))])
+
+    def delete(self, entity, obj_id):
+        self.write_batch([("delete", entity, None, obj_id)])
+
+    def append(self, entity, record):
+        self.write_batch([("append", entity, record, None)])
+
+    def write_batch(self, changes):
+        with self._lock:
+            self._journal.append_many(changes)
+
+    def get(self, entity, obj_id): #o JSON não tem índice, então lê tudo
+        for record in self.load().get(entity, []):
+            if record.get("id") == obj_id:
+                return record
+        return None
+
+    def compact(self, snapshot_fn):
+        with self._lock:
+            self.save_snapshot(snapshot_fn())
+
+    def needs_compaction(self):
+        return self._journal.needs_compaction()
+
+    def close(self):
+        self._journal.close()
+
+#------------------------------ SQLite ------------------------------
+#datas são timestamps (int); NUMERIC guarda o número como INTEGER e o texto dos dados antigos como está.
+#Bancos criados com TEXT devolvem o número como texto, o que o parse_timestamp também aceita
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS contatos (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    email TEXT NOT NULL,
+    telefone TEXT,
+    empresa TEXT,
+    notas TEXT,
+    sales_stage TEXT,
+    stage_history TEXT,
+    created_at NUMERIC
+);
+CREATE TABLE IF NOT EXISTS leads (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    email TEXT NOT NULL,
+    source TEXT,
+    created_at NUMERIC,
+    score INTEGER,
+    converted INTEGER
+);
+CREATE TABLE IF NOT EXISTS campanhas (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL,
+    description TEXT,
+    target_stage TEXT,
+    sent_to TEXT,
+    created_at NUMERIC,
+    agendamento TEXT
+);
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    contato_id INTEGER REFERENCES contatos(id) ON DELETE CASCADE,
+    title TEXT,
+    file_path TEXT,
+    doc_type TEXT,
+    created_at NUMERIC,
+    size TEXT
+);
+CREATE TABLE IF NOT EXISTS activities (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    contato_id INTEGER NOT NULL REFERENCES contatos(id) ON DELETE CASCADE,
+    type TEXT,
+    description TEXT,
+    date NUMERIC
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    contato_id INTEGER NOT NULL REFERENCES contatos(id) ON DELETE CASCADE,
+    title TEXT,
+    date TEXT,
+    completed INTEGER
+);
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY,
+    event TEXT NOT NULL,
+    data TEXT,
+    created_ts INTEGER
+);
+CREATE TABLE IF NOT EXISTS envios (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    campanha_id INTEGER,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_envios_campanha ON envios(campanha_id);
+CREATE INDEX IF NOT EXISTS idx_contatos_email ON contatos(email);
+CREATE INDEX IF NOT EXISTS idx_contatos_stage ON contatos(sales_stage);
+CREATE INDEX IF NOT EXISTS idx_leads_email ON leads(email);
+CREATE INDEX IF NOT EXISTS idx_leads_source ON leads(source);
+CREATE INDEX IF NOT EXISTS idx_leads_converted ON leads(converted);
+CREATE INDEX IF NOT EXISTS idx_campanhas_stage ON campanhas(target_stage);
+CREATE INDEX IF NOT EXISTS idx_documents_contato ON documents(contato_id);
+CREATE INDEX IF NOT EXISTS idx_activities_contato ON activities(contato_id);
+CREATE INDEX IF NOT EXISTS idx_tasks_contato ON tasks(contato_id);
+"""
+
+class SQLiteStorage(StorageBackend): #um registro por linha, escrita e busca por índice
+    def __init__(self, db_file, seed_from: StorageBackend = None, fsync=False):
+        self.db_file = Path(db_file)
+        novo = not self.db_file.exists()
+        self._lock = threading.Lock() #a mesma conexão é usada pelas threads da API
+        self._conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        #FULL: o commit só retorna depois do fsync; NORMAL: no WAL pode perder os últimos commits numa queda de energia
+        self._conn.execute("PRAGMA synchronous=FULL" if fsync else "PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(SCHEMA)
+        colunas = {r["name"] for r in self._conn.execute("PRAGMA table_info(campanhas)")}
+        if "agendamento" not in colunas: #bancos criados antes do agendador
+            self._conn.execute("ALTER TABLE campanhas ADD COLUMN agendamento TEXT")
+
+        if novo and seed_from is not None: #primeira vez: importa o que existia no backend antigo
+            self.save_snapshot(seed_from.load())
+
+    #--- conversão linha <-> dict no mesmo formato do to_dict() dos modelos ---
+    def _write_contato(self, cur, c):
+        cur.execute(
+            "INSERT OR REPLACE INTO contatos (id, name, email, telefone, empresa, notas, sales_stage, stage_history, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (c["id"], c["name"], c["email"], c.get("telefone"), c.get("empresa", ""), c.get("notas", ""),
+             c.get("sales_stage"), json.dumps(c.get("stage_history", []), ensure_ascii=False), c.get("created_at"))
+        )
+        #filhos são regravados junto com o contato (custo proporcional ao próprio registro)
+        for tabela in ("activities", "tasks", "documents"):
+            cur.execute(f"DELETE FROM {tabela} WHERE contato_id = ?", (c["id"],))
+        cur.executemany(
+            "INSERT INTO activities (contato_id, type, description, date) VALUES (?, ?, ?, ?)",
+            [(c["id"], a["type"], a["description"], a.get("date")) for a in c.get("activities", [])]
+        )
+        cur.executemany(
+            "INSERT INTO tasks (contato_id, title, date, completed) VALUES (?, ?, ?, ?)",
+            [(c["id"], t["title"], t["date"], int(t.get("completed", False))) for t in c.get("tasks", [])]
+        )
+        cur.executemany(
+            "INSERT INTO documents (contato_id, title, file_path, doc_type, created_at, size) VALUES (?, ?, ?, ?, ?, ?)",
+            [(c["id"], d["title"], d["file_path"], d.get("doc_type"), d.get("created_at"), d.get("size"))
+             for d in c.get("documents", [])]
+        )
+
+    def _write_lead(self, cur, l):
+        cur.execute(
+            "INSERT OR REPLACE INTO leads (id, name, email, source, created_at, score, converted) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (l["id"], l["name"], l["email"], l.get("source"), l.get("created_at"),
+             l.get("score", 0), int(l.get("converted", False)))
+        )
+
+    def _write_campanha(self, cur, c):
+        cur.execute(
+            "INSERT OR REPLACE INTO campanhas (id, title, description, target_stage, sent_to, created_at, agendamento) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (c["id"], c["title"], c.get("description"), c.get("target_stage"),
+             json.dumps(c.get("entregas", c.get("sent_to", []))), c.get("created_at"),
+             json.dumps(c["agendamento"]) if c.get("agendamento") else None)
+        )
+        #a linha da campanha já tem o progresso de todos os checkpoints anteriores: eles não precisam
+        #mais ser reaplicados na carga (sem isso a tabela envios crescia a cada lote para sempre)
+        cur.execute("DELETE FROM envios WHERE campanha_id = ?", (c["id"],))
+
+    def _write_outbox(self, cur, e):
+        cur.execute(
+            "INSERT OR REPLACE INTO outbox (id, event, data, created_ts) VALUES (?, ?, ?, ?)",
+            (e["id"], e["event"], json.dumps(e.get("data"), ensure_ascii=False), e.get("created_ts"))
+        )
+
+    def _write_document(self, cur, d, contato_id=None):
+        cur.execute(
+            "INSERT INTO documents (contato_id, title, file_path, doc_type, created_at, size) VALUES (?, ?, ?, ?, ?, ?)",
+            (contato_id, d["title"], d["file_path"], d.get("doc_type"), d.get("created_at"), d.get("size"))
+        )
+
+    @staticmethod
+    def _document_row(r):
+        return {"title": r["title"], "file_path": r["file_path"], "doc_type": r["doc_type"],
+                "created_at": r["created_at"], "size": r["size"]}
+
+    def _contato_row(self, r, activities, tasks, documents):
+        return {
+            "id": r["id"], "name": r["name"], "email": r["email"], "telefone": r["telefone"],
+            "empresa": r["empresa"], "notas": r["notas"], "sales_stage": r["sales_stage"],
+            "stage_history": json.loads(r["stage_history"] or "[]"), "created_at": r["created_at"],
+            "activities": activities, "tasks": tasks, "documents": documents
+        }
+
+    @staticmethod
+    def _lead_row(r):
+        return {"id": r["id"], "name": r["name"], "email": r["email"], "source": r["source"],
+                "created_at": r["created_at"], "score": r["score"], "converted": bool(r["converted"])}
+
+    @staticmethod
+    def _outbox_row(r):
+        return {"id": r["id"], "event": r["event"], "data": json.loads(r["data"] or "null"), "created_ts": r["created_ts"]}
+
+    @staticmethod
+    def _campanha_row(r):
+        campanha = {"id": r["id"], "title": r["title"], "description": r["description"],
+                    "target_stage": r["target_stage"], "created_at": r["created_at"]}
+        entregas = json.loads(r["sent_to"] or "[]") #a coluna guarda o estado compacto (ou a lista antiga)
+        campanha["entregas" if isinstance(entregas, dict) else "sent_to"] = entregas
+        if r["agendamento"]:
+            campanha["agendamento"] = json.loads(r["agendamento"])
+        return campanha
+
+    #--- interface StorageBackend ---
+    def load(self):
+        with self._lock:
+            cur = self._conn.cursor()
+            activities, tasks, documents = {}, {}, {}
+            for r in cur.execute("SELECT * FROM activities ORDER BY id"):
+                activities.setdefault(r["contato_id"], []).append(
+                    {"type": r["type"], "description": r["description"], "date": r["date"]})
+            for r in cur.execute("SELECT * FROM tasks ORDER BY id"):
+                tasks.setdefault(r["contato_id"], []).append(
+                    {"title": r["title"], "date": r["date"], "completed": bool(r["completed"])})
+            soltos = []
+            for r in cur.execute("SELECT * FROM documents ORDER BY id"):
+                if r["contato_id"] is None:
+                    soltos.append(self._document_row(r))
+                else:
+                    documents.setdefault(r["contato_id"], []).append(self._document_row(r))
+
+            return {
+                "contatos": [
+                    self._contato_row(r, activities.get(r["id"], []), tasks.get(r["id"], []), documents.get(r["id"], []))
+                    for r in cur.execute("SELECT * FROM contatos ORDER BY rowid")
+                ],
+                "campanhas": [self._campanha_row(r) for r in cur.execute("SELECT * FROM campanhas ORDER BY rowid")],
+                "leads": [self._lead_row(r) for r in cur.execute("SELECT * FROM leads ORDER BY rowid")],
+                "documents": soltos,
+                "outbox": [self._outbox_row(r) for r in cur.execute("SELECT * FROM outbox ORDER BY id")],
+                "envios": [json.loads(r["data"]) for r in cur.execute("SELECT * FROM envios ORDER BY id")]
+            }
+
+    def save_snapshot(self, data):
+        with self._lock, self._conn: #uma transação só: ou grava tudo ou nada
+            cur = self._conn.cursor()
+            for tabela in ("activities", "tasks", "documents", "contatos", "leads", "campanhas", "outbox", "envios"):
+                cur.execute(f"DELETE FROM {tabela}")
+            for c in data.get("contatos", []):
+                self._write_contato(cur, c)
+            for l in data.get("leads", []):
+                self._write_lead(cur, l)
+            for c in data.get("campanhas", []):
+                self._write_campanha(cur, c)
+            for d in data.get("documents", []):
+                self._write_document(cur, d)
+            for e in data.get("outbox", []):
+                self._write_outbox(cur, e)
+
+    def _apply(self, cur, op, entity, record, obj_id):
+        writers = {
+            "contatos": self._write_contato,
+            "leads": self._write_lead,
+            "campanhas": self._write_campanha,
+            "outbox": self._write_outbox
+        }
+        if op == "upsert":
+            if entity not in writers:
+                raise ValueError(f"Entidade '{entity}' não suportada :( Use: {list(writers.keys())}")
+            writers[entity](cur, record)
+        elif op == "delete":
+            if entity not in writers:
+                raise ValueError(f"Entidade '{entity}' não suportada para remoção")
+            #atividades, tarefas e documentos do contato caem junto (ON DELETE CASCADE)
+            cur.execute(f"DELETE FROM {entity} WHERE id = ?", (obj_id,))
+            if entity == "campanhas":
+                cur.execute("DELETE FROM envios WHERE campanha_id = ?", (obj_id,))
+        elif op == "delete_many":
+            if entity != "outbox":
+                raise ValueError(f"Entidade '{entity}' não suportada para remoção em lote")
+            cur.executemany("DELETE FROM outbox WHERE id = ?", [(i,) for i in obj_id])
+        elif op == "append":
+            if entity == "envios": #checkpoint de envio de campanha (vira parte da campanha no próximo snapshot)
+                cur.execute("INSERT INTO envios (campanha_id, data) VALUES (?, ?)",
+                            (record.get("campanha_id"), json.dumps(record, ensure_ascii=False)))
+            elif entity == "documents":
+                self._write_document(cur, record)
+            else:
+                raise ValueError(f"Entidade '{entity}' não suportada para append")
+
+    def upsert(self, entity, record):
+        self.write_batch([("upsert", entity, record, record.get("id"))])
+
+    def delete(self, entity, obj_id):
+        self.write_batch([("delete", entity, None, obj_id)])
+
+    def append(self, entity, record):
+        self.write_batch([("append", entity, record, None)])
+
+    def write_batch(self, changes): #o lote inteiro numa transação só
+        with self._lock, self._conn:
+            cur = self._conn.cursor()
+            for op, entity, record, obj_id in changes:
+                self._apply(cur, op, entity, record, obj_id)
+
+    def get(self, entity, obj_id): #busca direta pela chave primária
+        with self._lock:
+            cur = self._conn.cursor()
+            if entity == "leads":
+                r = cur.execute("SELECT * FROM leads WHERE id = ?", (obj_id,)).fetchone()
+                return self._lead_row(r) if r else None
+            if entity == "campanhas":
+                r = cur.execute("SELECT * FROM campanhas WHERE id = ?", (obj_id,)).fetchone()
+                return self._campanha_row(r) if r else None
+            if entity == "contatos":
+                r = cur.execute("SELECT * FROM contatos WHERE id = ?", (obj_id,)).fetchone()
+                if not r:
+                    return None
+                activities = [{"type": a["type"], "description": a["description"], "date": a["date"]}
+                              for a in cur.execute("SELECT * FROM activities WHERE contato_id = ? ORDER BY id", (obj_id,))]
+                tasks = [{"title": t["title"], "date": t["date"], "completed": bool(t["completed"])}
+                         for t in cur.execute("SELECT * FROM tasks WHERE contato_id = ? ORDER BY id", (obj_id,))]
+                documents = [self._document_row(d)
+                             for d in cur.execute("SELECT * FROM documents WHERE contato_id = ? ORDER BY id", (obj_id,))]
+                return self._contato_row(r, activities, tasks, documents)
+        raise ValueError(f"Entidade '{entity}' não suportada")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+#------------------------------ Escolha do backend ------------------------------
+def create_storage(kind, data_file, journal_file, db_file, compact_every=500,
+                   durability=None, flush_interval_ms=200, flush_max_pending=1000, compact_json=False,
+                   snapshot_format="json", binary_file=None):
+    from .write_behind import Durability, WriteBehindStorage
+
+    kind = (kind or "json").lower()
+    durability = Durability(durability.lower()) if durability else None
+    fsync = durability in (Durability.STRICT, Durability.BATCH)
+
+    snapshot_format = (snapshot_format or "json").lower()
+    snapshot_file, other_file = data_file, binary_file
+    if snapshot_format == "binary":
+        snapshot_file, other_file = binary_file, data_file
+
+    json_storage = JsonStorage(snapshot_file, journal_file, compact_every=compact_every, fsync=fsync,
+                               compact_json=compact_json, snapshot_format=snapshot_format, other_file=other_file)
+    if kind == "json":
+        storage = json_storage
+    elif kind == "sqlite":
+        storage = SQLiteStorage(db_file, seed_from=json_storage, fsync=fsync)
+    else:
+        raise ValueError(f"Backend '{kind}' não suportado :( Backends disponíveis: ['json', 'sqlite']")
+
+    if durability in (Durability.BATCH, Durability.RELAXED): #mudanças acumulam em memória e vão em lote
+        return WriteBehindStorage(storage, durability, flush_interval_ms, flush_max_pending)
+    return storage
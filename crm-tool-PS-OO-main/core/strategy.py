@@ -30,7 +30,8 @@ class AdminMenuStrategy(MenuStrategy):
             "14. Relatórios e Analytics",
             "15. Importar lead externo",
             "16. Iniciar servidor online",
-            "17. Sair"
+            "17. Buscar",
+            "18. Sair"
         ]
         
 class VendedorMenuStrategy(MenuStrategy):
@@ -45,7 +46,8 @@ class VendedorMenuStrategy(MenuStrategy):
             "7. Atualizar estágio de venda",
             "8. Adicionar documento",
             "9. Relatórios básicos",
-            "10. Sair"
+            "10. Buscar",
+            "11. Sair"
         ]
         
 class MarketingMenuStrategy(MenuStrategy):
@@ -58,5 +60,6 @@ class MarketingMenuStrategy(MenuStrategy):
             "5. Criar campanha de email",
             "6. Enviar campanha de email",
             "7. Relatórios de campanhas",
-            "8. Sair"
+            "8. Buscar",
+            "9. Sair"
         ]
\ No newline at end of file
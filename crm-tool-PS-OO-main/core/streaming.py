@@ -0,0 +1,105 @@
+import codecs
+import json
+import re
+
+_WS = re.compile(r"[ \t\n\r]*")
+_DELIMITADORES = " \t\n\r,:]}"
+
+class _Buffer:
+    #lê o arquivo aos pedaços e decodifica o utf-8 aos poucos (um caractere pode ficar dividido entre dois pedaços)
+    def __init__(self, f, chunk_size, on_chunk=None):
+        self._f = f
+        self._chunk_size = chunk_size
+        self._on_chunk = on_chunk
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self.text = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        if self.eof:
+            return False
+        chunk = self._f.read(self._chunk_size)
+        if self._on_chunk is not None:
+            self._on_chunk(chunk)
+        if not chunk:
+            self.eof = True
+            novo = self._decoder.decode(b"", final=True)
+        else:
+            novo = self._decoder.decode(chunk)
+        self.text = self.text[self.pos:] + novo #descarta o que já foi consumido
+        self.pos = 0
+        return True
+
+    def skip_ws(self):
+        while True:
+            self.pos = _WS.match(self.text, self.pos).end()
+            if self.pos < len(self.text) or not self.fill():
+                return
+
+    def peek(self):
+        self.skip_ws()
+        if self.pos >= len(self.text):
+            raise json.JSONDecodeError("Fim inesperado do arquivo", self.text, self.pos)
+        return self.text[self.pos]
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise json.JSONDecodeError(f"Esperado '{char}'", self.text, self.pos)
+        self.pos += 1
+
+    def value(self, decoder):
+        self.skip_ws()
+        while True:
+            try:
+                obj, end = decoder.raw_decode(self.text, self.pos)
+                #um número no fim do pedaço pode estar cortado ("12" de "123" ou "2" de "2.5"),
+                #então só aceita se o que vem depois for um separador do JSON
+                if self.eof or (end < len(self.text) and self.text[end] in _DELIMITADORES):
+                    self.pos = end
+                    return obj
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+
+def iter_json_sections(f, chunk_size=1 << 20, on_chunk=None):
+    #percorre um arquivo {"secao": [registro, ...], ...} devolvendo (secao, registro) um por vez,
+    #sem carregar o arquivo inteiro nem montar todas as listas na memória
+    decoder = json.JSONDecoder()
+    buf = _Buffer(f, chunk_size, on_chunk)
+    buf.fill()
+    if buf.peek() == "\ufeff": #BOM
+        buf.pos += 1
+    buf.expect("{")
+    if buf.peek() == "}":
+        buf.pos += 1
+    else:
+        while True:
+            key = buf.value(decoder)
+            buf.expect(":")
+            if buf.peek() == "[":
+                buf.pos += 1
+                if buf.peek() == "]":
+                    buf.pos += 1
+                else:
+                    while True:
+                        yield key, buf.value(decoder)
+                        sep = buf.peek()
+                        buf.pos += 1
+                        if sep == "]":
+                            break
+                        if sep != ",":
+                            raise json.JSONDecodeError("Esperado ',' ou ']'", buf.text, buf.pos - 1)
+            else:
+                buf.value(decoder) #seções que não são listas são ignoradas
+            sep = buf.peek()
+            buf.pos += 1
+            if sep == "}":
+                break
+            if sep != ",":
+                raise json.JSONDecodeError("Esperado ',' ou '}'", buf.text, buf.pos - 1)
+
+    buf.skip_ws() #vai até o fim do arquivo (o checksum precisa ver todos os bytes)
+    if buf.pos < len(buf.text):
+        raise json.JSONDecodeError("Conteúdo extra depois do JSON", buf.text, buf.pos)
@@ -0,0 +1,159 @@
+import threading
+import time
+from enum import Enum
+
+from .storage import StorageBackend
+
+class Durability(Enum):
+    STRICT = "strict"   #sem write-behind: cada mudança é gravada e vai para o disco (fsync) antes de retornar
+    BATCH = "batch"     #write-behind: mudanças vão em lote, com um fsync por lote
+    RELAXED = "relaxed" #write-behind sem fsync: o sistema operacional decide quando grava no disco
+
+#DECORATOR de StorageBackend: as mudanças ficam pendentes em memória e uma thread
+#grava tudo de uma vez (no máximo a cada flush_interval_ms ou quando juntar flush_max_pending)
+class WriteBehindStorage(StorageBackend):
+    def __init__(self, inner: StorageBackend, durability=Durability.BATCH,
+                 flush_interval_ms=200, flush_max_pending=1000):
+        self._inner = inner
+        self.durability = durability
+        self.flush_interval = flush_interval_ms / 1000
+        self.flush_max_pending = flush_max_pending
+
+        #(entity, id) -> (op, entity, record, id): várias mudanças no mesmo registro viram uma só
+        self._pending = {}
+        self._appends = [] #documents não têm id, então não dá para juntar
+        self._cond = threading.Condition()
+        self._io_lock = threading.Lock() #um flush por vez
+        self._closing = False
+        self.flushes = 0
+
+        self._thread = threading.Thread(target=self._run, name="crm-write-behind", daemon=True)
+        self._thread.start()
+
+    def _pending_count(self):
+        return len(self._pending) + len(self._appends)
+
+    def _enqueue(self, change):
+        op, entity, record, obj_id = change
+        with self._cond:
+            if self._closing:
+                raise RuntimeError("Storage já foi fechado")
+            if op == "append":
+                self._appends.append(change)
+            elif op == "delete_many": #separa por id para juntar com as outras mudanças de cada registro
+                for i in obj_id:
+                    self._pending.pop((entity, i), None)
+                    self._pending[(entity, i)] = ("delete", entity, None, i)
+            else:
+                self._pending.pop((entity, obj_id), None) #reinsere no fim para manter a ordem das mudanças
+                self._pending[(entity, obj_id)] = change
+            count = self._pending_count()
+            if count == 1 or count >= self.flush_max_pending:
+                self._cond.notify()
+
+    def _take_pending(self):
+        with self._cond:
+            changes = list(self._pending.values()) + self._appends
+            self._pending = {}
+            self._appends = []
+            return changes
+
+    def _requeue(self, changes): #se o flush falhar, as mudanças voltam sem passar por cima das mais novas
+        with self._cond:
+            pending = {}
+            appends = []
+            for change in changes:
+                op, entity, record, obj_id = change
+                if op == "append":
+                    appends.append(change)
+                elif (entity, obj_id) not in self._pending:
+                    pending[(entity, obj_id)] = change
+            pending.update(self._pending)
+            self._pending = pending
+            self._appends = appends + self._appends
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending_count() and not self._closing:
+                    self._cond.wait()
+                if self._closing:
+                    break
+                #debounce: espera o intervalo juntar mais mudanças (acorda antes se bater o limite)
+                deadline = time.monotonic() + self.flush_interval
+                while not self._closing and self._pending_count() < self.flush_max_pending:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(timeout=remaining)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"ERRO ao gravar mudanças pendentes: {e}")
+                time.sleep(self.flush_interval) #evita ficar tentando sem parar
+
+    def flush(self):
+        with self._io_lock:
+            changes = self._take_pending()
+            if not changes:
+                return
+            try:
+                self._inner.write_batch(changes)
+            except Exception:
+                self._requeue(changes)
+                raise
+            self.flushes += 1
+
+    #--- interface StorageBackend ---
+    def load(self):
+        self.flush()
+        return self._inner.load()
+
+    def iter_records(self, fallback=False):
+        self.flush()
+        return self._inner.iter_records(fallback)
+
+    def save_snapshot(self, data):
+        with self._io_lock:
+            self._take_pending() #o snapshot já contém tudo que estava pendente
+            self._inner.save_snapshot(data)
+
+    def upsert(self, entity, record):
+        self._enqueue(("upsert", entity, record, record.get("id")))
+
+    def delete(self, entity, obj_id):
+        self._enqueue(("delete", entity, None, obj_id))
+
+    def append(self, entity, record):
+        self._enqueue(("append", entity, record, None))
+
+    def write_batch(self, changes):
+        for change in changes:
+            self._enqueue(change)
+
+    def get(self, entity, obj_id): #lê primeiro o que ainda não foi gravado
+        with self._cond:
+            change = self._pending.get((entity, obj_id))
+        if change is not None:
+            return change[2] if change[0] == "upsert" else None
+        return self._inner.get(entity, obj_id)
+
+    def compact(self, snapshot_fn):
+        with self._io_lock:
+            changes = self._take_pending()
+            if changes:
+                self._inner.write_batch(changes)
+            self._inner.compact(snapshot_fn)
+
+    def needs_compaction(self):
+        return self._inner.needs_compaction()
+
+    def close(self): #flush garantido antes de fechar
+        with self._cond:
+            if self._closing:
+                return
+            self._closing = True
+            self._cond.notify_all()
+        self._thread.join()
+        self.flush()
+        self._inner.close()
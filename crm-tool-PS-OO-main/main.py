@@ -64,7 +64,8 @@ def main():
             invoker.register_command("14", LoggingCommandDecorator(ReportSummaryCommand(crm)))
             invoker.register_command("15", LoggingCommandDecorator(ImportExternalLeadCommand(crm)))
             invoker.register_command("16", LoggingCommandDecorator(StartServerCommand(crm)))
-            invoker.register_command("17", exit_command)
+            invoker.register_command("17", LoggingCommandDecorator(SearchCommand(crm)))
+            invoker.register_command("18", exit_command)
         
         elif crm.current_user_role == UserRole.VENDEDOR:
             invoker.register_command("2", LoggingCommandDecorator(AddContactCommand(crm)))
@@ -75,7 +76,8 @@ def main():
             invoker.register_command("7", LoggingCommandDecorator(UpdateSalesStageCommand(crm)))
             invoker.register_command("8", LoggingCommandDecorator(AddDocumentCommand(crm)))
             invoker.register_command("9", LoggingCommandDecorator(ReportSummaryCommand(crm)))
-            invoker.register_command("10", exit_command)
+            invoker.register_command("10", LoggingCommandDecorator(SearchCommand(crm)))
+            invoker.register_command("11", exit_command)
         
         elif crm.current_user_role == UserRole.MARKETING:
             invoker.register_command("2", LoggingCommandDecorator(AddLeadCommand(crm)))
@@ -84,7 +86,8 @@ def main():
             invoker.register_command("5", LoggingCommandDecorator(AddEmailCampaignCommand(crm)))
             invoker.register_command("6", LoggingCommandDecorator(SendEmailCampaignCommand(crm)))
             invoker.register_command("7", LoggingCommandDecorator(ReportSummaryCommand(crm)))
-            invoker.register_command("8", exit_command)
+            invoker.register_command("8", LoggingCommandDecorator(SearchCommand(crm)))
+            invoker.register_command("9", exit_command)
             
         menu_options = crm.get_menu_by_role()
         print(f"\n--- CRM - {crm.current_user_role.value.upper()} ---")
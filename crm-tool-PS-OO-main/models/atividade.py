@@ -1,24 +1,36 @@
-from datetime import datetime
-from .base import Serializavel
+from .base import Serializavel, ACTIVITY_TYPES, DATETIME_FORMAT, dump_timestamp, format_timestamp, to_timestamp
 
 class Atividade(Serializavel):
-    def __init__(self, type, description):
+    __slots__ = ("type_code", "description", "date_ts")
+    CAMPOS_TIMESTAMP = ("date",) #ver LazyList
+
+    def __init__(self, type, description, date=None):
         self.type = type
         self.description = description
-        self.date = datetime.now().strftime("%d/%m/%Y %H:%M")
+        self.date_ts = to_timestamp(date) #timestamp; o texto só é montado na saída
+
+    @property
+    def date(self):
+        return format_timestamp(self.date_ts, DATETIME_FORMAT)
+
+    @property
+    def type(self): #guardado como código inteiro (ver CodeTable em base.py)
+        return ACTIVITY_TYPES.name(self.type_code)
+
+    @type.setter
+    def type(self, value):
+        self.type_code = ACTIVITY_TYPES.code(value)
     
     def to_dict(self):
         return {
             "type": self.type,
             "description": self.description,
-            "date": self.date
+            "date": dump_timestamp(self.date_ts) #segundos, sem perder a hora nem depender do fuso ao ler
         }
     
     @classmethod
     def from_dict(cls, data):
-        atividade = cls(data["type"], data["description"])
-        atividade.date = data.get("date", datetime.now().strftime("%d/%m/%Y %H:%M"))
-        return atividade
+        return cls(data["type"], data["description"], data.get("date"))
 
 
 # todo tracking vou nao hahaa
\ No newline at end of file
@@ -1,6 +1,11 @@
 from abc import ABC, abstractmethod
+import base64
 from datetime import datetime
 from enum import Enum
+from functools import lru_cache
+import threading
+import time
+import unicodedata
 
 # Enum para tipos de usuário (usar para dashboards e permissões dps)
 class UserRole(Enum):
@@ -24,8 +29,211 @@ class LeadSource(Enum):
     EVENTO = "Evento"
     OUTRO = "Outro"
 
+class ActivityType(Enum):
+    CHAMADA = "chamada"
+    EMAIL = "email"
+    REUNIAO = "reunião"
+    CADASTRO = "cadastro"
+    OUTRO = "outro"
+    TAREFA_CONCLUIDA = "tarefa_concluida"
+    STAGE_CHANGE = "stage_change"
+
+def _chave(text): #"Venda Fechada", "venda fechada " e "Venda fechada" viram a mesma chave
+    sem_acento = unicodedata.normalize("NFD", text).encode("ascii", "ignore").decode("ascii")
+    return sem_acento.strip().casefold()
+
+# Estágio, fonte e tipo de atividade ficam nos objetos como códigos inteiros pequenos
+# (o índice do valor no enum): comparar e agrupar vira operação com int, e a normalização
+# do texto acontece uma vez só, na entrada. Valores fora do enum (dados antigos, API)
+# ganham um código novo na primeira vez que aparecem, para não perder nada ao salvar.
+class CodeTable:
+    def __init__(self, enum_cls):
+        self.enum_cls = enum_cls
+        self._names = [member.value for member in enum_cls]
+        self._codes = {} #texto (como veio e normalizado) -> código
+        for code, member in enumerate(enum_cls):
+            self._codes[member] = code
+            self._codes[member.value] = code
+            self._codes[_chave(member.value)] = code
+        self._lock = threading.Lock()
+
+    def find(self, value): #código do valor (texto ou membro do enum), ou None se ele não for conhecido
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes.get(_chave(value))
+            if code is not None:
+                self._codes[value] = code #a próxima vez com a mesma grafia nem normaliza
+        return code
+
+    def code(self, value): #como o find, mas registra valores novos
+        code = self.find(value)
+        if code is None:
+            with self._lock:
+                code = self.find(value)
+                if code is None:
+                    code = len(self._names)
+                    self._names.append(value.strip())
+                    self._codes[value] = code
+                    self._codes[_chave(value)] = code
+        return code
+
+    def name(self, code):
+        return self._names[code]
+
+    def standard_codes(self): #só os do enum, na ordem dele
+        return range(len(self.enum_cls))
+
+    def __len__(self): #quantidade de códigos (os do enum e os registrados depois)
+        return len(self._names)
+
+SALES_STAGES = CodeTable(SalesStage)
+LEAD_SOURCES = CodeTable(LeadSource)
+ACTIVITY_TYPES = CodeTable(ActivityType)
+
+# IDs baseados no tempo (ms), mas nunca repetidos: dois registros criados no mesmo
+# milissegundo (ex: vários POST seguidos na API) recebiam o mesmo id
+_ultimo_id = 0
+_id_lock = threading.Lock()
+
+def gerar_id():
+    global _ultimo_id
+    with _id_lock:
+        _ultimo_id = max(int(time.time() * 1000), _ultimo_id + 1)
+        return _ultimo_id
+
+def reservar_id(maior_id):
+    #depois de carregar os dados: uma rajada de criações deixa ids à frente do relógio,
+    #e sem isso o próximo processo geraria de novo ids que já existem
+    global _ultimo_id
+    with _id_lock:
+        _ultimo_id = max(_ultimo_id, maior_id)
+
+# Datas ficam nos objetos como timestamp (segundos desde 1970, int): filtrar por período e
+# ordenar vira comparação de números. O to_dict grava o próprio timestamp (o texto perdia a hora
+# e dependia do fuso da máquina); o texto "dd/mm/aaaa" só é montado para as telas e a API e
+# continua sendo lido na entrada (arquivos antigos). Os dois lados usam cache, porque numa base
+# grande as datas se repetem muito.
+DATE_FORMAT = "%d/%m/%Y"
+DATETIME_FORMAT = "%d/%m/%Y %H:%M"
+_FORMATOS_ACEITOS = (DATETIME_FORMAT, DATE_FORMAT, "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d")
+
+def now_ts():
+    return int(time.time())
+
+@lru_cache(maxsize=1 << 16)
+def parse_timestamp(text): #None se o texto não for uma data conhecida
+    text = text.strip()
+    if text.lstrip("-").isdigit(): #o próprio timestamp como texto (colunas TEXT do SQLite)
+        return int(text)
+    for fmt in _FORMATOS_ACEITOS:
+        try:
+            return int(datetime.strptime(text, fmt).timestamp())
+        except ValueError:
+            continue
+    return None
+
+def to_timestamp(value): #aceita timestamp, texto ou None (agora)
+    if isinstance(value, str):
+        return parse_timestamp(value)
+    if value is None:
+        return now_ts()
+    return int(value)
+
+def dump_timestamp(ts): #valor do to_dict: data desconhecida vira "" (None no from_dict seria "agora")
+    return "" if ts is None else ts
+
+@lru_cache(maxsize=1 << 16)
+def format_timestamp(ts, fmt=DATE_FORMAT):
+    if ts is None:
+        return ""
+    return datetime.fromtimestamp(ts).strftime(fmt)
+
+# Conjuntos grandes de ids (ex: quem já recebeu uma campanha) são gravados compactos: ordenados,
+# como diferença para o anterior em varint (1 a 3 bytes em vez de ~15 caracteres no JSON) e em base64
+def pack_ids(ids):
+    out = bytearray()
+    anterior = 0
+    for obj_id in sorted(ids):
+        delta = obj_id - anterior
+        anterior = obj_id
+        while delta >= 0x80:
+            out.append((delta & 0x7F) | 0x80)
+            delta >>= 7
+        out.append(delta)
+    return base64.b64encode(bytes(out)).decode("ascii")
+
+def unpack_ids(text):
+    ids = []
+    anterior = valor = shift = 0
+    for byte in base64.b64decode(text or ""):
+        valor |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        anterior += valor
+        ids.append(anterior)
+        valor = shift = 0
+    return ids
+
+# Lista de objetos filhos (atividades, tarefas, documentos) que só é montada no primeiro acesso.
+# Ao carregar uma base grande, os dicts crus ficam guardados e, se ninguém abrir o histórico
+# do contato, voltam direto para o to_dict() sem nunca virar objeto.
+# A classe dona precisa ter os slots "_<nome>" e "_raw_<nome>" (ex: _activities e _raw_activities).
+# Campos listados em item_cls.CAMPOS_TIMESTAMP que ainda estiverem como texto (arquivos antigos)
+# viram timestamp no to_dicts, sem montar os objetos.
+class LazyList:
+    def __init__(self, item_cls):
+        self.item_cls = item_cls
+
+    def __set_name__(self, owner, name):
+        self.attr = "_" + name
+        self.raw_attr = "_raw_" + name
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        items = getattr(obj, self.attr)
+        if items is None:
+            items = [self.item_cls.from_dict(d) for d in getattr(obj, self.raw_attr)]
+            setattr(obj, self.attr, items)
+            setattr(obj, self.raw_attr, None)
+        return items
+
+    def __set__(self, obj, value):
+        setattr(obj, self.attr, value)
+        setattr(obj, self.raw_attr, None)
+
+    def load_raw(self, obj, dicts): #usado pelo from_dict
+        setattr(obj, self.attr, None)
+        setattr(obj, self.raw_attr, dicts)
+
+    def values(self, obj, field): #um campo de cada item, sem montar os objetos se ainda estiverem crus
+        items = getattr(obj, self.attr)
+        if items is None:
+            return [d.get(field) for d in getattr(obj, self.raw_attr)]
+        return [getattr(item, field) for item in items]
+
+    def is_loaded(self, obj):
+        return getattr(obj, self.attr) is not None
+
+    def to_dicts(self, obj):
+        items = getattr(obj, self.attr)
+        if items is None:
+            raw = getattr(obj, self.raw_attr)
+            for campo in getattr(self.item_cls, "CAMPOS_TIMESTAMP", ()):
+                for d in raw:
+                    valor = d.get(campo)
+                    if isinstance(valor, str) and parse_timestamp(valor) is not None:
+                        d[campo] = parse_timestamp(valor)
+            return raw
+        return [item.to_dict() for item in items]
+
 # Classe abstrata base para entidades que podem ser persistidas
+# As classes de modelo usam __slots__: sem o __dict__ de cada instância, um contato com
+# centenas de atividades ocupa bem menos memória (ver benchmarks/bench_memoria.py)
 class Serializavel(ABC):
+    __slots__ = ()
+
     @abstractmethod
     def to_dict(self):
         pass
@@ -37,10 +245,16 @@ class Serializavel(ABC):
 
 # Classe base para pessoas (implementando herança)
 class Pessoa(Serializavel):
-    def __init__(self, name, email):
+    __slots__ = ("_name", "_email", "created_ts")
+
+    def __init__(self, name, email, created_at=None):
         self._name = name  # Atributo privado para melhor encapsulamento
         self._email = email
-        self._created_at = datetime.now().strftime("%d/%m/%Y")
+        self.created_ts = to_timestamp(created_at) #o from_dict passa a data do arquivo: nada de now() à toa
+    
+    @property
+    def created_at(self):
+        return format_timestamp(self.created_ts)
     
     # Properties para encapsulamento
     @property
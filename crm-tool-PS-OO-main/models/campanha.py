@@ -1,15 +1,90 @@
-from datetime import datetime
-import time
-from .base import Serializavel
+from .base import Serializavel, gerar_id, dump_timestamp, format_timestamp, to_timestamp, pack_ids, unpack_ids
 
+# Estado de entrega por destinatário: na fila (do envio em andamento), enviado ou com falha.
+# Os ids ficam em sets na memória e vão compactos para o arquivo (pack_ids), em vez da lista
+# sent_to que crescia a cada envio. Durante um envio o progresso é gravado a cada lote como um
+# checkpoint pequeno (só os ids do lote); se o processo cair, o próximo envio continua da fila.
+# O agendamento (próximo horário, repetição e resultado do último envio) fica junto da campanha
+# para sobreviver a um reinício: na carga o CRM devolve as campanhas agendadas para o agendador.
 class EmailCampanha(Serializavel):
-    def __init__(self, title, description, target_stage, id=None):
-        self.id = id if id is not None else int(time.time() * 1000)
+    __slots__ = ("id", "title", "description", "target_stage", "enviados", "falhas", "fila", "created_ts",
+                 "agendada_ts", "repetir_min", "status_agendamento", "ultimo_envio")
+
+    def __init__(self, title, description, target_stage, id=None, created_at=None):
+        self.id = id if id is not None else gerar_id()
         self.title = title
         self.description = description
         self.target_stage = target_stage
-        self.sent_to = []
-        self.created_at = datetime.now().strftime("%d/%m/%Y")
+        self.enviados = set()
+        self.falhas = {} #id do contato -> último erro
+        self.fila = set() #destinatários do envio em andamento que ainda não foram processados
+        self.created_ts = to_timestamp(created_at)
+        self.agendada_ts = None #próximo envio automático (timestamp), ou None
+        self.repetir_min = None #envio recorrente: minutos entre um envio e o próximo
+        self.status_agendamento = None #None, "agendada", "enviando", "concluida", "cancelada" ou "erro"
+        self.ultimo_envio = None #resumo do último envio agendado
+
+    @property
+    def created_at(self):
+        return format_timestamp(self.created_ts)
+
+    @property
+    def sent_to(self): #compatibilidade: ids de quem já recebeu
+        return sorted(self.enviados)
+
+    @sent_to.setter
+    def sent_to(self, ids):
+        self.enviados = set(ids)
+
+    #--- envio com checkpoint ---
+    @property
+    def em_andamento(self):
+        return bool(self.fila)
+
+    def start_send(self, ids):
+        self.fila = set(ids)
+
+    def record_batch(self, enviados, falhas): #falhas: {id: erro}; retorna o checkpoint do lote para gravar
+        self.enviados.update(enviados)
+        self.fila.difference_update(enviados)
+        for obj_id in enviados:
+            self.falhas.pop(obj_id, None)
+        self.falhas.update(falhas)
+        self.fila.difference_update(falhas)
+        return {"campanha_id": self.id, "enviados": pack_ids(enviados),
+                "falhas": [[obj_id, erro] for obj_id, erro in falhas.items()]}
+
+    def apply_checkpoint(self, checkpoint): #na carga: reaplica o progresso gravado depois do snapshot
+        self.record_batch(unpack_ids(checkpoint.get("enviados")),
+                          {obj_id: erro for obj_id, erro in checkpoint.get("falhas", [])})
+
+    def finish_send(self):
+        self.fila = set()
+
+    def delivery_status(self):
+        return {"enviados": len(self.enviados), "falhas": len(self.falhas), "na_fila": len(self.fila)}
+
+    #--- agendamento ---
+    def schedule(self, quando_ts, repetir_min=None):
+        self.agendada_ts = quando_ts
+        self.repetir_min = repetir_min or None
+        self.status_agendamento = "agendada"
+
+    def cancel_schedule(self):
+        self.agendada_ts = None
+        self.repetir_min = None
+        self.status_agendamento = "cancelada"
+
+    def next_schedule(self, agora): #depois de um envio: próximo horário da recorrência (sem acumular atrasos)
+        if not self.repetir_min:
+            self.agendada_ts = None
+            return None
+        passo = self.repetir_min * 60
+        proximo = (self.agendada_ts or agora) + passo
+        if proximo <= agora:
+            proximo += ((agora - proximo) // passo + 1) * passo
+        self.agendada_ts = proximo
+        return proximo
 
     def to_dict(self):
         return {
@@ -17,13 +92,34 @@ class EmailCampanha(Serializavel):
             "title": self.title,
             "description": self.description,
             "target_stage": self.target_stage,
-            "sent_to": self.sent_to,
-            "created_at": self.created_at
+            "entregas": {
+                "enviados": pack_ids(self.enviados),
+                "falhas": [[obj_id, erro] for obj_id, erro in self.falhas.items()],
+                "fila": pack_ids(self.fila)
+            },
+            "agendamento": {
+                "proximo_ts": self.agendada_ts,
+                "repetir_min": self.repetir_min,
+                "status": self.status_agendamento,
+                "ultimo_envio": self.ultimo_envio
+            },
+            "created_at": dump_timestamp(self.created_ts)
         }
 
     @classmethod
     def from_dict(cls, data):
-        camp = cls(data["title"], data["description"], data["target_stage"], id=data.get("id"))
-        camp.sent_to = data.get("sent_to", [])
-        camp.created_at = data.get("created_at", datetime.now().strftime("%d/%m/%Y"))
-        return camp
\ No newline at end of file
+        camp = cls(data["title"], data["description"], data["target_stage"], id=data.get("id"),
+                   created_at=data.get("created_at"))
+        entregas = data.get("entregas")
+        if entregas is not None:
+            camp.enviados = set(unpack_ids(entregas.get("enviados")))
+            camp.falhas = {obj_id: erro for obj_id, erro in entregas.get("falhas", [])}
+            camp.fila = set(unpack_ids(entregas.get("fila")))
+        else: #arquivos antigos: lista sent_to
+            camp.enviados = set(data.get("sent_to", []))
+        agendamento = data.get("agendamento") or {}
+        camp.agendada_ts = agendamento.get("proximo_ts")
+        camp.repetir_min = agendamento.get("repetir_min")
+        camp.status_agendamento = agendamento.get("status")
+        camp.ultimo_envio = agendamento.get("ultimo_envio")
+        return camp
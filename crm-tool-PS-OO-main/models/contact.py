@@ -1,23 +1,54 @@
-from datetime import datetime
-import time
-from .base import Pessoa, SalesStage
+from .base import Pessoa, SalesStage, LazyList, gerar_id, dump_timestamp, SALES_STAGES, LEAD_SOURCES, LeadSource
 from .atividade import Atividade
 from .task import Task
 from .document import Document
 
 class Contato(Pessoa):  # Herda de Pessoa
-    def __init__(self, name, email, telefone, empresa="", notas="", id=None):
-        super().__init__(name, email)  # Chama construtor da classe pai
-        self.id = id if id is not None else int(time.time() * 1000) #Se um ID for fornecido, usa. Senão, cria um novo baseado no tempo.
+    __slots__ = ("id", "telefone", "empresa", "notas", "stage_code", "_stage_history",
+                 "_activities", "_raw_activities", "_tasks", "_raw_tasks", "_documents", "_raw_documents")
+
+    #históricos montados só quando alguém acessa (ver LazyList)
+    activities = LazyList(Atividade)
+    tasks = LazyList(Task)
+    documents = LazyList(Document)
+
+    def __init__(self, name, email, telefone, empresa="", notas="", id=None, created_at=None):
+        super().__init__(name, email, created_at)  # Chama construtor da classe pai
+        self.id = id if id is not None else gerar_id() #Se um ID for fornecido, usa. Senão, cria um novo baseado no tempo.
         self.telefone = telefone
         self.empresa = empresa
         self.notas = notas
-        self.sales_stage = SalesStage.PROSPECTO.value
-        self.stage_history = [SalesStage.PROSPECTO.value]
+        self.stage_code = SALES_STAGES.code(SalesStage.PROSPECTO) #ver CodeTable em base.py
+        self._stage_history = [self.stage_code]
         self.activities = []
         self.tasks = []
         self.documents = []  # documentos
 
+    # estágio guardado como código inteiro; o texto só aparece na entrada e na saída
+    @property
+    def sales_stage(self):
+        return SALES_STAGES.name(self.stage_code)
+
+    @sales_stage.setter
+    def sales_stage(self, value):
+        self.stage_code = SALES_STAGES.code(value)
+
+    @property
+    def stage_history(self): #tupla: para registrar uma mudança use change_stage
+        return tuple(SALES_STAGES.name(code) for code in self._stage_history)
+
+    @stage_history.setter
+    def stage_history(self, values):
+        self._stage_history = [SALES_STAGES.code(v) for v in values]
+
+    @property
+    def stage_codes(self): #o histórico como códigos (para análises em lote); não altere a lista
+        return self._stage_history
+
+    def change_stage(self, stage):
+        self.stage_code = SALES_STAGES.code(stage)
+        self._stage_history.append(self.stage_code)
+
     def to_dict(self):
         return {
             "id": self.id,
@@ -27,24 +58,23 @@ class Contato(Pessoa):  # Herda de Pessoa
             "empresa": self.empresa,
             "notas": self.notas,
             "sales_stage": self.sales_stage,
-            "stage_history": self.stage_history,
-            "created_at": self._created_at,
-            "activities": [a.to_dict() for a in self.activities],
-            "tasks": [t.to_dict() for t in self.tasks],
-            "documents": [d.to_dict() for d in self.documents]
+            "stage_history": list(self.stage_history),
+            "created_at": dump_timestamp(self.created_ts), #o texto formatado só na tela e na API
+            "activities": Contato.activities.to_dicts(self),
+            "tasks": Contato.tasks.to_dicts(self),
+            "documents": Contato.documents.to_dicts(self)
         }
 
     @classmethod
     def from_dict(cls, data):
         c = cls(data["name"], data["email"], data["telefone"], 
-                data.get("empresa", ""), data.get("notas", ""), id=data.get("id"))
+                data.get("empresa", ""), data.get("notas", ""), id=data.get("id"), created_at=data.get("created_at"))
         #c.id = data["id"] tirei isso e coloquei direto no construtor
         c.sales_stage = data.get("sales_stage", "Lead")
         c.stage_history = data.get("stage_history", ["Lead"])
-        c._created_at = data.get("created_at", datetime.now().strftime("%d/%m/%Y"))
-        c.activities = [Atividade.from_dict(a) for a in data.get("activities", [])]
-        c.tasks = [Task.from_dict(t) for t in data.get("tasks", [])]
-        c.documents = [Document.from_dict(d) for d in data.get("documents", [])]
+        cls.activities.load_raw(c, data.get("activities", []))
+        cls.tasks.load_raw(c, data.get("tasks", []))
+        cls.documents.load_raw(c, data.get("documents", []))
         return c
 
     def add_document(self, title, file_path, doc_type="general"):
@@ -53,23 +83,34 @@ class Contato(Pessoa):  # Herda de Pessoa
         self.documents.append(doc)
 
 class Lead(Pessoa):  # Herda de Pessoa
-    def __init__(self, name, email, source="Website", id=None):
-        super().__init__(name, email)
-        self.id = id if id is not None else int(time.time() * 1000)
+    __slots__ = ("id", "source_code", "score", "converted")
+
+    def __init__(self, name, email, source="Website", id=None, created_at=None):
+        super().__init__(name, email, created_at)
+        self.id = id if id is not None else gerar_id()
         self.source = source
         self.score = 0
         self.converted = False
         self._calculate_initial_score() #aqui pra chamar logo no inicio
-        
+
+    _SCORE_MAP = {
+        LEAD_SOURCES.code(LeadSource.INDICACAO): 50,
+        LEAD_SOURCES.code(LeadSource.EVENTO): 30,
+        LEAD_SOURCES.code(LeadSource.WEBSITE): 10,
+        LEAD_SOURCES.code(LeadSource.REDES_SOCIAIS): 5,
+        LEAD_SOURCES.code(LeadSource.OUTRO): 0
+    }
+
+    @property
+    def source(self):
+        return LEAD_SOURCES.name(self.source_code)
+
+    @source.setter
+    def source(self, value):
+        self.source_code = LEAD_SOURCES.code(value)
+
     def _calculate_initial_score(self):
-        score_map = {
-            "Indicação": 50,  
-            "Evento": 30,
-            "Website": 10,
-            "Redes Sociais": 5, 
-            "Outro": 0
-        }
-        self.score = score_map.get(self.source.title(), 0)
+        self.score = self._SCORE_MAP.get(self.source_code, 0)
     
     def to_dict(self):
         return {
@@ -77,15 +118,15 @@ class Lead(Pessoa):  # Herda de Pessoa
             "name": self._name,
             "email": self._email,
             "source": self.source,
-            "created_at": self._created_at,
+            "created_at": dump_timestamp(self.created_ts), #o texto formatado só na tela e na API
             "score": self.score,
             "converted": self.converted
         }
 
     @classmethod
     def from_dict(cls, data):
-        lead = cls(data["name"], data["email"], data.get("source", "Website"), id=data.get("id"))
-        lead._created_at = data.get("created_at", datetime.now().strftime("%d/%m/%Y"))
+        lead = cls(data["name"], data["email"], data.get("source", "Website"), id=data.get("id"),
+                   created_at=data.get("created_at"))
         lead.score = data.get("score", 0)
         lead.converted = data.get("converted", False)
         return lead
\ No newline at end of file
@@ -1,27 +1,32 @@
-from datetime import datetime
-from .base import Serializavel
+from .base import Serializavel, dump_timestamp, format_timestamp, to_timestamp
 
 # classe para gerenciamento de documentos
 class Document(Serializavel):
-    def __init__(self, title, file_path, doc_type="general"):
+    __slots__ = ("title", "file_path", "doc_type", "created_ts", "size")
+    CAMPOS_TIMESTAMP = ("created_at",) #ver LazyList
+
+    def __init__(self, title, file_path, doc_type="general", created_at=None):
         self.title = title
         self.file_path = file_path
         self.doc_type = doc_type  # proposta, contrato, outros
-        self.created_at = datetime.now().strftime("%d/%m/%Y")
+        self.created_ts = to_timestamp(created_at)
         self.size = "N/A"  # calcular tamanho real do arquivo?
 
+    @property
+    def created_at(self):
+        return format_timestamp(self.created_ts)
+
     def to_dict(self):
         return {
             "title": self.title,
             "file_path": self.file_path,
             "doc_type": self.doc_type,
-            "created_at": self.created_at,
+            "created_at": dump_timestamp(self.created_ts),
             "size": self.size
         }
 
     @classmethod
     def from_dict(cls, data):
-        doc = cls(data["title"], data["file_path"], data.get("doc_type", "general"))
-        doc.created_at = data.get("created_at", datetime.now().strftime("%d/%m/%Y"))
+        doc = cls(data["title"], data["file_path"], data.get("doc_type", "general"), data.get("created_at"))
         doc.size = data.get("size", "N/A")
         return doc
\ No newline at end of file
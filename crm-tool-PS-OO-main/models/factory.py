@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from .base import LeadSource
+from .base import LeadSource, LEAD_SOURCES
 
 class PessoaFactory(ABC): 
     @abstractmethod
@@ -41,7 +41,7 @@ class LeadFactory(PessoaFactory):
         source = kwargs.get('source', 'Website')
         
         valid_sources = [s.value for s in LeadSource]
-        if source not in valid_sources:
+        if LEAD_SOURCES.find(source) not in LEAD_SOURCES.standard_codes(): #aceita "indicacao", "Redes sociais"...
             raise ValueError(f"Fonte inválida :( Use: {valid_sources}")
         return Lead(
             name=kwargs['name'],
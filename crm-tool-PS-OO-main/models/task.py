@@ -1,6 +1,8 @@
 from .base import Serializavel
 
 class Task(Serializavel):
+    __slots__ = ("title", "date", "completed")
+
     def __init__(self, title, date):
         self.title = title
         self.date = date